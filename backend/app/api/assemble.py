@@ -1,16 +1,26 @@
 import asyncio
 import logging
+import time
 import uuid
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
+from app.models.batch import Batch
 from app.models.job import Job
-from app.schemas.assemble import AssembleRequest, AssembleResponse, JobStatusResponse
+from app.schemas.assemble import (
+    AssembleRequest, AssembleResponse, BatchRequest, BatchResponse, BatchStatusResponse,
+    JobStatusResponse, RenderPlanResponse,
+)
+from app.services.assembler import resolve_quality
 from app.services.job_logger import subscribe, unsubscribe, format_sse
+from app.services.job_state import JobState, job_states
+from app.services.preflight import run_preflight
+from app.services.render_plan import compile_plan
+from app.workers.batch import run_batch
 from app.workers.pipeline import run_assembly
 
 logger = logging.getLogger("uvicorn.error")
@@ -25,39 +35,138 @@ async def assemble(
     db: AsyncSession = Depends(get_db),
 ):
     """Reçoit un JSON de montage et lance l'assemblage en tâche de fond."""
+    submitted_at = time.monotonic()
+    report = None
+    if data.preflight:
+        report = (await run_preflight(data)).to_dict()
+        if not report["ok"] and data.preflight == "reject":
+            raise HTTPException(status_code=422, detail=report)
+
     job_id = str(uuid.uuid4())
 
-    job = Job(id=job_id, status="processing")
+    job = Job(id=job_id, status="processing", preflight=report)
     db.add(job)
     await db.commit()
+    job_states.put(JobState.from_row(job))
 
     logger.info(f"Job {job_id} created — hotel_id={data.hotel_id}, {len(data.clips)} clips, launching pipeline")
-    background_tasks.add_task(run_assembly, job_id, data)
+    background_tasks.add_task(run_assembly, job_id, data, submitted_at=submitted_at)
 
-    return AssembleResponse(job_id=job_id, status="processing")
+    return AssembleResponse(job_id=job_id, status="processing", preflight=report)
 
 
-@router.get("/jobs/{job_id}/status", response_model=JobStatusResponse)
-async def job_status(job_id: str, db: AsyncSession = Depends(get_db)):
-    """Retourne le statut d'un job."""
+@router.post("/assemble/plan", response_model=RenderPlanResponse)
+async def assemble_plan(data: AssembleRequest):
+    """Compile le plan de rendu (DAG, clés de cache, coût CPU estimé) sans rien exécuter."""
+    request, vc = resolve_quality(data)
+    return compile_plan(request, vc).to_dict()
+
+
+@router.post("/assemble/batch", response_model=BatchResponse, status_code=202)
+async def assemble_batch(
+    data: BatchRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+):
+    """Reçoit plusieurs montages partageant des assets et les assemble ensemble en tâche de fond."""
+    submitted_at = time.monotonic()
+    batch_id = str(uuid.uuid4())
+    jobs = [(str(uuid.uuid4()), request) for request in data.jobs]
+
+    db.add(Batch(id=batch_id, status="processing", total=len(jobs), webhook_url=data.webhook_url))
+    rows = [Job(id=job_id, status="processing", batch_id=batch_id) for job_id, _ in jobs]
+    db.add_all(rows)
+    await db.commit()
+    for row in rows:
+        job_states.put(JobState.from_row(row))
+
+    logger.info(f"Batch {batch_id} created — {len(jobs)} jobs, launching pipeline")
+    background_tasks.add_task(run_batch, batch_id, jobs, data.max_concurrent, data.webhook_url,
+                              submitted_at=submitted_at)
+
+    return BatchResponse(batch_id=batch_id, job_ids=[job_id for job_id, _ in jobs], status="processing")
+
+
+@router.post("/jobs/{job_id}/finalize", response_model=AssembleResponse, status_code=202)
+async def finalize(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+):
+    """Relance en qualité finale un job draft terminé, à partir de son plan de rendu."""
+    submitted_at = time.monotonic()
     result = await db.execute(select(Job).where(Job.id == job_id))
-    job = result.scalar_one_or_none()
-    if not job:
+    draft_job = result.scalar_one_or_none()
+    if not draft_job:
         raise HTTPException(status_code=404, detail="Job not found")
+    plan = draft_job.render_plan
+    if draft_job.status != "completed" or not plan or plan["request"].get("quality") != "draft":
+        raise HTTPException(status_code=409, detail="Job is not a completed draft")
+
+    data = AssembleRequest.model_validate({**plan["request"], "quality": "final"})
+    final_id = str(uuid.uuid4())
+    final_job = Job(id=final_id, status="processing")
+    db.add(final_job)
+    await db.commit()
+    job_states.put(JobState.from_row(final_job))
+
+    logger.info(f"Job {final_id} created — finalize of draft {job_id}, hotel_id={data.hotel_id}")
+    background_tasks.add_task(run_assembly, final_id, data, submitted_at=submitted_at)
 
+    return AssembleResponse(job_id=final_id, status="processing")
+
+
+def _job_status(job: JobState) -> JobStatusResponse:
     return JobStatusResponse(
         job_id=job.id,
         status=job.status,
+        stage=job.stage,
         output_url=job.output_url,
+        renditions=job.renditions,
+        playlist_url=job.playlist_url,
+        previews=job.previews,
+        encoder_policy=job.encoder_policy,
         error_message=job.error_message,
+        updated_at=job.updated_at,
+    )
+
+
+@router.get("/jobs/{job_id}/status", response_model=JobStatusResponse)
+async def job_status(job_id: str, request: Request, response: Response):
+    """Retourne le statut d'un job (servi depuis la mémoire ; 304 si If-None-Match correspond)."""
+    job = await job_states.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if request.headers.get("if-none-match") == job.etag:
+        return Response(status_code=304, headers={"ETag": job.etag})
+    response.headers["ETag"] = job.etag
+    return _job_status(job)
+
+
+@router.get("/batches/{batch_id}/status", response_model=BatchStatusResponse)
+async def batch_status(batch_id: str, db: AsyncSession = Depends(get_db)):
+    """Retourne l'avancement d'un batch et le statut de chacun de ses jobs."""
+    result = await db.execute(select(Batch).where(Batch.id == batch_id))
+    batch = result.scalar_one_or_none()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    result = await db.execute(select(Job).where(Job.batch_id == batch_id).order_by(Job.created_at))
+    return BatchStatusResponse(
+        batch_id=batch.id,
+        status=batch.status,
+        total=batch.total,
+        completed=batch.completed,
+        failed=batch.failed,
+        jobs=[_job_status(job_states.peek(job.id) or JobState.from_row(job)) for job in result.scalars()],
     )
 
 
 @router.get("/jobs/{job_id}/logs")
-async def stream_logs(job_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+async def stream_logs(job_id: str, request: Request):
     """Stream SSE des logs du pipeline en temps réel."""
-    result = await db.execute(select(Job).where(Job.id == job_id))
-    if not result.scalar_one_or_none():
+    if not await job_states.get(job_id):
         raise HTTPException(status_code=404, detail="Job not found")
 
     queue = subscribe(job_id)
@@ -7,6 +7,26 @@ class Settings(BaseSettings):
     API_PORT: int = 8000
     API_KEY: str = ""
     DATABASE_URL: str = "sqlite+aiosqlite:///./data/app.db"
+    CACHE_DIR: str = "data/cache"
+    CACHE_MAX_BYTES: int = 20 * 1024**3
+    # Délai pendant lequel un téléchargement en cache est réutilisé sans revalidation HTTP
+    DOWNLOAD_REVALIDATE_SECONDS: float = 60
+    # Encodage découpé des sorties longues (0 = désactivé ; ENCODE_WORKERS 0 = auto)
+    CHUNKED_ENCODE_MIN_SECONDS: float = 90
+    CHUNK_SECONDS: float = 20
+    ENCODE_WORKERS: int = 0
+    # Budget disque des dossiers de travail (0 = tout l'espace libre) ; tier tmpfs désactivé si vide
+    SCRATCH_MAX_BYTES: int = 0
+    SCRATCH_MIN_FREE_BYTES: int = 2 * 1024**3
+    SCRATCH_TMPFS_DIR: str = ""
+    SCRATCH_TMPFS_MAX_BYTES: int = 1024**3
+    # Mode streaming : téléchargements et concat passés à FFmpeg par pipes / FIFO (NUT)
+    STREAMING_PIPELINE: bool = False
+    # État des jobs en mémoire : nombre de jobs gardés, délai max d'écriture groupée en DB
+    JOB_STATE_CACHE_SIZE: int = 10000
+    JOB_STATE_FLUSH_SECONDS: float = 1.0
+    # Rendus simultanés d'un batch
+    BATCH_MAX_CONCURRENT: int = 2
 
     SUPABASE_URL: str = ""
     SUPABASE_SERVICE_KEY: str = ""
@@ -1,6 +1,8 @@
+from sqlalchemy import Connection, inspect, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 
 from app.config import settings
+from app.models.base import Base
 
 engine = create_async_engine(settings.DATABASE_URL, echo=True)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -9,3 +11,41 @@ async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit
 async def get_db():
     async with async_session() as session:
         yield session
+
+
+def schema_is_current(conn: Connection) -> bool:
+    """Vrai si toutes les tables et colonnes déclarées dans les modèles existent déjà.
+
+    Une seule passe d'inspection : au redémarrage d'une base à jour, ni
+    create_all ni add_missing_columns n'ont besoin de tourner.
+    """
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            return False
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        if any(column.name not in existing for column in table.columns):
+            return False
+    return True
+
+
+def add_missing_columns(conn: Connection) -> list[str]:
+    """Ajoute aux tables existantes les colonnes (nullables) déclarées dans les modèles.
+
+    create_all ne modifie jamais une table existante : sans cela, une base créée
+    avant l'ajout d'une colonne ferait échouer toutes les requêtes sur la table.
+    """
+    inspector = inspect(conn)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            added.append(f"{table.name}.{column.name}")
+    return added
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from pathlib import Path
@@ -5,12 +6,13 @@ from pathlib import Path
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from sqlalchemy import text
 
 from app.api.router import api_router
 from app.config import settings
-from app.database import engine
+from app.database import add_missing_columns, engine, schema_is_current
 from app.models.base import Base
+from app.services.capabilities import OPTIONAL_FILTERS, load_capabilities
+from app.services.job_state import job_states
 
 logger = logging.getLogger("uvicorn.error")
 
@@ -22,15 +24,30 @@ async def lifespan(app: FastAPI):
         logger.info(f"Directory ensured: {d}/")
 
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    logger.info("Database tables created")
-
-    async with engine.connect() as conn:
-        result = await conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'"))
-        tables = [row[0] for row in result]
-        logger.info(f"Tables: {tables}")
+        if await conn.run_sync(schema_is_current):
+            logger.info("Database schema up to date")
+        else:
+            await conn.run_sync(Base.metadata.create_all)
+            added = await conn.run_sync(add_missing_columns)
+            logger.info("Database tables created")
+            if added:
+                logger.info(f"Columns added: {added}")
+    logger.info(f"Tables: {list(Base.metadata.tables)}")
+
+    caps = await asyncio.to_thread(load_capabilities)
+    if caps:
+        logger.info(f"FFmpeg: {caps.version}")
+        if caps.missing():
+            logger.error(f"FFmpeg missing required filters/encoders: {caps.missing()}")
+        optional = [f for f in OPTIONAL_FILTERS if not caps.has_filter(f)]
+        if optional:
+            logger.warning(f"FFmpeg missing optional filters: {optional}")
+        if caps.x264_effective_cores:
+            logger.info(f"x264 ({caps.x264_mpixels_single} MP/s per thread, "
+                        f"{caps.x264_effective_cores:.1f} effective cores per process)")
 
     yield
+    await job_states.close()
     await engine.dispose()
 
 
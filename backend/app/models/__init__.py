@@ -1,4 +1,5 @@
 from app.models.base import Base
+from app.models.batch import Batch
 from app.models.job import Job
 
-__all__ = ["Base", "Job"]
+__all__ = ["Base", "Batch", "Job"]
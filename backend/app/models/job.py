@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import String, DateTime, Text
+from sqlalchemy import JSON, String, DateTime, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base
@@ -11,7 +11,14 @@ class Job(Base):
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     status: Mapped[str] = mapped_column(String(20), default="processing")
+    batch_id: Mapped[str | None] = mapped_column(String(36), nullable=True, index=True)
     output_url: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    renditions: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    playlist_url: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    previews: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    render_plan: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    preflight: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    encoder_policy: Mapped[dict | None] = mapped_column(JSON, nullable=True)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,10 +1,13 @@
+from datetime import datetime
+from typing import Literal
+
 from pydantic import BaseModel, Field, model_validator
 
 
 class Clip(BaseModel):
     index: int
     video_url: str
-    duree_secondes: float
+    duree_secondes: float = Field(gt=0)
 
 
 class VoiceoverSegment(BaseModel):
@@ -25,6 +28,9 @@ class AudioConfig(BaseModel):
     resample_rate: int = 44100
     output_codec: str = "aac"
     output_bitrate: str = "192k"
+    # Normalisation loudness par asset (None = désactivée, gains bruts)
+    target_lufs: float | None = None
+    target_true_peak: float = -1.0
 
 
 class VideoConfig(BaseModel):
@@ -37,6 +43,29 @@ class VideoConfig(BaseModel):
     movflags: str = "+faststart"
 
 
+class HlsConfig(BaseModel):
+    """Sortie HLS/CMAF (fMP4) publiée segment par segment pendant l'encodage."""
+    segment_seconds: int = Field(default=4, ge=1, le=30)
+
+
+class PreviewConfig(BaseModel):
+    """Poster + vignettes + planche de sprites (WebVTT) extraits du passage final."""
+    thumbnails: int = Field(default=10, ge=1, le=100)
+    thumbnail_width: int = Field(default=320, ge=16, le=1920)
+    sprite_columns: int = Field(default=5, ge=1, le=20)
+    poster_seconds: float | None = Field(default=None, ge=0)
+
+
+class Rendition(BaseModel):
+    """Sortie supplémentaire dérivée du même décodage (ex. 720p, vertical 9:16)."""
+    name: str = Field(pattern=r"^[a-z0-9_-]+$")
+    width: int = Field(gt=0, multiple_of=2)
+    height: int = Field(gt=0, multiple_of=2)
+    fit: Literal["pad", "crop"] = "pad"
+    preset: str | None = None
+    crf: int | None = None
+
+
 class AssembleRequest(BaseModel):
     hotel_id: str
     voiceover_url: str | None = None
@@ -45,6 +74,15 @@ class AssembleRequest(BaseModel):
     clips: list[Clip]
     audio_config: AudioConfig = AudioConfig()
     video_config: VideoConfig = VideoConfig()
+    renditions: list[Rendition] | None = None
+    hls: HlsConfig | None = None
+    previews: PreviewConfig | None = None
+    # draft : proxies basse résolution, à finaliser via POST /jobs/{job_id}/finalize
+    quality: Literal["final", "draft"] = "final"
+    # Pré-vol des URLs à la soumission : reject = 422 si invalide, annotate = rapport joint au job
+    preflight: Literal["reject", "annotate"] | None = None
+    # Échéance depuis la soumission : le preset peut être accéléré pour la tenir
+    deadline_seconds: float | None = Field(default=None, gt=0)
     webhook_url: str | None = None
 
     @model_validator(mode="after")
@@ -53,16 +91,69 @@ class AssembleRequest(BaseModel):
             self.voiceover_segments = None
         if self.voiceover_segments and not self.voiceover_url:
             raise ValueError("voiceover_url est requis quand voiceover_segments est fourni")
+        if self.renditions:
+            names = [r.name for r in self.renditions]
+            if len(set(names)) != len(names):
+                raise ValueError("les noms de renditions doivent être uniques")
         return self
 
 
+class BatchRequest(BaseModel):
+    jobs: list[AssembleRequest] = Field(min_length=1)
+    # Nombre de rendus simultanés (None = BATCH_MAX_CONCURRENT)
+    max_concurrent: int | None = Field(default=None, gt=0)
+    webhook_url: str | None = None
+
+
 class AssembleResponse(BaseModel):
     job_id: str
     status: str
+    preflight: dict | None = None
 
 
 class JobStatusResponse(BaseModel):
     job_id: str
     status: str
+    # Étape du pipeline en cours (prepare : clips et audio, concat, mux, upload)
+    stage: str | None = None
     output_url: str | None = None
+    renditions: dict[str, str] | None = None
+    playlist_url: str | None = None
+    previews: dict | None = None
+    encoder_policy: dict | None = None
     error_message: str | None = None
+    updated_at: datetime | None = None
+
+
+class BatchResponse(BaseModel):
+    batch_id: str
+    job_ids: list[str]
+    status: str
+
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    completed: int
+    failed: int
+    jobs: list[JobStatusResponse]
+
+
+class PlanNodeResponse(BaseModel):
+    id: str
+    kind: str
+    deps: list[str]
+    cache_key: str | None = None
+    cached: bool
+    cpu_seconds: float
+    detail: dict
+
+
+class RenderPlanResponse(BaseModel):
+    nodes: list[PlanNodeResponse]
+    total_duration: float
+    total_cpu_seconds: float
+    critical_path_seconds: float
+    estimated_wall_seconds: float
+    cached_nodes: int
@@ -1,312 +1,637 @@
-"""Assemblage vidéo via FFmpeg : download, speed adjust, concat, audio ducking."""
+"""Assemblage vidéo via FFmpeg : download, speed adjust, concat, audio ducking (NumPy)."""
 
+import asyncio
 import logging
-import subprocess
+import math
+import os
+import shutil
+from dataclasses import astuple, dataclass, field
 from pathlib import Path
 
-import httpx
-
-from app.schemas.assemble import AssembleRequest, AudioConfig, VideoConfig
+from app.config import settings
+from app.schemas.assemble import AssembleRequest, AudioConfig, Rendition, VideoConfig
+from app.services import capabilities
+from app.services.cache import cache_key, cache_path
+from app.services.chunked import encode_chunked, encode_workers, use_chunked
+from app.services.ducking import load_or_compute_envelope, mix_ducked
+from app.services.encoder_policy import EncoderPolicy, record_throughput
+from app.services.ffmpeg import (
+    decode_pcm, get_duration, run_ffmpeg, run_ffmpeg_async, start_ffmpeg, wait_ffmpeg,
+)
+from app.services.hls import HlsPublisher, hls_output_args
 from app.services.job_logger import emit
+from app.services.loudness import cached_loudness, normalization_gain
+from app.services.media_cache import (
+    CachedFile, cached_download, cached_duration, cached_ffmpeg_output, lookup_output,
+    store_ffmpeg_output,
+)
+from app.services.metrics import stage
+from app.services.previews import (
+    VTT_NAME, PreviewPlan, collect_previews, plan_previews, preview_graph, write_vtt,
+)
+from app.services.render_diff import (
+    RenderManifest, diff_clips, load_previous, reuse_summary, store_manifest,
+)
+from app.services.render_plan import (
+    PlanNode, acceptable_clip_keys, audio_cache_key, compile_plan, download_node_id, execute_plan,
+    normalized_clip_key, timeline_seconds,
+)
+from app.services.streaming import PIPE_FORMAT, StdinFanout, make_fifo, pipe_concat
+from app.services.timeline import compile_timeline, render_stem
 
 logger = logging.getLogger("uvicorn.error")
 
+# Proxies du mode draft
+DRAFT_WIDTH = 640
+DRAFT_CRF = 30
 
-async def download_file(url: str, dest: Path) -> Path:
-    """Télécharge un fichier en streaming depuis une URL vers le chemin local."""
-    async with httpx.AsyncClient(timeout=120, follow_redirects=True, verify=False) as client:
-        async with client.stream("GET", url) as resp:
-            resp.raise_for_status()
-            with open(dest, "wb") as f:
-                async for chunk in resp.aiter_bytes(chunk_size=65536):
-                    f.write(chunk)
-    return dest
+# Téléchargements simultanés par job
+MAX_PARALLEL_DOWNLOADS = 4
 
+# GOP fixe des renditions encodées par chunks (bornes de chunk = keyframes)
+RENDITION_GOP_SECONDS = 2
 
-def run_ffmpeg(args: list[str], desc: str = "") -> None:
-    """Exécute une commande FFmpeg et lève une exception en cas d'erreur."""
-    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + args
-    logger.info(f"FFmpeg {desc}: {' '.join(cmd)}")
-    result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
-    if result.returncode != 0:
-        raise RuntimeError(f"FFmpeg error ({desc}): {result.stderr.strip()}")
 
+@dataclass
+class AssemblyResult:
+    """Fichiers produits par le passage final."""
+    output_path: Path
+    renditions: dict[str, Path] = field(default_factory=dict)
+    hls_dir: Path | None = None
+    previews: dict[str, Path | list[Path]] = field(default_factory=dict)
+    render_plan: dict | None = None
 
-def get_duration(file_path: Path) -> float:
-    """Retourne la durée d'un fichier média en secondes."""
-    result = subprocess.run(
-        ["ffprobe", "-v", "quiet", "-show_entries", "format=duration",
-         "-of", "default=noprint_wrappers=1:nokey=1", str(file_path)],
-        capture_output=True, text=True, timeout=30,
-    )
-    return float(result.stdout.strip())
 
+def draft_video_config(vc: VideoConfig) -> VideoConfig:
+    """Réglages proxy : largeur DRAFT_WIDTH (ratio conservé), preset ultrafast, CRF élevé."""
+    scale = DRAFT_WIDTH / vc.width
+    return vc.model_copy(update={
+        "width": DRAFT_WIDTH,
+        "height": max(2, round(vc.height * scale / 2) * 2),
+        "preset": "ultrafast",
+        "crf": DRAFT_CRF,
+    })
 
-async def assemble_video(job_id: str, request: AssembleRequest, work_dir: Path) -> Path:
-    """Pipeline complet d'assemblage vidéo."""
-    clips = sorted(request.clips, key=lambda c: c.index)
-    vc = request.video_config
-    ac = request.audio_config
 
-    # --- 1. Télécharger les clips ---
-    emit(job_id, "pipeline", "info", f"Téléchargement de {len(clips)} clips...")
-    clip_paths: list[Path] = []
-    for i, clip in enumerate(clips):
-        dest = work_dir / f"clip_{i:03d}.mp4"
-        await download_file(clip.video_url, dest)
-        clip_paths.append(dest)
-        emit(job_id, "pipeline", "info", f"Clip {i + 1}/{len(clips)} téléchargé")
-
-    # --- 2. Speed adjust + resize chaque clip ---
-    emit(job_id, "ffmpeg", "info", "Ajustement vitesse et résolution des clips...")
-    adjusted_paths: list[Path] = []
-    for i, (clip_path, clip) in enumerate(zip(clip_paths, clips)):
-        adjusted = work_dir / f"adj_{i:03d}.mp4"
-        actual_duration = get_duration(clip_path)
-        target_duration = clip.duree_secondes
+def resolve_quality(request: AssembleRequest) -> tuple[AssembleRequest, VideoConfig]:
+    """Requête et réglages vidéo effectivement rendus (draft : proxies, sans sorties annexes)."""
+    if request.quality != "draft":
+        return request, request.video_config
+    stripped = request.model_copy(update={"renditions": None, "hls": None, "previews": None})
+    return stripped, draft_video_config(request.video_config)
 
-        pts_factor = target_duration / actual_duration
-        atempo = 1.0 / pts_factor
-        atempo_filters = _build_atempo_chain(atempo)
 
-        vf = (
-            f"setpts={pts_factor}*PTS,"
-            f"scale={vc.width}:{vc.height}:force_original_aspect_ratio=decrease,"
-            f"pad={vc.width}:{vc.height}:(ow-iw)/2:(oh-ih)/2"
-        )
+async def assemble_video(
+    job_id: str,
+    request: AssembleRequest,
+    work_dir: Path,
+    hls_publisher: HlsPublisher | None = None,
+    audio_dir: Path | None = None,
+    policy: EncoderPolicy | None = None,
+) -> AssemblyResult:
+    """Pipeline complet d'assemblage vidéo.
+
+    Si request.hls est défini, le passage final écrit aussi des segments HLS
+    dans work_dir/hls, publiés au fil de l'eau par hls_publisher s'il est fourni.
+    Les intermédiaires audio vont dans audio_dir (tier tmpfs) s'il est fourni.
+    Chaque intermédiaire est supprimé dès que l'étape suivante l'a consommé.
+    Avec STREAMING_PIPELINE, téléchargements et concat passent par des pipes
+    (voir app.services.streaming).
+    policy (hors draft) impose le preset x264 et le nombre de threads du job.
+    En quality="draft", le rendu se fait à partir de proxies basse résolution
+    et sans sorties annexes ; le plan de rendu retourné permet un finalize.
+    """
+    clips = sorted(request.clips, key=lambda c: c.index)
+    draft = request.quality == "draft"
+    plan_request = request
+    request, vc = resolve_quality(request)
+    ac = request.audio_config
+    if policy and not draft and policy.preset != vc.preset:
+        vc = vc.model_copy(update={"preset": policy.preset})
+        request = request.model_copy(update={"video_config": vc})
+        emit(job_id, "pipeline", "info", f"Preset {policy.preset} ({policy.reason})")
+    if draft:
+        emit(job_id, "pipeline", "info", f"Mode draft : proxies {vc.width}x{vc.height}, preset {vc.preset}")
+
+    # --- 1-2. Plan de rendu : downloads, probes et clips normalisés, en parallèle ---
+    # Chaque clip est normalisé dès que son téléchargement est fini (clips normalisés en cache)
+    plan = compile_plan(request, vc)
+    emit(job_id, "pipeline", "info",
+         f"Plan de rendu : {len(plan.nodes)} nœuds, ~{plan.total_cpu_seconds():.0f}s CPU estimées")
+    # En HLS, un GOP par segment : les coupes tombent sur les keyframes
+    gop = ["-g", str(vc.fps * request.hls.segment_seconds)] if request.hls else []
+    workers, _ = encode_workers(len(clips))
+    # Threads par process x264 : budget de la politique (ou tous les cœurs) réparti entre les clips
+    threads = max(1, ((policy.threads if policy else 0) or os.cpu_count() or 1) // workers)
+
+    def adjust_args(clip, source: str, actual_duration: float, dest: Path) -> list[str]:
+        pts_factor = clip.duree_secondes / actual_duration
+        vf = f"setpts={pts_factor}*PTS,{_fit_filter(vc.width, vc.height)}"
+        return ["-i", source,
+                "-vf", vf,
+                "-af", _build_atempo_chain(1.0 / pts_factor),
+                "-r", str(vc.fps),
+                "-c:v", vc.codec, "-preset", vc.preset, "-crf", str(vc.crf), *gop,
+                "-threads", str(threads),
+                "-c:a", ac.output_codec, "-b:a", ac.output_bitrate,
+                "-ar", str(ac.resample_rate),
+                str(dest)]
+
+    # Streaming : clip → (encodage lancé pendant le téléchargement, sortie temporaire, durée source supposée)
+    streamed: dict[int, tuple[asyncio.Task, Path, float]] = {}
+    # Encodages x264 simultanés du job, en flux ou depuis le fichier : un seul plafond pour les deux
+    encode_slots = asyncio.Semaphore(workers)
+
+    async def start_streamed(url: str) -> list[asyncio.subprocess.Process]:
+        procs = []
+        for node in plan.nodes.values():
+            if node.kind != "transcode" or node.detail["url"] != url or node.cached:
+                continue
+            i = node.detail["clip"]
+            duration = plan.nodes[f"probe:{i}"].detail["source_seconds"]
+            # Pas d'attente ici : sans place libre, le clip sera encodé depuis le fichier
+            if not duration or encode_slots.locked():
+                continue
+            await encode_slots.acquire()
+            tmp = cache_path("clips", cache_key("stream", job_id, i), ".part.mp4")
+            desc = f"adjust clip {i + 1} (stream)"
+            proc = await start_ffmpeg(adjust_args(clips[i], "pipe:0", duration, tmp), desc, stdin=True)
+
+            async def finish(proc=proc, desc=desc) -> None:
+                try:
+                    await wait_ffmpeg(proc, desc)
+                finally:
+                    encode_slots.release()
+
+            streamed[i] = (asyncio.create_task(finish()), tmp, duration)
+            procs.append(proc)
+        return procs
+
+    def drop_streamed() -> None:
+        for task, tmp, _ in streamed.values():
+            task.cancel()
+            tmp.unlink(missing_ok=True)
+        streamed.clear()
+
+    async def download(node: PlanNode, _: dict) -> CachedFile:
+        url = node.detail["url"]
+        fanout = StdinFanout(lambda: start_streamed(url)) if settings.STREAMING_PIPELINE else None
+        try:
+            source, hit = await cached_download(url, on_chunk=fanout.feed if fanout else None)
+        except BaseException:
+            drop_streamed()
+            raise
+        if fanout:
+            await fanout.close()
+        emit(job_id, "pipeline", "info",
+             f"{url.rsplit('/', 1)[-1]} {'en cache' if hit else 'téléchargé'}")
+        return source
+
+    async def probe(node: PlanNode, inputs: dict) -> float:
+        return await asyncio.to_thread(cached_duration, inputs[node.deps[0]], node.detail["url"])
+
+    async def transcode(node: PlanNode, inputs: dict) -> tuple[str, Path, bool]:
+        i = node.detail["clip"]
+        clip = clips[i]
+        source, actual_duration = inputs[node.deps[0]], inputs[node.deps[1]]
+        target_duration = clip.duree_secondes
+        key = normalized_clip_key(source.digest, clip, vc, gop, ac)
+        if actual_duration <= 0:
+            raise ValueError(f"Clip {i + 1} : durée source nulle ({clip.video_url})")
+
+        adjusted = None
+        # Déjà normalisé à ce preset ou à un preset plus lent : réutilisé tel quel
+        reusable = lookup_output("clips", acceptable_clip_keys(source.digest, clip, vc, gop, ac), ".mp4")
+        if reusable:
+            (key, adjusted), hit = reusable, True
+            if i in streamed:
+                task, tmp, _ = streamed.pop(i)
+                task.cancel()
+                tmp.unlink(missing_ok=True)
+        elif i in streamed:
+            task, tmp, assumed = streamed.pop(i)
+            try:
+                await task
+            except RuntimeError as exc:
+                emit(job_id, "ffmpeg", "warning", f"Clip {i + 1} : encodage en flux échoué, reprise depuis le fichier")
+                logger.warning(f"[{job_id}] streamed clip {i + 1} failed: {exc}")
+            else:
+                if abs(assumed - actual_duration) < 1e-3:
+                    adjusted, hit = await store_ffmpeg_output("clips", key, ".mp4", tmp)
+            if adjusted is None:
+                tmp.unlink(missing_ok=True)
+        if adjusted is None:
+            # Débit mesuré seulement sur les encodages depuis le fichier (un encodage
+            # en flux avance au rythme du téléchargement), process FFmpeg seul
+            def measured(seconds: float) -> None:
+                if vc.codec == "libx264":
+                    record_throughput(vc.preset, vc.width * vc.height * vc.fps * target_duration / 1e6,
+                                      seconds, threads)
+
+            async with encode_slots:
+                adjusted, hit = await cached_ffmpeg_output(
+                    "clips", key, ".mp4",
+                    lambda dest: adjust_args(clip, str(source.path), actual_duration, dest),
+                    desc=f"adjust clip {i + 1}", on_produced=measured,
+                )
+        emit(job_id, "ffmpeg", "info",
+             f"Clip {i + 1}/{len(clips)} : {actual_duration:.1f}s → {target_duration:.1f}s"
+             f"{' (réutilisé)' if hit else ''}")
+        return key, adjusted, hit
+
+    # Audio (voix off + musique avec ducking) : calé sur la durée de la timeline, il se
+    # mixe dès que ses sources sont téléchargées, en parallèle des clips
+    timeline = timeline_seconds(request)
+
+    async def mix(node: PlanNode, inputs: dict) -> tuple[str, Path, bool]:
+        vo = inputs[download_node_id(request.voiceover_url)] if request.voiceover_url else None
+        music = inputs[download_node_id(request.music_url)] if request.music_url else None
+        # Même clé pour le cache de la piste et pour la comparaison avec le rendu précédent
+        key = audio_cache_key(vo.digest if vo else None, music.digest if music else None, request, timeline)
+        return key, *await _mix_audio(job_id, audio_dir or work_dir, request, timeline, vo, music, key)
+
+    if "mix" not in plan.nodes:
+        emit(job_id, "ffmpeg", "info", "Pas d'audio externe, conservation audio clips")
 
-        run_ffmpeg(
-            ["-i", str(clip_path),
-             "-vf", vf,
-             "-af", atempo_filters,
-             "-r", str(vc.fps),
-             "-c:v", vc.codec, "-preset", vc.preset, "-crf", str(vc.crf),
-             "-c:a", ac.output_codec, "-b:a", ac.output_bitrate,
-             "-ar", str(ac.resample_rate),
-             str(adjusted)],
-            desc=f"adjust clip {i + 1}",
-        )
-        adjusted_paths.append(adjusted)
-        emit(job_id, "ffmpeg", "info", f"Clip {i + 1}/{len(clips)} : {actual_duration:.1f}s → {target_duration:.1f}s")
+    emit(job_id, "pipeline", "info", f"Téléchargement et normalisation de {len(clips)} clips...")
+    with stage(job_id, "prepare"):
+        try:
+            results = await execute_plan(
+                plan.subgraph({"download", "probe", "transcode", "mix"}),
+                {"download": download, "probe": probe, "transcode": transcode, "mix": mix},
+                limits={"download": MAX_PARALLEL_DOWNLOADS},
+            )
+        finally:
+            drop_streamed()
+    probes = {clip.video_url: results[f"probe:{i}"] for i, clip in enumerate(clips)}
+    clip_keys = [results[f"transcode:{i}"][0] for i in range(len(clips))]
+    adjusted_paths = [results[f"transcode:{i}"][1] for i in range(len(clips))]
+    clip_hits = [results[f"transcode:{i}"][2] for i in range(len(clips))]
+
+    # Diff avec le rendu précédent de l'hôtel : seuls les clips modifiés ont été réencodés
+    previous = load_previous(request.hotel_id, request.quality)
+    emit(job_id, "pipeline", "info", diff_clips(previous, clip_keys).describe())
+    audio_signature, audio_path, audio_hit = results.get("mix", (None, None, None))
+    if audio_signature and previous and previous.audio_signature == audio_signature:
+        emit(job_id, "pipeline", "info", "Audio inchangé depuis le rendu précédent")
 
     # --- 3. Concaténer les clips (cut franc) ---
     emit(job_id, "ffmpeg", "info", "Concaténation des clips...")
     concat_list = work_dir / "concat.txt"
-    concat_list.write_text("\n".join(f"file '{p.name}'" for p in adjusted_paths))
-    concat_video = work_dir / "concat.mp4"
-    run_ffmpeg(
-        ["-f", "concat", "-safe", "0", "-i", str(concat_list),
-         "-c", "copy", str(concat_video)],
-        desc="concat",
+    concat_list.write_text("\n".join(f"file '{p.resolve()}'" for p in adjusted_paths))
+    concat_args = ["-f", "concat", "-safe", "0", "-i", str(concat_list), "-c", "copy"]
+    streaming = pipe_concat(request, timeline)
+    with stage(job_id, "concat"):
+        if streaming:
+            # La concat tournera pendant le passage final, qui la lit dans une FIFO
+            concat_video = make_fifo(work_dir / f"concat.{PIPE_FORMAT}")
+            durations = await asyncio.gather(*(asyncio.to_thread(get_duration, p) for p in adjusted_paths))
+            total_duration = sum(durations)
+        else:
+            concat_video = work_dir / "concat.mp4"
+            run_ffmpeg([*concat_args, str(concat_video)], desc="concat")
+            total_duration = get_duration(concat_video)
+    emit(job_id, "ffmpeg", "success",
+         f"Vidéo concaténée : {total_duration:.1f}s{' (en flux vers le passage final)' if streaming else ''}")
+
+    # --- 4. Passage final : sortie principale + renditions (un seul décodage) ---
+    result = AssemblyResult(
+        output_path=work_dir / f"hotel_{request.hotel_id}{'_draft' if draft else ''}.mp4",
+        renditions={
+            r.name: work_dir / f"hotel_{request.hotel_id}_{r.name}.mp4"
+            for r in request.renditions or []
+        },
+        hls_dir=work_dir / "hls" if request.hls else None,
+    )
+    if result.renditions:
+        emit(job_id, "ffmpeg", "info",
+             f"Encodage de {len(result.renditions)} rendition(s) : {', '.join(result.renditions)}")
+    if result.hls_dir:
+        result.hls_dir.mkdir(exist_ok=True)
+    preview_plan = None
+    previews_dir = work_dir / "previews"
+    if request.previews:
+        preview_plan = plan_previews(request.previews, total_duration, vc)
+        previews_dir.mkdir(exist_ok=True)
+        emit(job_id, "ffmpeg", "info",
+             f"Poster + {len(preview_plan.frames)} vignettes + planche "
+             f"{preview_plan.columns}x{preview_plan.rows} dans le passage final")
+    # Sortie longue : les renditions sont encodées par chunks parallèles, hors du passage final
+    chunked = not streaming and bool(result.renditions) and use_chunked(total_duration)
+    final_request = request.model_copy(update={"renditions": None}) if chunked else request
+    with stage(job_id, "mux"):
+        concat = asyncio.create_task(run_ffmpeg_async(
+            [*concat_args, "-f", PIPE_FORMAT, str(concat_video)], desc="concat (fifo)",
+        )) if streaming else None
+        encode = asyncio.create_task(run_ffmpeg_async(
+            _final_args(final_request, concat_video, audio_path, result, preview_plan, previews_dir,
+                        video_format=PIPE_FORMAT if streaming else None),
+            desc="mux final",
+        ))
+        renditions = asyncio.create_task(
+            _encode_renditions_chunked(job_id, request, concat_video, audio_path, result, work_dir, total_duration)
+        ) if chunked else None
+        try:
+            if hls_publisher:
+                await hls_publisher.follow(encode)
+            else:
+                await encode
+            if concat:
+                # Un passage final "réussi" sur une concat interrompue serait tronqué
+                await concat
+            if renditions:
+                await renditions
+        finally:
+            for task in (concat, renditions):
+                if task and not task.done():
+                    task.cancel()
+    # Intermédiaires consommés par le passage final (segments HLS déjà publiés)
+    concat_video.unlink(missing_ok=True)
+    if hls_publisher and result.hls_dir:
+        shutil.rmtree(result.hls_dir, ignore_errors=True)
+    if preview_plan:
+        write_vtt(preview_plan, previews_dir / VTT_NAME)
+        result.previews = collect_previews(previews_dir)
+
+    clip_seconds = [clip.duree_secondes for clip in clips]
+    reuse = reuse_summary(clip_hits, clip_seconds, audio_hit)
+    emit(job_id, "pipeline", "info",
+         f"Réutilisé : {reuse['clips_reused']}/{reuse['clips_total']} clips "
+         f"({reuse['video_reuse_ratio']:.0%} de la vidéo)"
+         + ("" if audio_hit is None else f", audio {'réutilisé' if audio_hit else 'refait'}"))
+    store_manifest(request.hotel_id, request.quality, RenderManifest(
+        clip_keys=clip_keys,
+        clip_seconds=clip_seconds,
+        audio_signature=audio_signature,
+        total_duration=total_duration,
+    ))
+
+    result.render_plan = {
+        "request": plan_request.model_dump(mode="json"),
+        "probes": probes,
+        "clip_keys": clip_keys,
+        "total_duration": total_duration,
+        "reuse": reuse,
+    }
+    emit(job_id, "pipeline", "success", f"Vidéo finale : {result.output_path.name}")
+    return result
+
+
+def _fit_filter(width: int, height: int, fit: str = "pad") -> str:
+    """Adapte l'image à width x height : letterbox (pad) ou recadrage centré (crop)."""
+    if fit == "crop":
+        return (
+            f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+            f"crop={width}:{height},setsar=1"
+        )
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
     )
-    total_duration = get_duration(concat_video)
-    emit(job_id, "ffmpeg", "success", f"Vidéo concaténée : {total_duration:.1f}s")
 
-    # --- 4. Audio (voiceover + musique avec ducking) ---
-    output_filename = f"hotel_{request.hotel_id}.mp4"
-    output_path = work_dir / output_filename
 
-    if request.voiceover_url or request.voiceover_segments or request.music_url:
-        await _mix_audio(job_id, work_dir, concat_video, request, total_duration, output_path)
+def _final_args(
+    request: AssembleRequest,
+    video_path: Path,
+    audio_path: Path | None,
+    result: AssemblyResult,
+    preview_plan: PreviewPlan | None = None,
+    previews_dir: Path | None = None,
+    video_format: str | None = None,
+) -> list[str]:
+    """Commande FFmpeg du passage final.
+
+    La sortie principale (et la sortie HLS éventuelle) copie le flux vidéo ;
+    chaque rendition est une branche d'un split sur le même décodage, encodée
+    dans la même invocation, tout comme les images d'aperçu. video_format
+    force le format d'entrée (FIFO du mode streaming).
+    """
+    vc = request.video_config
+    ac = request.audio_config
+    renditions: list[Rendition] = request.renditions or []
+
+    args = ["-f", video_format] if video_format else []
+    args += ["-i", str(video_path)]
+    if audio_path:
+        args += ["-i", str(audio_path)]
+        audio = ["-map", "1:a", "-c:a", ac.output_codec, "-b:a", ac.output_bitrate]
     else:
-        emit(job_id, "ffmpeg", "info", "Pas d'audio externe, conservation audio clips")
-        run_ffmpeg(
-            ["-i", str(concat_video), "-c", "copy",
-             "-movflags", vc.movflags, str(output_path)],
-            desc="copy final",
+        audio = ["-map", "0:a?", "-c:a", "copy"]
+
+    preview_chains, preview_outputs = [], []
+    if preview_plan:
+        preview_chains, preview_outputs = preview_graph(preview_plan, "[pv]", previews_dir)
+
+    branches = len(renditions) + (1 if preview_plan else 0)
+    if branches:
+        labels = "".join(f"[r{i}]" for i in range(len(renditions))) + ("[pv]" if preview_plan else "")
+        chains = [f"[0:v]split={branches}{labels}"]
+        chains += [f"[r{i}]{_fit_filter(r.width, r.height, r.fit)}[v{i}]" for i, r in enumerate(renditions)]
+        args += ["-filter_complex", ";".join(chains + preview_chains)]
+
+    args += ["-map", "0:v", "-c:v", "copy", *audio,
+             "-movflags", vc.movflags, "-shortest", str(result.output_path)]
+    for i, r in enumerate(renditions):
+        args += ["-map", f"[v{i}]",
+                 "-c:v", vc.codec, "-preset", r.preset or vc.preset,
+                 "-crf", str(r.crf if r.crf is not None else vc.crf),
+                 *audio,
+                 "-movflags", vc.movflags, "-shortest", str(result.renditions[r.name])]
+    if result.hls_dir:
+        args += ["-map", "0:v", "-c:v", "copy", *audio, "-shortest",
+                 *hls_output_args(result.hls_dir, request.hls)]
+    return args + preview_outputs
+
+
+async def _encode_renditions_chunked(
+    job_id: str,
+    request: AssembleRequest,
+    video_path: Path,
+    audio_path: Path | None,
+    result: AssemblyResult,
+    work_dir: Path,
+    total_duration: float,
+) -> None:
+    """Encode chaque rendition par chunks parallèles (mêmes réglages que dans _final_args)."""
+    vc = request.video_config
+    ac = request.audio_config
+    if audio_path:
+        mux_inputs = ["-i", str(audio_path)]
+        audio = ["-map", "1:a", "-c:a", ac.output_codec, "-b:a", ac.output_bitrate]
+    else:
+        mux_inputs = ["-i", str(video_path)]
+        audio = ["-map", "1:a?", "-c:a", "copy"]
+    gop = vc.fps * RENDITION_GOP_SECONDS
+    # Un seul plafond de processus pour toutes les renditions
+    workers, _ = encode_workers(len(result.renditions) * math.ceil(total_duration / settings.CHUNK_SECONDS))
+    semaphore = asyncio.Semaphore(workers)
+
+    async def encode(r: Rendition) -> None:
+        chunks = await encode_chunked(
+            video_path, result.renditions[r.name], work_dir,
+            video_filter=_fit_filter(r.width, r.height, r.fit),
+            codec_args=["-c:v", vc.codec, "-preset", r.preset or vc.preset,
+                        "-crf", str(r.crf if r.crf is not None else vc.crf)],
+            fps=vc.fps,
+            gop_frames=gop,
+            total_duration=total_duration,
+            mux_inputs=mux_inputs,
+            mux_args=[*audio, "-movflags", vc.movflags, "-shortest"],
+            semaphore=semaphore,
+            desc=f"rendition {r.name}",
         )
+        emit(job_id, "ffmpeg", "info", f"Rendition {r.name} : {len(chunks)} chunks recollés")
+
+    emit(job_id, "ffmpeg", "info", f"Renditions encodées par chunks ({workers} processus en parallèle)")
+    await asyncio.gather(*(encode(r) for r in request.renditions))
 
-    emit(job_id, "pipeline", "success", f"Vidéo finale : {output_filename}")
-    return output_path
 
+def _music_filter(ac: AudioConfig, total_duration: float, gain: float = 1.0) -> str:
+    """Boucle, coupe à la durée vidéo, applique les fondus et le volume de la musique."""
+    fade_in = f"afade=t=in:d={ac.music_fade_in_seconds}," if ac.music_fade_in_seconds > 0 else ""
+    fade_out_start = max(0, total_duration - ac.music_fade_out_seconds)
+    fade_out = f"afade=t=out:st={fade_out_start}:d={ac.music_fade_out_seconds}," if ac.music_fade_out_seconds > 0 else ""
+    return (
+        f"aloop=loop=-1:size=2e+09,atrim=0:{total_duration},asetpts=PTS-STARTPTS,"
+        f"{fade_in}{fade_out}volume={ac.music_volume * gain}"
+    )
 
-def _build_segments_filter(
-    segments: list,
-    vo_input_idx: int,
-) -> str:
-    """Construit le filtre FFmpeg pour découper et positionner les segments voix off.
 
-    Utilise atrim pour découper un seul fichier audio (input vo_input_idx)
-    et adelay pour positionner chaque segment dans la timeline vidéo.
-    Produit une piste [voice].
-    """
-    parts = []
-    labels = []
-    for i, seg in enumerate(segments):
-        label = f"vo{i}"
-        delay_ms = int(seg.start_seconds * 1000)
-        delay_part = f",adelay={delay_ms}|{delay_ms}" if delay_ms > 0 else ""
-        parts.append(
-            f"[{vo_input_idx}:a]atrim=start={seg.in_seconds}:end={seg.out_seconds},"
-            f"asetpts=PTS-STARTPTS{delay_part}[{label}]"
-        )
-        labels.append(f"[{label}]")
+def _store_audio(path: Path, key: str) -> Path:
+    """Déplace une piste audio produite dans le cache et retourne son nouveau chemin."""
+    dest = cache_path("audio", key, path.suffix)
+    shutil.move(path, dest)
+    return dest
 
-    if len(segments) == 1:
-        # Un seul segment, renommer directement
-        return parts[0].replace(f"[{labels[0][1:-1]}]", "[voice]")
 
-    mix_inputs = "".join(labels)
-    parts.append(
-        f"{mix_inputs}amix=inputs={len(segments)}:duration=longest:dropout_transition=0[voice]"
-    )
-    return ";".join(parts)
+async def _loudness_gain(job_id: str, source: CachedFile, ac: AudioConfig, label: str) -> float:
+    """Gain de normalisation de l'asset (1.0 si aucune cible loudness n'est définie)."""
+    if ac.target_lufs is None:
+        return 1.0
+    caps = capabilities.current()
+    if caps and not caps.has_filter("loudnorm"):
+        emit(job_id, "ffmpeg", "warning", f"Filtre loudnorm absent : normalisation {label} ignorée")
+        return 1.0
+    stats, cached = await asyncio.to_thread(cached_loudness, source.path, source.digest)
+    gain = normalization_gain(stats, ac.target_lufs, ac.target_true_peak)
+    emit(job_id, "ffmpeg", "info",
+         f"Loudness {label} {'en cache' if cached else 'mesurée'} : "
+         f"{stats.integrated_lufs:.1f} LUFS, TP {stats.true_peak_dbtp:.1f} dBTP "
+         f"→ gain {20 * math.log10(gain):+.1f} dB")
+    return gain
 
 
 async def _mix_audio(
     job_id: str,
     work_dir: Path,
-    video_path: Path,
     request: AssembleRequest,
     total_duration: float,
-    output_path: Path,
-) -> None:
-    """Télécharge et mixe voix off + musique avec ducking automatique."""
+    vo: CachedFile | None,
+    music: CachedFile | None,
+    audio_key: str,
+) -> tuple[Path, bool]:
+    """Produit la piste audio finale (ducking hors ligne) à partir des sources téléchargées.
+
+    total_duration est la durée de la timeline (timeline_seconds). La piste
+    produite est mise en cache : un rendu qui ne change ni les sources audio,
+    ni les réglages, ni la durée (ex. finalize d'un draft) la réutilise :
+    audio_key est sa clé (audio_cache_key). Le décodage et le calcul NumPy
+    tournent hors de la boucle d'événements. Retourne (piste, réutilisée).
+    """
     ac = request.audio_config
-    vc = request.video_config
-
-    vo_path = None
-    music_path = None
 
-    if request.voiceover_url:
-        emit(job_id, "pipeline", "info", "Téléchargement voix off...")
-        vo_path = work_dir / "voiceover.mp3"
-        await download_file(request.voiceover_url, vo_path)
+    cached_audio = cache_path("audio", audio_key, ".wav")
+    if cached_audio.exists():
+        emit(job_id, "ffmpeg", "info", "Piste audio en cache, mixage réutilisé")
+        return cached_audio, True
 
-    if request.music_url:
-        emit(job_id, "pipeline", "info", "Téléchargement musique...")
-        music_path = work_dir / "music.mp3"
-        await download_file(request.music_url, music_path)
+    vo_path = vo.path if vo else None
+    music_path = music.path if music else None
 
-    segments = request.voiceover_segments
+    # Normalisation loudness : mesures en cache par asset, gain linéaire au mixage
+    vo_gain = await _loudness_gain(job_id, vo, ac, "voix off") if vo else 1.0
+    music_gain = await _loudness_gain(job_id, music, ac, "musique") if music else 1.0
+    spans = None
 
-    # --- Segments (atrim) + musique (ducking) ---
-    if vo_path and segments and music_path:
+    # --- Segments : compilés en un stem aligné sur la timeline vidéo ---
+    if vo_path and request.voiceover_segments:
+        spans = compile_timeline(request.voiceover_segments, total_duration)
         emit(job_id, "ffmpeg", "info",
-             f"Mixage {len(segments)} segments voix off + musique avec ducking "
-             f"(music_volume={ac.music_volume})")
-
-        fade_in = f"afade=t=in:st=0:d={ac.music_fade_in_seconds}," if ac.music_fade_in_seconds > 0 else ""
-        fade_out_start = max(0, total_duration - ac.music_fade_out_seconds)
-        fade_out = f"afade=t=out:st={fade_out_start}:d={ac.music_fade_out_seconds}," if ac.music_fade_out_seconds > 0 else ""
-
-        # input 0=video, 1=voiceover, 2=music
-        seg_filter = _build_segments_filter(segments, 1)
-
-        filter_complex = (
-            f"{seg_filter};"
-            f"[voice]asplit=2[vo_sc][vo_mix];"
-            f"[2:a]aloop=loop=-1:size=2e+09,atrim=0:{total_duration},"
-            f"asetpts=PTS-STARTPTS,{fade_in}{fade_out}"
-            f"volume={ac.music_volume},aresample={ac.resample_rate}[music];"
-            f"[music][vo_sc]sidechaincompress="
-            f"threshold={ac.sidechain_threshold}:ratio={ac.sidechain_ratio}:"
-            f"attack={ac.sidechain_attack}:release={ac.sidechain_release}[musicduck];"
-            f"[vo_mix][musicduck]amix=inputs=2:duration=longest:dropout_transition=2[aout]"
-        )
+             f"Compilation timeline voix off : {len(request.voiceover_segments)} segments "
+             f"→ {len(spans)} plages")
+        vo_pcm = await asyncio.to_thread(decode_pcm, vo_path, work_dir / "voiceover.pcm", ac.resample_rate)
+        vo_path = await asyncio.to_thread(render_stem, vo_pcm, spans, work_dir / "voiceover_stem.wav",
+                                          total_duration, ac.resample_rate)
+        vo_pcm.unlink(missing_ok=True)
+    stem = vo_path if spans is not None else None
+
+    # --- Voix off (ou stem) + musique : enveloppe de ducking précalculée ---
+    if vo_path and music_path:
+        emit(job_id, "ffmpeg", "info",
+             f"Mixage audio avec ducking (music_volume={ac.music_volume}, "
+             f"threshold={ac.sidechain_threshold}, ratio={ac.sidechain_ratio})")
 
-        run_ffmpeg(
-            ["-i", str(video_path), "-i", str(vo_path), "-i", str(music_path),
-             "-filter_complex", filter_complex,
-             "-map", "0:v", "-map", "[aout]",
-             "-c:v", vc.codec, "-preset", vc.preset, "-crf", str(vc.crf),
-             "-c:a", ac.output_codec, "-b:a", ac.output_bitrate,
-             "-movflags", vc.movflags,
-             "-shortest",
-             str(output_path)],
-            desc="segments + audio ducking mix",
+        voice_pcm, music_pcm = await asyncio.gather(
+            asyncio.to_thread(
+                decode_pcm, vo_path, work_dir / "voice.f32", ac.resample_rate, sample_fmt="f32le",
+                audio_filter=(f"volume={ac.voiceover_volume * vo_gain},apad=whole_dur={total_duration},"
+                              f"atrim=0:{total_duration}"),
+            ),
+            asyncio.to_thread(
+                decode_pcm, music_path, work_dir / "music.f32", ac.resample_rate, sample_fmt="f32le",
+                audio_filter=_music_filter(ac, total_duration, music_gain),
+            ),
         )
 
-    # --- Segments (atrim) seuls (sans musique) ---
-    elif vo_path and segments:
-        emit(job_id, "ffmpeg", "info",
-             f"Mixage {len(segments)} segments voix off (sans musique)...")
-
-        seg_filter = _build_segments_filter(segments, 1)
-        filter_complex = seg_filter.replace("[voice]", "[aout]")
-
-        run_ffmpeg(
-            ["-i", str(video_path), "-i", str(vo_path),
-             "-filter_complex", filter_complex,
-             "-map", "0:v", "-map", "[aout]",
-             "-c:v", vc.codec, "-preset", vc.preset, "-crf", str(vc.crf),
-             "-c:a", ac.output_codec, "-b:a", ac.output_bitrate,
-             "-movflags", vc.movflags,
-             "-shortest",
-             str(output_path)],
-            desc="voiceover segments only",
+        envelope_key = cache_key(
+            "envelope", vo.digest, [astuple(s) for s in spans or []], total_duration,
+            ac.voiceover_volume * vo_gain, ac.sidechain_threshold, ac.sidechain_ratio,
+            ac.sidechain_attack, ac.sidechain_release, ac.resample_rate,
+        )
+        envelope, cached = await asyncio.to_thread(
+            load_or_compute_envelope, voice_pcm, ac, envelope_key, ac.resample_rate,
         )
-
-    # --- Voiceover unique + musique (ducking) ---
-    elif vo_path and music_path:
         emit(job_id, "ffmpeg", "info",
-             f"Mixage audio avec ducking (music_volume={ac.music_volume}, "
-             f"threshold={ac.sidechain_threshold}, ratio={ac.sidechain_ratio})")
+             f"Enveloppe de ducking {'en cache' if cached else 'calculée'} "
+             f"({envelope.size} trames, gain min {float(envelope.min()):.2f})")
 
-        fade_in = f"afade=t=in:d={ac.music_fade_in_seconds}," if ac.music_fade_in_seconds > 0 else ""
-        fade_out_start = max(0, total_duration - ac.music_fade_out_seconds)
-        fade_out = f"afade=t=out:st={fade_out_start}:d={ac.music_fade_out_seconds}," if ac.music_fade_out_seconds > 0 else ""
-
-        filter_complex = (
-            f"[1:a]volume={ac.voiceover_volume},apad=whole_dur={total_duration},"
-            f"aresample={ac.resample_rate},asplit=2[vo_sc][vo_mix];"
-            f"[2:a]aloop=loop=-1:size=2e+09,atrim=0:{total_duration},"
-            f"{fade_in}{fade_out}"
-            f"volume={ac.music_volume},aresample={ac.resample_rate}[music_base];"
-            f"[music_base][vo_sc]sidechaincompress="
-            f"threshold={ac.sidechain_threshold}:ratio={ac.sidechain_ratio}:"
-            f"attack={ac.sidechain_attack}:release={ac.sidechain_release}:"
-            f"level_in=1:level_sc=1[ducked];"
-            f"[vo_mix][ducked]amix=inputs=2:duration=first:normalize=0[aout]"
-        )
-        run_ffmpeg(
-            ["-i", str(video_path), "-i", str(vo_path), "-i", str(music_path),
-             "-filter_complex", filter_complex,
-             "-map", "0:v", "-map", "[aout]",
-             "-c:v", vc.codec, "-preset", vc.preset, "-crf", str(vc.crf),
-             "-c:a", ac.output_codec, "-b:a", ac.output_bitrate,
-             "-movflags", vc.movflags,
-             "-shortest",
-             str(output_path)],
-            desc="audio ducking mix",
+        mix_path = await asyncio.to_thread(
+            mix_ducked, voice_pcm, music_pcm, envelope, work_dir / "mix.wav", ac.resample_rate,
         )
+        for intermediate in (voice_pcm, music_pcm, stem):
+            if intermediate:
+                intermediate.unlink(missing_ok=True)
+        return await asyncio.to_thread(_store_audio, mix_path, audio_key), False
 
-    # --- Voiceover unique seul ---
-    elif vo_path:
+    # --- Voix off (ou stem) seule ---
+    if vo_path:
         emit(job_id, "ffmpeg", "info", "Ajout voix off (sans musique)...")
-        run_ffmpeg(
-            ["-i", str(video_path), "-i", str(vo_path),
-             "-map", "0:v", "-map", "1:a",
-             "-c:v", "copy",
-             "-c:a", ac.output_codec, "-b:a", ac.output_bitrate,
-             "-movflags", vc.movflags,
-             "-shortest",
-             str(output_path)],
-            desc="voiceover only",
+        if vo_gain == 1.0:
+            # Le stem est une piste produite : en cache comme les autres (la source brute y est déjà)
+            if stem:
+                return await asyncio.to_thread(_store_audio, stem, audio_key), False
+            return vo_path, False
+        voice_wav = work_dir / "voice.wav"
+        await run_ffmpeg_async(
+            ["-i", str(vo_path), "-af", f"volume={vo_gain}",
+             "-ar", str(ac.resample_rate), str(voice_wav)],
+            desc="voiceover loudness",
         )
+        if stem:
+            stem.unlink(missing_ok=True)
+        return await asyncio.to_thread(_store_audio, voice_wav, audio_key), False
 
     # --- Musique seule ---
-    elif music_path:
-        emit(job_id, "ffmpeg", "info", "Ajout musique de fond...")
-        fade_in = f"afade=t=in:d={ac.music_fade_in_seconds}," if ac.music_fade_in_seconds > 0 else ""
-        fade_out_start = max(0, total_duration - ac.music_fade_out_seconds)
-        fade_out = f"afade=t=out:st={fade_out_start}:d={ac.music_fade_out_seconds}," if ac.music_fade_out_seconds > 0 else ""
-
-        filter_complex = (
-            f"[1:a]aloop=loop=-1:size=2e+09,atrim=0:{total_duration},"
-            f"{fade_in}{fade_out}"
-            f"volume={ac.music_volume},aresample={ac.resample_rate}[music]"
-        )
-        run_ffmpeg(
-            ["-i", str(video_path), "-i", str(music_path),
-             "-filter_complex", filter_complex,
-             "-map", "0:v", "-map", "[music]",
-             "-c:v", "copy",
-             "-c:a", ac.output_codec, "-b:a", ac.output_bitrate,
-             "-movflags", vc.movflags,
-             str(output_path)],
-            desc="music only",
-        )
+    emit(job_id, "ffmpeg", "info", "Ajout musique de fond...")
+    music_wav = work_dir / "music.wav"
+    await run_ffmpeg_async(
+        ["-i", str(music_path),
+         "-af", _music_filter(ac, total_duration, music_gain),
+         "-ar", str(ac.resample_rate),
+         str(music_wav)],
+        desc="music only",
+    )
+    return await asyncio.to_thread(_store_audio, music_wav, audio_key), False
 
 
 def _build_atempo_chain(factor: float) -> str:
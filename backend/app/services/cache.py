@@ -0,0 +1,49 @@
+"""Cache disque partagé entre jobs, adressé par contenu."""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+
+from app.config import settings
+
+CACHE_DIR = Path(settings.CACHE_DIR)
+
+
+def file_digest(path: Path) -> str:
+    """Retourne le SHA-256 hexadécimal du contenu d'un fichier."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(*parts: Any) -> str:
+    """Construit une clé stable à partir de valeurs sérialisables en JSON."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_path(namespace: str, key: str, suffix: str) -> Path:
+    """Chemin d'une entrée de cache, le dossier du namespace est créé au besoin."""
+    folder = CACHE_DIR / namespace
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder / f"{key}{suffix}"
+
+
+def load_json(namespace: str, key: str) -> Any | None:
+    """Lit une entrée JSON du cache, None si absente ou illisible."""
+    path = cache_path(namespace, key, ".json")
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def store_json(namespace: str, key: str, value: Any) -> None:
+    """Écrit une entrée JSON de façon atomique (écriture puis rename)."""
+    path = cache_path(namespace, key, ".json")
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(value))
+    tmp.replace(path)
@@ -0,0 +1,145 @@
+"""Capacités du binaire FFmpeg, sondées une fois par build et mises en cache.
+
+Au démarrage : version, encodeurs et filtres disponibles, débit x264 mesuré
+sur un petit clip synthétique (1 thread puis tous les threads). Le résultat
+est stocké dans le cache sous le hash du binaire, le nombre de cœurs et le
+modèle de CPU (les débits mesurés dépendent de la machine) : un redémarrage
+avec le même FFmpeg sur le même hôte ne relance aucune mesure. Le pipeline s'en sert pour choisir ses
+chemins (filtres présents ou non) et l'ordonnanceur pour dimensionner les
+workers d'encodage.
+"""
+
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from app.services.cache import cache_key, file_digest, load_json, store_json
+
+logger = logging.getLogger("uvicorn.error")
+
+# Filtres et encodeurs utilisés par le pipeline
+REQUIRED_FILTERS = ["atempo", "setpts", "scale", "pad", "split", "apad", "atrim", "aloop", "afade", "volume"]
+OPTIONAL_FILTERS = ["loudnorm", "sidechaincompress", "select", "tile", "crop"]
+REQUIRED_ENCODERS = ["libx264", "aac"]
+
+# Clip de mesure du débit x264
+BENCH_WIDTH = 1280
+BENCH_HEIGHT = 720
+BENCH_FPS = 30
+BENCH_SECONDS = 2
+BENCH_PRESET = "fast"
+BENCH_MPIXELS = BENCH_WIDTH * BENCH_HEIGHT * BENCH_FPS * BENCH_SECONDS / 1e6
+
+
+@dataclass
+class Capabilities:
+    binary_hash: str
+    version: str
+    encoders: list[str] = field(default_factory=list)
+    filters: list[str] = field(default_factory=list)
+    # Mégapixels par seconde (mur) à BENCH_PRESET, 1 thread et threads auto
+    x264_mpixels_single: float | None = None
+    x264_mpixels_threaded: float | None = None
+
+    def has_filter(self, name: str) -> bool:
+        return name in self.filters
+
+    def has_encoder(self, name: str) -> bool:
+        return name in self.encoders
+
+    @property
+    def x264_effective_cores(self) -> float | None:
+        """Nombre de cœurs qu'un seul process x264 occupe réellement."""
+        if not self.x264_mpixels_single or not self.x264_mpixels_threaded:
+            return None
+        return self.x264_mpixels_threaded / self.x264_mpixels_single
+
+    def missing(self) -> list[str]:
+        return ([f for f in REQUIRED_FILTERS if f not in self.filters]
+                + [e for e in REQUIRED_ENCODERS if e not in self.encoders])
+
+
+_current: Capabilities | None = None
+
+
+def current() -> Capabilities | None:
+    """Capacités sondées au démarrage (None si FFmpeg est introuvable ou pas encore sondé)."""
+    return _current
+
+
+def _list(binary: str, kind: str) -> list[str]:
+    """Noms listés par ffmpeg -encoders / -filters."""
+    out = subprocess.run([binary, "-hide_banner", f"-{kind}"], capture_output=True, text=True, timeout=30).stdout
+    if kind == "encoders":
+        # "<flags> <nom> <description>" après la ligne de tirets de la légende
+        body = out.split("------", 1)[-1]
+        return [parts[1] for parts in map(str.split, body.splitlines()) if len(parts) >= 2]
+    # "<flags> <nom> <entrées>-><sorties> <description>"
+    return [parts[1] for parts in map(str.split, out.splitlines()) if len(parts) >= 3 and "->" in parts[2]]
+
+
+def _bench(binary: str, threads: int) -> float:
+    """Débit x264 (mégapixels encodés par seconde mur) sur un clip lavfi."""
+    cmd = [binary, "-hide_banner", "-loglevel", "error",
+           "-f", "lavfi", "-i", f"testsrc2=size={BENCH_WIDTH}x{BENCH_HEIGHT}:rate={BENCH_FPS}:duration={BENCH_SECONDS}",
+           "-c:v", "libx264", "-preset", BENCH_PRESET, "-threads", str(threads), "-f", "null", "-"]
+    t0 = time.perf_counter()
+    subprocess.run(cmd, capture_output=True, check=True, timeout=120)
+    wall = time.perf_counter() - t0
+    return BENCH_MPIXELS / wall
+
+
+def probe(binary: str, binary_hash: str) -> Capabilities:
+    version = subprocess.run([binary, "-version"], capture_output=True, text=True, timeout=30).stdout
+    caps = Capabilities(
+        binary_hash=binary_hash,
+        version=version.splitlines()[0] if version else "unknown",
+        encoders=_list(binary, "encoders"),
+        filters=_list(binary, "filters"),
+    )
+    if caps.has_encoder("libx264"):
+        try:
+            caps.x264_mpixels_single = round(_bench(binary, 1), 2)
+            caps.x264_mpixels_threaded = round(_bench(binary, 0), 2)
+        except (subprocess.SubprocessError, OSError) as exc:
+            logger.warning(f"FFmpeg throughput probe failed: {exc}")
+    return caps
+
+
+def _cpu_model() -> str:
+    """Modèle du processeur (/proc/cpuinfo sous Linux, sinon platform)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def load_capabilities() -> Capabilities | None:
+    """Capacités du FFmpeg du PATH : lues du cache, sinon sondées puis mises en cache."""
+    global _current
+    binary = shutil.which("ffmpeg")
+    if not binary:
+        logger.error("FFmpeg not found in PATH")
+        return None
+
+    binary_hash = file_digest(Path(os.path.realpath(binary)))
+    host_key = cache_key(binary_hash, os.cpu_count(), _cpu_model())
+    cached = load_json("capabilities", host_key)
+    if cached:
+        _current = Capabilities(**cached)
+        return _current
+
+    t0 = time.perf_counter()
+    _current = probe(binary, binary_hash)
+    store_json("capabilities", host_key, asdict(_current))
+    logger.info(f"FFmpeg capabilities probed in {time.perf_counter() - t0:.1f}s")
+    return _current
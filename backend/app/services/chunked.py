@@ -0,0 +1,113 @@
+"""Encodage découpé dans le temps : plusieurs processus x264 en parallèle, recollés sans réencodage.
+
+Un seul x264 sature mal plus de quelques cœurs. Pour une sortie longue, la
+timeline est découpée en chunks dont les bornes tombent sur des multiples du
+GOP ; chaque chunk est encodé par son propre process avec exactement les mêmes
+réglages (GOP fermé, keyframe en tête de chunk), puis les chunks sont
+concaténés en stream copy par le demuxer concat.
+"""
+
+import asyncio
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.config import settings
+from app.services import capabilities
+from app.services.ffmpeg import run_ffmpeg_async
+
+
+@dataclass(frozen=True)
+class Chunk:
+    index: int
+    start_frame: int
+    frames: int
+
+
+def plan_chunks(total_duration: float, fps: int, gop_frames: int, chunk_seconds: float) -> list[Chunk]:
+    """Découpe la timeline en chunks de ~chunk_seconds, longueur multiple de gop_frames."""
+    total_frames = max(1, round(total_duration * fps))
+    chunk_frames = max(1, round(chunk_seconds * fps / gop_frames)) * gop_frames
+    chunks = []
+    for start in range(0, total_frames, chunk_frames):
+        chunks.append(Chunk(len(chunks), start, min(chunk_frames, total_frames - start)))
+    # Un dernier chunk plus court qu'un GOP est rattaché au précédent
+    if len(chunks) > 1 and chunks[-1].frames < gop_frames:
+        last = chunks.pop()
+        prev = chunks.pop()
+        chunks.append(Chunk(prev.index, prev.start_frame, prev.frames + last.frames))
+    return chunks
+
+
+def encode_workers(chunk_count: int) -> tuple[int, int]:
+    """(processus en parallèle, threads par processus) pour chunk_count chunks."""
+    cpus = os.cpu_count() or 1
+    workers = settings.ENCODE_WORKERS
+    if not workers:
+        # Autant de process que de « paquets » de cœurs qu'un x264 sait réellement occuper
+        caps = capabilities.current()
+        cores = caps.x264_effective_cores if caps else None
+        workers = round(cpus / cores) if cores else cpus // 2
+    workers = max(1, min(workers, chunk_count))
+    return workers, max(1, cpus // workers)
+
+
+def use_chunked(total_duration: float) -> bool:
+    """Le mode découpé ne vaut le coup qu'au-delà de CHUNKED_ENCODE_MIN_SECONDS."""
+    return 0 < settings.CHUNKED_ENCODE_MIN_SECONDS <= total_duration
+
+
+async def encode_chunked(
+    source: Path,
+    dest: Path,
+    work_dir: Path,
+    video_filter: str,
+    codec_args: list[str],
+    fps: int,
+    gop_frames: int,
+    total_duration: float,
+    mux_inputs: list[str] | None = None,
+    mux_args: list[str] | None = None,
+    semaphore: asyncio.Semaphore | None = None,
+    desc: str = "chunked",
+) -> list[Chunk]:
+    """Encode la vidéo de source vers dest par chunks parallèles ; retourne le plan utilisé.
+
+    codec_args contient les réglages encodeur communs (-c:v, -preset, -crf...).
+    mux_inputs / mux_args sont ajoutés à la concaténation finale, qui copie
+    la vidéo (ex. ["-i", piste_audio] et ["-map", "1:a", "-c:a", "aac"]).
+    Un semaphore partagé permet de plafonner les processus entre plusieurs sorties.
+    """
+    chunks = plan_chunks(total_duration, fps, gop_frames, settings.CHUNK_SECONDS)
+    workers, threads = encode_workers(len(chunks))
+    semaphore = semaphore or asyncio.Semaphore(workers)
+    chunk_dir = work_dir / f"{dest.stem}_chunks"
+    chunk_dir.mkdir(exist_ok=True)
+    paths = [chunk_dir / f"chunk_{c.index:04d}.mp4" for c in chunks]
+
+    async def encode(chunk: Chunk, path: Path) -> None:
+        async with semaphore:
+            await run_ffmpeg_async(
+                ["-ss", f"{chunk.start_frame / fps:.6f}", "-i", str(source),
+                 "-frames:v", str(chunk.frames), "-an",
+                 "-vf", video_filter, "-r", str(fps),
+                 *codec_args,
+                 "-g", str(gop_frames), "-keyint_min", str(gop_frames), "-sc_threshold", "0",
+                 "-flags", "+cgop", "-threads", str(threads),
+                 str(path)],
+                desc=f"{desc} chunk {chunk.index + 1}/{len(chunks)}",
+            )
+
+    await asyncio.gather(*(encode(c, p) for c, p in zip(chunks, paths)))
+
+    concat_list = chunk_dir / "concat.txt"
+    concat_list.write_text("\n".join(f"file '{p.resolve()}'" for p in paths))
+    await run_ffmpeg_async(
+        ["-f", "concat", "-safe", "0", "-i", str(concat_list), *(mux_inputs or []),
+         "-map", "0:v", "-c:v", "copy", *(mux_args or []), str(dest)],
+        desc=f"{desc} concat",
+    )
+    shutil.rmtree(chunk_dir, ignore_errors=True)
+    return chunks
+
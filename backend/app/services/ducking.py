@@ -0,0 +1,119 @@
+"""Ducking hors ligne : enveloppe de gain calculée une fois en NumPy à partir de la voix off.
+
+Remplace sidechaincompress, évalué en direct à chaque rendu. La voix est
+analysée par trames de HOP_MS (RMS), la réduction de gain suit la courbe d'un
+compresseur (threshold/ratio) puis est lissée par deux limiteurs de pente
+vectorisés (attack à la montée, release à la descente). L'enveloppe est mise
+en cache par voix off et appliquée directement au mixage des stems PCM.
+"""
+
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from app.schemas.assemble import AudioConfig
+from app.services.cache import cache_path
+
+# Durée d'une trame d'analyse (ms)
+HOP_MS = 10
+
+# sidechain_attack / sidechain_release = temps (ms) pour parcourir SLEW_DB de réduction
+SLEW_DB = 20.0
+
+# Nombre de trames traitées par bloc lors de la lecture des PCM
+_BLOCK_HOPS = 4096
+
+
+def _hop_frames(sample_rate: int) -> int:
+    return max(1, sample_rate * HOP_MS // 1000)
+
+
+def frame_levels(pcm_path: Path, sample_rate: int, channels: int = 2) -> np.ndarray:
+    """RMS par trame d'un PCM float32 entrelacé, lu par blocs via memmap."""
+    samples = np.memmap(pcm_path, dtype=np.float32, mode="r")
+    hop = _hop_frames(sample_rate) * channels
+    n_hops = -(-samples.size // hop)
+    levels = np.empty(n_hops, dtype=np.float64)
+    for first in range(0, n_hops, _BLOCK_HOPS):
+        block = np.asarray(samples[first * hop:(first + _BLOCK_HOPS) * hop], dtype=np.float64)
+        pad = -block.size % hop
+        if pad:
+            block = np.concatenate([block, np.zeros(pad)])
+        frames = block.reshape(-1, hop)
+        levels[first:first + frames.shape[0]] = np.sqrt(np.mean(frames * frames, axis=1))
+    return levels
+
+
+def compute_envelope(levels: np.ndarray, ac: AudioConfig) -> np.ndarray:
+    """Convertit les niveaux RMS de la voix en gain linéaire (par trame) pour la musique."""
+    over_db = 20.0 * np.log10(np.maximum(levels, 1e-10) / ac.sidechain_threshold)
+    reduction = np.maximum(over_db, 0.0) * (1.0 - 1.0 / ac.sidechain_ratio)
+
+    idx = np.arange(reduction.size, dtype=np.float64)
+    attack_step = SLEW_DB * HOP_MS / max(ac.sidechain_attack, HOP_MS)
+    release_step = SLEW_DB * HOP_MS / max(ac.sidechain_release, HOP_MS)
+
+    # Attack : la réduction ne peut monter que de attack_step par trame
+    # y[n] = min_k<=n (x[k] + (n - k) * step), avec y[-1] = 0
+    attacked = np.minimum.accumulate(reduction - idx * attack_step) + idx * attack_step
+    attacked = np.minimum(attacked, (idx + 1) * attack_step)
+
+    # Release : la réduction ne peut descendre que de release_step par trame
+    # y[n] = max_k<=n (x[k] - (n - k) * step)
+    released = np.maximum.accumulate(attacked + idx * release_step) - idx * release_step
+
+    return np.power(10.0, -released / 20.0).astype(np.float32)
+
+
+def load_or_compute_envelope(
+    voice_pcm: Path,
+    ac: AudioConfig,
+    key: str,
+    sample_rate: int,
+) -> tuple[np.ndarray, bool]:
+    """Retourne (enveloppe, cache_hit) pour la voix off identifiée par key."""
+    path = cache_path("envelopes", key, ".npy")
+    if path.exists():
+        return np.load(path), True
+    envelope = compute_envelope(frame_levels(voice_pcm, sample_rate), ac)
+    tmp = path.with_suffix(".tmp.npy")
+    np.save(tmp, envelope)
+    tmp.replace(path)
+    return envelope, False
+
+
+def mix_ducked(
+    voice_pcm: Path,
+    music_pcm: Path,
+    envelope: np.ndarray,
+    dest: Path,
+    sample_rate: int,
+    channels: int = 2,
+) -> Path:
+    """Mixe voix + musique × enveloppe en un WAV 16 bits, bloc par bloc."""
+    voice = np.memmap(voice_pcm, dtype=np.float32, mode="r")
+    music = np.memmap(music_pcm, dtype=np.float32, mode="r")
+    total_frames = voice.size // channels
+    hop = _hop_frames(sample_rate)
+    hop_centers = (np.arange(envelope.size) + 0.5) * hop
+    block_frames = _BLOCK_HOPS * hop
+
+    with wave.open(str(dest), "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        for first in range(0, total_frames, block_frames):
+            last = min(first + block_frames, total_frames)
+            positions = np.arange(first, last, dtype=np.float64)
+            gain = np.interp(positions, hop_centers, envelope).astype(np.float32)
+
+            mixed = np.array(voice[first * channels:last * channels], dtype=np.float32)
+            bed = np.zeros_like(mixed)
+            music_block = music[first * channels:last * channels]
+            bed[:music_block.size] = music_block
+            mixed += (bed.reshape(-1, channels) * gain[:, None]).reshape(-1)
+
+            np.clip(mixed, -1.0, 1.0, out=mixed)
+            out.writeframesraw((mixed * 32767.0).astype("<i2").tobytes())
+    return dest
@@ -0,0 +1,107 @@
+"""Politique d'encodage : preset x264 et threads choisis selon la charge et l'échéance du job.
+
+Le preset demandé (VideoConfig.preset) est le plafond de qualité. Si le job a
+une échéance (deadline_seconds), on estime le temps restant pour chaque
+preset, du plus lent au plus rapide, à partir des débits mesurés sur les
+jobs précédents et des cœurs disponibles pour ce job (cœurs / jobs en cours
+et en attente), et on garde le premier qui tient l'échéance.
+"""
+
+import os
+from dataclasses import asdict, dataclass
+
+from app.schemas.assemble import AssembleRequest, VideoConfig
+from app.services import capabilities
+from app.services.cache import load_json, store_json
+from app.services.render_plan import X264_MPIXELS_PER_CPU_SECOND, RenderPlan
+
+# Du plus lent (meilleure qualité) au plus rapide
+PRESETS = list(reversed(X264_MPIXELS_PER_CPU_SECOND))
+# Poids d'une nouvelle mesure dans la moyenne glissante des débits
+THROUGHPUT_ALPHA = 0.3
+# Marge de sécurité sur l'estimation (uploads, variance des sources)
+DEADLINE_MARGIN = 1.2
+
+_HISTORY_KEY = "x264_throughput"
+
+
+@dataclass(frozen=True)
+class EncoderPolicy:
+    preset: str
+    threads: int
+    estimated_seconds: float | None
+    deadline_seconds: float | None
+    concurrent_jobs: int
+    reason: str
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def throughputs() -> dict[str, float]:
+    """Débit (mégapixels par seconde CPU) par preset.
+
+    Mesures des jobs passés, sinon table par défaut recalée sur le débit
+    1 thread mesuré au démarrage (capabilities) pour ce binaire FFmpeg.
+    """
+    measured = load_json("policy", _HISTORY_KEY) or {}
+    caps = capabilities.current()
+    scale = 1.0
+    if caps and caps.x264_mpixels_single:
+        scale = caps.x264_mpixels_single / X264_MPIXELS_PER_CPU_SECOND[capabilities.BENCH_PRESET]
+    return {
+        preset: measured.get(preset, default * scale)
+        for preset, default in X264_MPIXELS_PER_CPU_SECOND.items()
+    }
+
+
+def record_throughput(preset: str, mpixels: float, wall_seconds: float, threads: int) -> None:
+    """Ajoute une mesure d'encodage (mégapixels encodés, temps mur, threads utilisés)."""
+    if preset not in X264_MPIXELS_PER_CPU_SECOND or wall_seconds <= 0 or mpixels <= 0:
+        return
+    rate = mpixels / (wall_seconds * max(1, threads))
+    measured = load_json("policy", _HISTORY_KEY) or {}
+    previous = measured.get(preset)
+    measured[preset] = rate if previous is None else (1 - THROUGHPUT_ALPHA) * previous + THROUGHPUT_ALPHA * rate
+    store_json("policy", _HISTORY_KEY, measured)
+
+
+def _encode_mpixels(plan: RenderPlan, request: AssembleRequest, vc: VideoConfig) -> float:
+    """Mégapixels à encoder au preset de la politique (clips à normaliser + renditions sans preset)."""
+    total = 0.0
+    for node in plan.nodes.values():
+        if node.kind == "transcode" and not node.cached:
+            total += vc.width * vc.height * vc.fps * node.detail["target_seconds"] / 1e6
+    for r in request.renditions or []:
+        if r.preset is None:
+            total += r.width * r.height * vc.fps * plan.total_duration / 1e6
+    return total
+
+
+def choose_policy(
+    request: AssembleRequest,
+    vc: VideoConfig,
+    plan: RenderPlan,
+    concurrent_jobs: int,
+    remaining_seconds: float | None,
+) -> EncoderPolicy:
+    """Preset le plus lent (≤ preset demandé) qui tient l'échéance avec les cœurs disponibles."""
+    cpus = os.cpu_count() or 1
+    concurrent_jobs = max(1, concurrent_jobs)
+    threads = max(1, cpus // concurrent_jobs)
+    if remaining_seconds is None:
+        return EncoderPolicy(vc.preset, 0, None, None, concurrent_jobs, "pas d'échéance : preset demandé")
+
+    rates = throughputs()
+    mpixels = _encode_mpixels(plan, request, vc)
+    fixed = sum(n.cpu_seconds for n in plan.nodes.values() if n.kind not in ("transcode", "encode")) / threads
+    start = PRESETS.index(vc.preset) if vc.preset in PRESETS else PRESETS.index("medium")
+
+    estimate = None
+    for preset in PRESETS[start:]:
+        estimate = (fixed + mpixels / (rates[preset] * threads)) * DEADLINE_MARGIN
+        if estimate <= remaining_seconds:
+            reason = "preset demandé" if preset == vc.preset else f"accéléré pour tenir {remaining_seconds:.0f}s"
+            return EncoderPolicy(preset, threads, round(estimate, 1), remaining_seconds, concurrent_jobs, reason)
+    return EncoderPolicy(PRESETS[-1], threads, round(estimate, 1) if estimate else None, remaining_seconds,
+                         concurrent_jobs, "échéance inatteignable : preset le plus rapide")
@@ -0,0 +1,74 @@
+"""Helpers bas niveau autour des binaires FFmpeg / FFprobe."""
+
+import asyncio
+import logging
+import subprocess
+from pathlib import Path
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def run_ffmpeg(args: list[str], desc: str = "") -> None:
+    """Exécute une commande FFmpeg et lève une exception en cas d'erreur."""
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + args
+    logger.info(f"FFmpeg {desc}: {' '.join(cmd)}")
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg error ({desc}): {result.stderr.strip()}")
+
+
+async def start_ffmpeg(args: list[str], desc: str = "", stdin: bool = False) -> asyncio.subprocess.Process:
+    """Lance FFmpeg sans attendre sa fin ; avec stdin=True, l'entrée pipe:0 est alimentée par l'appelant."""
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + args
+    logger.info(f"FFmpeg {desc}: {' '.join(cmd)}")
+    return await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if stdin else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+
+async def wait_ffmpeg(proc: asyncio.subprocess.Process, desc: str = "", timeout: float = 600) -> None:
+    """Attend la fin d'un process lancé par start_ffmpeg (tué si timeout ou annulation)."""
+    try:
+        stderr = await asyncio.wait_for(proc.stderr.read(), timeout=timeout)
+        await proc.wait()
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        proc.kill()
+        await proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise RuntimeError(f"FFmpeg error ({desc}): {stderr.decode(errors='replace').strip()}")
+
+
+async def run_ffmpeg_async(args: list[str], desc: str = "", timeout: float = 600) -> None:
+    """Variante asynchrone de run_ffmpeg : le process tourne sans bloquer la boucle d'événements."""
+    await wait_ffmpeg(await start_ffmpeg(args, desc), desc, timeout)
+
+
+def get_duration(file_path: Path) -> float:
+    """Retourne la durée d'un fichier média en secondes."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", str(file_path)],
+        capture_output=True, text=True, timeout=30,
+    )
+    return float(result.stdout.strip())
+
+
+def decode_pcm(
+    src: Path,
+    dest: Path,
+    sample_rate: int,
+    channels: int = 2,
+    sample_fmt: str = "s16le",
+    audio_filter: str | None = None,
+) -> Path:
+    """Décode la piste audio de src en PCM brut (sans en-tête) vers dest."""
+    args = ["-i", str(src), "-vn"]
+    if audio_filter:
+        args += ["-af", audio_filter]
+    args += ["-ac", str(channels), "-ar", str(sample_rate), "-f", sample_fmt, str(dest)]
+    run_ffmpeg(args, desc=f"decode pcm {src.name}")
+    return dest
@@ -0,0 +1,106 @@
+"""Sortie HLS/CMAF : segments fMP4 publiés au fil de l'encodage final.
+
+FFmpeg réécrit la playlist (type EVENT) à chaque segment terminé : tant que
+l'encodage tourne, le publisher relit la playlist, uploade les segments
+qu'elle référence puis la playlist elle-même. Un client peut donc lancer la
+lecture dès le premier segment, bien avant la fin du MP4.
+"""
+
+import asyncio
+import logging
+import re
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from app.schemas.assemble import HlsConfig
+from app.services.job_logger import emit
+from app.services.supabase import upload_to_supabase
+
+logger = logging.getLogger("uvicorn.error")
+
+PLAYLIST_NAME = "playlist.m3u8"
+INIT_NAME = "init.mp4"
+
+_MAP_URI = re.compile(r'#EXT-X-MAP:URI="([^"]+)"')
+
+_CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+
+def hls_output_args(hls_dir: Path, config: HlsConfig) -> list[str]:
+    """Options de sortie FFmpeg (à placer après les -map / -c de la sortie)."""
+    return [
+        "-f", "hls",
+        "-hls_time", str(config.segment_seconds),
+        "-hls_playlist_type", "event",
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", INIT_NAME,
+        "-hls_segment_filename", str(hls_dir / "seg_%05d.m4s"),
+        str(hls_dir / PLAYLIST_NAME),
+    ]
+
+
+class HlsPublisher:
+    """Publie vers Supabase Storage les segments d'un dossier HLS en cours d'écriture."""
+
+    def __init__(
+        self,
+        job_id: str,
+        hls_dir: Path,
+        storage_prefix: str,
+        on_playlist: Callable[[str], Awaitable[None]] | None = None,
+        poll_interval: float = 0.5,
+    ):
+        self.job_id = job_id
+        self.hls_dir = hls_dir
+        self.storage_prefix = storage_prefix
+        self.on_playlist = on_playlist
+        self.poll_interval = poll_interval
+        self.playlist_url: str | None = None
+        self._uploaded: set[str] = set()
+        self._last_playlist: bytes = b""
+
+    async def _upload(self, name: str) -> str:
+        path = self.hls_dir / name
+        content_type = _CONTENT_TYPES.get(path.suffix, "application/octet-stream")
+        return await upload_to_supabase(path, f"{self.storage_prefix}/{name}", content_type)
+
+    async def publish_pending(self) -> None:
+        """Uploade les fichiers référencés par la playlist courante, puis la playlist."""
+        playlist = self.hls_dir / PLAYLIST_NAME
+        if not playlist.exists():
+            return
+        content = playlist.read_bytes()
+        if content == self._last_playlist:
+            return
+
+        text = content.decode()
+        names = _MAP_URI.findall(text)
+        names += [line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+        for name in names:
+            if name not in self._uploaded:
+                await self._upload(name)
+                self._uploaded.add(name)
+
+        url = await self._upload(PLAYLIST_NAME)
+        self._last_playlist = content
+        if self.playlist_url is None:
+            self.playlist_url = url
+            emit(self.job_id, "supabase", "info", f"Playlist HLS disponible : {url}")
+            if self.on_playlist:
+                await self.on_playlist(url)
+
+    async def follow(self, encode: asyncio.Task) -> None:
+        """Publie au fil de l'eau jusqu'à la fin de l'encodage, puis fait un dernier passage."""
+        while not encode.done():
+            await asyncio.wait({encode}, timeout=self.poll_interval)
+            try:
+                await self.publish_pending()
+            except Exception as exc:
+                # Réessayé au prochain tour : un upload raté ne doit pas interrompre l'encodage
+                logger.warning(f"HLS publish failed for job {self.job_id}: {exc}")
+        encode.result()
+        await self.publish_pending()
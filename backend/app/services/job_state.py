@@ -0,0 +1,178 @@
+"""État des jobs en mémoire : lectures de statut sans DB, écritures groupées vers la DB.
+
+Le cache garde un enregistrement compact (__slots__) par job récent : statut,
+étape en cours, URLs, timestamps. Une mise à jour est visible immédiatement
+pour les lecteurs (write-through en mémoire) et part vers la DB avec les
+autres changements en attente, en une seule transaction, au plus tard
+JOB_STATE_FLUSH_SECONDS après. Un job absent du cache (évincé, ou créé avant
+un redémarrage) est relu depuis la DB à la première demande.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.database import async_session
+from app.models.job import Job
+
+logger = logging.getLogger("uvicorn.error")
+
+# Colonnes gardées en mémoire (render_plan, preflight... ne font que transiter vers la DB)
+HOT_FIELDS = (
+    "status", "batch_id", "output_url", "renditions", "playlist_url", "previews",
+    "encoder_policy", "error_message", "created_at", "updated_at",
+)
+
+
+class JobState:
+    __slots__ = ("id", *HOT_FIELDS, "stage", "_etag")
+
+    def __init__(self, job_id: str, **fields):
+        self.id = job_id
+        for name in HOT_FIELDS:
+            setattr(self, name, fields.get(name))
+        self.stage = None
+        self._etag = None
+
+    @classmethod
+    def from_row(cls, job: Job) -> "JobState":
+        return cls(job.id, **{name: getattr(job, name) for name in HOT_FIELDS})
+
+    def apply(self, fields: dict) -> None:
+        for name, value in fields.items():
+            if name in HOT_FIELDS or name == "stage":
+                setattr(self, name, value)
+        self._etag = None
+
+    @property
+    def etag(self) -> str:
+        """ETag du statut exposé (change dès qu'un champ visible change)."""
+        if self._etag is None:
+            payload = json.dumps([getattr(self, name) for name in (*HOT_FIELDS, "stage")], default=str)
+            self._etag = f'"{hashlib.sha1(payload.encode()).hexdigest()[:16]}"'
+        return self._etag
+
+
+class JobStateCache:
+    """Cache LRU borné des états de job, avec write-back groupé des changements."""
+
+    def __init__(self, max_entries: int, flush_seconds: float):
+        self.max_entries = max_entries
+        self.flush_seconds = flush_seconds
+        self._states: OrderedDict[str, JobState] = OrderedDict()
+        # job_id → colonnes modifiées pas encore écrites en DB
+        self._pending: dict[str, dict] = {}
+        # Changements de la transaction en cours d'écriture
+        self._writing: dict[str, dict] = {}
+        self._flusher: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+
+    def put(self, state: JobState) -> JobState:
+        self._states[state.id] = state
+        self._states.move_to_end(state.id)
+        self._evict()
+        return state
+
+    def peek(self, job_id: str) -> JobState | None:
+        """État en mémoire, sans repli sur la DB."""
+        return self._states.get(job_id)
+
+    async def get(self, job_id: str) -> JobState | None:
+        """État du job : mémoire, sinon DB (puis mis en cache) ; None si inconnu.
+
+        Une ligne relue depuis la DB reçoit les changements pas encore écrits.
+        """
+        state = self._states.get(job_id)
+        if state is not None:
+            self._states.move_to_end(job_id)
+            return state
+        async with async_session() as db:
+            job = (await db.execute(select(Job).where(Job.id == job_id))).scalar_one_or_none()
+        if job is None:
+            return None
+        # Un changement a pu arriver pendant la lecture : la mémoire fait foi
+        state = self._states.get(job_id)
+        if state is None:
+            state = JobState.from_row(job)
+            state.apply({**self._writing.get(job_id, {}), **self._pending.get(job_id, {})})
+            self.put(state)
+        return state
+
+    def update(self, job_id: str, **fields) -> None:
+        """Applique les champs en mémoire et les met en attente d'écriture DB."""
+        fields["updated_at"] = datetime.utcnow()
+        state = self._states.get(job_id)
+        if state is not None:
+            state.apply(fields)
+            self._states.move_to_end(job_id)
+        self._pending.setdefault(job_id, {}).update(fields)
+        self._schedule()
+
+    def set_stage(self, job_id: str, stage: str | None) -> None:
+        """Étape en cours du pipeline (mémoire seulement, pas de colonne DB)."""
+        state = self._states.get(job_id)
+        if state is not None:
+            state.apply({"stage": stage})
+
+    def _schedule(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        while self._pending:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Écrit tous les changements en attente en une transaction (remis en attente si elle échoue)."""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            self._writing = pending
+            try:
+                async with async_session() as db:
+                    for job_id, fields in pending.items():
+                        await db.execute(update(Job).where(Job.id == job_id).values(**fields))
+                    await db.commit()
+            except BaseException as exc:
+                # Transaction échouée ou interrompue : les changements repassent en attente
+                for job_id, fields in pending.items():
+                    self._pending[job_id] = {**fields, **self._pending.get(job_id, {})}
+                if not isinstance(exc, Exception):
+                    raise
+                logger.warning(f"Job state flush failed ({len(pending)} jobs), will retry: {exc}")
+                self._schedule()
+                return
+            finally:
+                self._writing = {}
+        self._evict()
+
+    async def close(self) -> None:
+        """Arrêt : laisse finir une écriture en cours, puis écrit ce qui reste en attente."""
+        flusher, self._flusher = self._flusher, None
+        if flusher and not flusher.done():
+            # Sous le verrou, le flusher ne peut être qu'en attente : l'annuler ne perd rien
+            async with self._flush_lock:
+                flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
+        await self.flush()
+
+    def _evict(self) -> None:
+        """Retire les états les moins récemment utilisés au-delà de max_entries (sauf écritures en attente)."""
+        excess = len(self._states) - self.max_entries
+        for job_id in list(self._states):
+            if excess <= 0:
+                break
+            if job_id not in self._pending and job_id not in self._writing:
+                del self._states[job_id]
+                excess -= 1
+
+
+job_states = JobStateCache(settings.JOB_STATE_CACHE_SIZE, settings.JOB_STATE_FLUSH_SECONDS)
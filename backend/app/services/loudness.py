@@ -0,0 +1,63 @@
+"""Mesure de loudness EBU R128 par asset source, mise en cache par hash de contenu.
+
+La mesure (premier passage loudnorm) n'est faite qu'une fois par fichier :
+les jobs suivants qui réutilisent la même voix off ou la même musique lisent
+le résultat en cache et le mixage final applique un simple gain linéaire.
+"""
+
+import json
+import logging
+import math
+import subprocess
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from app.services.cache import file_digest, load_json, store_json
+
+logger = logging.getLogger("uvicorn.error")
+
+
+@dataclass(frozen=True)
+class LoudnessStats:
+    integrated_lufs: float
+    true_peak_dbtp: float
+    lra: float
+
+
+def measure_loudness(path: Path) -> LoudnessStats:
+    """Analyse loudnorm (print_format=json) de la piste audio du fichier."""
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-i", str(path), "-vn",
+           "-af", "loudnorm=print_format=json", "-f", "null", "-"]
+    logger.info(f"FFmpeg loudness {path.name}: {' '.join(cmd)}")
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg error (loudness {path.name}): {result.stderr.strip()[-500:]}")
+
+    stderr = result.stderr
+    data = json.loads(stderr[stderr.rindex("{"):stderr.rindex("}") + 1])
+    return LoudnessStats(
+        integrated_lufs=float(data["input_i"]),
+        true_peak_dbtp=float(data["input_tp"]),
+        lra=float(data["input_lra"]),
+    )
+
+
+def cached_loudness(path: Path, digest: str | None = None) -> tuple[LoudnessStats, bool]:
+    """Retourne (mesure, cache_hit) pour le contenu de path (digest fourni s'il est connu)."""
+    key = digest or file_digest(path)
+    cached = load_json("loudness", key)
+    if cached is not None:
+        return LoudnessStats(**cached), True
+    stats = measure_loudness(path)
+    store_json("loudness", key, asdict(stats))
+    return stats, False
+
+
+def normalization_gain(stats: LoudnessStats, target_lufs: float, target_true_peak: float) -> float:
+    """Gain linéaire amenant l'asset à target_lufs sans dépasser target_true_peak."""
+    if not math.isfinite(stats.integrated_lufs):
+        return 1.0  # Silence : rien à normaliser
+    gain_db = target_lufs - stats.integrated_lufs
+    if math.isfinite(stats.true_peak_dbtp):
+        gain_db = min(gain_db, target_true_peak - stats.true_peak_dbtp)
+    return 10 ** (gain_db / 20)
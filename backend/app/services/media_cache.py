@@ -0,0 +1,296 @@
+"""Cache disque des médias : téléchargements, probes et clips normalisés.
+
+Chaque entrée est produite au plus une fois, même si plusieurs jobs la
+demandent en même temps (verrou par clé). Les fichiers sont écrits sous un
+nom temporaire puis renommés : une entrée présente est toujours complète.
+Le mtime est rafraîchi à chaque accès pour l'éviction LRU (prune_cache).
+
+Un téléchargement est indexé par URL : avant de le réutiliser, ses
+validateurs HTTP (ETag, Last-Modified, taille) sont comparés à ceux du
+serveur, au plus une fois par DOWNLOAD_REVALIDATE_SECONDS. Un média remplacé
+à la même URL est donc retéléchargé, et les entrées dérivées (indexées par
+empreinte du contenu) suivent d'elles-mêmes.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator
+from urllib.parse import urlparse
+
+import httpx
+
+from app.config import settings
+from app.services.cache import CACHE_DIR, cache_key, cache_path, load_json, store_json
+from app.services.ffmpeg import get_duration, run_ffmpeg_async
+from app.services.preflight import remote_duration
+
+logger = logging.getLogger("uvicorn.error")
+
+# Namespaces qui ne sont pas des médias : petits, et coûteux à reconstituer (jamais purgés)
+PERSISTENT_NAMESPACES = ("capabilities", "policy")
+
+# Un fichier .part plus ancien a été abandonné (process tué) : prune_cache le supprime
+STALE_PART_SECONDS = 3600
+
+# Chemins que prune_cache ne doit pas supprimer (assets d'un batch en cours) → nombre de détenteurs
+_pinned: dict[Path, int] = {}
+
+# clé → [verrou, nombre d'utilisateurs] ; l'entrée disparaît quand plus personne ne l'attend
+_locks: dict[str, list] = {}
+
+
+@asynccontextmanager
+async def _key_lock(key: str) -> AsyncIterator[None]:
+    entry = _locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _locks.pop(key, None)
+
+
+def _touch(path: Path) -> None:
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _download_paths(url: str) -> tuple[str, Path, Path]:
+    """(clé, fichier, meta JSON) du téléchargement de url dans le cache."""
+    key = cache_key("download", url)
+    suffix = PurePosixPath(urlparse(url).path).suffix[:8] or ".bin"
+    return key, cache_path("downloads", key, suffix), cache_path("downloads", key, ".json")
+
+
+@contextmanager
+def pin_downloads(urls: Iterable[str]) -> Iterator[None]:
+    """Protège de prune_cache les téléchargements de urls (fichier et meta) pendant le bloc."""
+    paths = [path for url in urls for path in _download_paths(url)[1:]]
+    for path in paths:
+        _pinned[path] = _pinned.get(path, 0) + 1
+    try:
+        yield
+    finally:
+        for path in paths:
+            _pinned[path] -= 1
+            if not _pinned[path]:
+                del _pinned[path]
+
+
+@dataclass(frozen=True)
+class CachedFile:
+    path: Path
+    digest: str
+
+
+def _validators(resp: httpx.Response) -> dict:
+    """ETag, Last-Modified et taille totale annoncés par une réponse (complète ou partielle)."""
+    size = None
+    content_range = resp.headers.get("content-range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        size = int(content_range.rsplit("/", 1)[1])
+    elif resp.status_code == 200 and "content-length" in resp.headers:
+        size = int(resp.headers["content-length"])
+    return {
+        "etag": resp.headers.get("etag"),
+        "last_modified": resp.headers.get("last-modified"),
+        "size": size,
+    }
+
+
+async def _remote_validators(url: str) -> dict | None:
+    """Validateurs actuels de url (HEAD, ou GET d'un octet si HEAD est refusé) ; None si injoignable."""
+    try:
+        async with httpx.AsyncClient(timeout=10, follow_redirects=True, verify=False) as client:
+            resp = await client.head(url)
+            if resp.status_code in (403, 405, 501):
+                resp = await client.get(url, headers={"Range": "bytes=0-0"})
+            resp.raise_for_status()
+            return _validators(resp)
+    except (httpx.HTTPError, ValueError) as exc:
+        logger.warning(f"Revalidation failed for {url}, using cached copy: {exc}")
+        return None
+
+
+def _unchanged(meta: dict, remote: dict) -> bool:
+    """Le contenu en cache correspond-il encore au serveur ? Compare le validateur le plus fort disponible."""
+    for name in ("etag", "last_modified", "size"):
+        if meta.get(name) is not None and remote.get(name) is not None:
+            return meta[name] == remote[name]
+    return True  # Aucun validateur comparable : rien ne permet de conclure à un changement
+
+
+async def _fresh(meta: dict, url: str, key: str) -> bool:
+    """Le téléchargement décrit par meta peut-il être réutilisé ? Revalide auprès du serveur si besoin."""
+    if time.time() - meta.get("checked_at", 0) < settings.DOWNLOAD_REVALIDATE_SECONDS:
+        return True
+    remote = await _remote_validators(url)
+    if remote is None:
+        return True
+    if not _unchanged(meta, remote):
+        logger.info(f"Cached download outdated, fetching again: {url}")
+        return False
+    store_json("downloads", key, {**meta, "checked_at": time.time()})
+    return True
+
+
+async def cached_download(
+    url: str,
+    on_chunk: Callable[[bytes], Awaitable[None]] | None = None,
+) -> tuple[CachedFile, bool]:
+    """Télécharge url dans le cache (une seule fois) ; retourne (fichier, cache_hit).
+
+    on_chunk reçoit chaque bloc au fil du transfert (jamais appelé en cas de cache hit).
+    Une copie en cache est revalidée auprès du serveur avant réutilisation.
+    """
+    key, dest, _ = _download_paths(url)
+
+    async with _key_lock(key):
+        meta = load_json("downloads", key)
+        if meta and dest.exists() and await _fresh(meta, url, key):
+            _touch(dest)
+            return CachedFile(dest, meta["digest"]), True
+
+        tmp = dest.with_suffix(dest.suffix + ".part")
+        h = hashlib.sha256()
+        try:
+            async with httpx.AsyncClient(timeout=120, follow_redirects=True, verify=False) as client:
+                async with client.stream("GET", url) as resp:
+                    resp.raise_for_status()
+                    validators = _validators(resp)
+                    with open(tmp, "wb") as f:
+                        async for chunk in resp.aiter_bytes(chunk_size=65536):
+                            f.write(chunk)
+                            h.update(chunk)
+                            if on_chunk:
+                                await on_chunk(chunk)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        tmp.replace(dest)
+        store_json("downloads", key, {
+            "url": url,
+            "digest": h.hexdigest(),
+            **validators,
+            "size": dest.stat().st_size,
+            "checked_at": time.time(),
+        })
+        return CachedFile(dest, h.hexdigest()), False
+
+
+def cached_duration(source: CachedFile, url: str | None = None) -> float:
+    """Durée du média, sondée une seule fois par contenu (ou reprise du pré-vol de url)."""
+    probe = load_json("probes", source.digest)
+    if probe is None:
+        duration = remote_duration(url, source.path.stat().st_size) if url else None
+        probe = {"duration": duration if duration is not None else get_duration(source.path)}
+        store_json("probes", source.digest, probe)
+    return probe["duration"]
+
+
+def lookup_output(namespace: str, keys: list[str], suffix: str) -> tuple[str, Path] | None:
+    """Première entrée déjà présente parmi keys (rafraîchie pour le LRU) ; None si aucune."""
+    for key in keys:
+        path = cache_path(namespace, key, suffix)
+        if path.exists():
+            _touch(path)
+            return key, path
+    return None
+
+
+async def cached_ffmpeg_output(
+    namespace: str,
+    key: str,
+    suffix: str,
+    args_for: Callable[[Path], list[str]],
+    desc: str,
+    on_produced: Callable[[float], None] | None = None,
+) -> tuple[Path, bool]:
+    """Produit (une seule fois) la sortie FFmpeg identifiée par key ; retourne (chemin, cache_hit).
+
+    args_for reçoit le chemin temporaire où FFmpeg doit écrire. on_produced
+    reçoit la durée du seul process FFmpeg (attente du verrou exclue), quand
+    la sortie a été produite ici.
+    """
+    dest = cache_path(namespace, key, suffix)
+    async with _key_lock(f"{namespace}/{key}"):
+        if dest.exists():
+            _touch(dest)
+            return dest, True
+        tmp = dest.with_name(f"{dest.stem}.part{suffix}")
+        t0 = time.perf_counter()
+        try:
+            await run_ffmpeg_async(args_for(tmp), desc=desc)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        if on_produced:
+            on_produced(time.perf_counter() - t0)
+        tmp.replace(dest)
+        return dest, False
+
+
+async def store_ffmpeg_output(namespace: str, key: str, suffix: str, produced: Path) -> tuple[Path, bool]:
+    """Range dans le cache une sortie produite hors de cached_ffmpeg_output ; retourne (chemin, cache_hit).
+
+    Si un autre job a produit la même entrée entre-temps, produced est supprimé.
+    """
+    dest = cache_path(namespace, key, suffix)
+    async with _key_lock(f"{namespace}/{key}"):
+        if dest.exists():
+            produced.unlink(missing_ok=True)
+            _touch(dest)
+            return dest, True
+        produced.replace(dest)
+        return dest, False
+
+
+def prune_cache(max_bytes: int) -> int:
+    """Supprime les entrées les moins récemment utilisées au-delà de max_bytes ; retourne l'espace libéré.
+
+    Les namespaces de PERSISTENT_NAMESPACES ne sont ni comptés ni supprimés ;
+    les entrées épinglées (pin_downloads) sont comptées mais jamais supprimées.
+    Les fichiers .part en cours d'écriture sont comptés ; ceux qui n'ont pas
+    bougé depuis STALE_PART_SECONDS sont des restes abandonnés, supprimés.
+    """
+    entries = []
+    total = 0
+    freed = 0
+    stale_before = time.time() - STALE_PART_SECONDS
+    for path in CACHE_DIR.rglob("*"):
+        if path.relative_to(CACHE_DIR).parts[0] in PERSISTENT_NAMESPACES or not path.is_file():
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if ".part" in path.name:
+            if stat.st_mtime < stale_before:
+                path.unlink(missing_ok=True)
+                freed += stat.st_size
+            else:
+                total += stat.st_size
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in _pinned:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+        freed += size
+    if freed:
+        logger.info(f"Cache pruned: {freed / 1e6:.0f} MB freed")
+    return freed
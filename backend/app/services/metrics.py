@@ -0,0 +1,58 @@
+"""Mesures par étape du pipeline : temps mur, CPU (process + enfants FFmpeg), pic RSS.
+
+Le pic RSS vient de getrusage : c'est un maximum sur toute la vie du process
+(et de tous ses enfants terminés), pas un pic propre à l'étape. Il est donc
+exposé sous le nom lifetime_peak_rss_mb.
+
+Le CPU des enfants n'est compté qu'à leur fin (wait) : avec plusieurs jobs en
+parallèle, il est attribué à l'étape du job qui se termine, les chiffres par
+étape ne sont donc exacts qu'en exécution isolée (benchmarks).
+"""
+
+import resource
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.services.job_state import job_states
+
+# job_id → liste d'étapes mesurées, vidée par pop_stages()
+_stages: dict[str, list[dict]] = {}
+
+
+def _cpu_seconds() -> float:
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def lifetime_peak_rss_mb() -> dict[str, float]:
+    """Pic RSS (Mo) depuis le démarrage : du process, et du plus gros process enfant terminé."""
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+@contextmanager
+def stage(job_id: str, name: str) -> Iterator[None]:
+    """Mesure le bloc et l'ajoute aux étapes du job."""
+    cpu_before = _cpu_seconds()
+    t0 = time.perf_counter()
+    job_states.set_stage(job_id, name)
+    try:
+        yield
+    finally:
+        _stages.setdefault(job_id, []).append({
+            "stage": name,
+            "wall_s": round(time.perf_counter() - t0, 3),
+            "cpu_s": round(_cpu_seconds() - cpu_before, 3),
+            "lifetime_peak_rss_mb": lifetime_peak_rss_mb(),
+        })
+
+
+def pop_stages(job_id: str) -> list[dict]:
+    """Retourne et oublie les étapes mesurées pour ce job."""
+    return _stages.pop(job_id, [])
@@ -0,0 +1,197 @@
+"""Pré-vol des médias distants : validation d'une requête avant tout travail des workers.
+
+Pour chaque URL (clips, voix off, musique) : HEAD (ou GET d'un octet si HEAD
+est refusé) puis ffprobe directement sur l'URL, qui ne lit que l'en-tête et
+l'index du conteneur via des requêtes Range. Les durées obtenues sont mises
+en cache (avec la taille du fichier) et réutilisées par le pipeline après
+téléchargement : un média validé n'est pas sondé une deuxième fois.
+
+Seules les URLs http(s) sont acceptées, et ffprobe est limité aux protocoles
+réseau correspondants : une URL ne peut pas lui faire lire un fichier local
+ni ouvrir d'autres protocoles (concat:, subfile:, playlists pointant ailleurs).
+"""
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+import httpx
+
+from app.schemas.assemble import AssembleRequest
+from app.services.cache import cache_key, load_json, store_json
+
+logger = logging.getLogger("uvicorn.error")
+
+ALLOWED_SCHEMES = ("http", "https")
+# Protocoles qu'ffprobe peut ouvrir, y compris pour les ressources référencées par le média
+FFPROBE_PROTOCOLS = "http,https,tcp,tls"
+MAX_PARALLEL_PROBES = 8
+PROBE_TIMEOUT = 30
+# Facteur de vitesse au-delà duquel un clip est signalé (accéléré ou ralenti)
+SPEED_WARNING_FACTOR = 4.0
+# Tolérance sur la fin des segments voix off (arrondis d'encodage)
+SEGMENT_TOLERANCE_SECONDS = 0.05
+
+
+@dataclass
+class RemoteProbe:
+    url: str
+    status: int | None = None
+    size: int | None = None
+    duration: float | None = None
+    has_video: bool = False
+    has_audio: bool = False
+    error: str | None = None
+
+
+@dataclass
+class PreflightReport:
+    errors: list[str] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+    probes: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def to_dict(self) -> dict:
+        return {"ok": self.ok, "errors": self.errors, "warnings": self.warnings, "probes": self.probes}
+
+
+def _remote_key(url: str) -> str:
+    return cache_key("remote", url)
+
+
+def remote_duration(url: str, size: int | None = None) -> float | None:
+    """Durée sondée au pré-vol pour url (si size est fourni, seulement si la taille correspond)."""
+    probe = load_json("remote_probes", _remote_key(url))
+    if not probe or (size is not None and probe["size"] is not None and probe["size"] != size):
+        return None
+    return probe["duration"]
+
+
+async def _head(client: httpx.AsyncClient, url: str, probe: RemoteProbe) -> None:
+    resp = await client.head(url)
+    if resp.status_code in (403, 405, 501):
+        # HEAD non supporté (URLs signées S3 notamment) : GET du premier octet
+        resp = await client.get(url, headers={"Range": "bytes=0-0"})
+        total = resp.headers.get("content-range", "").rpartition("/")[2]
+        probe.size = int(total) if total.isdigit() else None
+    else:
+        length = resp.headers.get("content-length")
+        probe.size = int(length) if length and length.isdigit() else None
+    probe.status = resp.status_code
+    if resp.status_code >= 400:
+        probe.error = f"HTTP {resp.status_code}"
+
+
+async def _ffprobe(probe: RemoteProbe) -> None:
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-protocol_whitelist", FFPROBE_PROTOCOLS, "-show_entries", "format=duration:stream=codec_type",
+            "-of", "json", probe.url,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        probe.error = "ffprobe introuvable"
+        return
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        probe.error = "ffprobe timeout"
+        return
+    if proc.returncode != 0:
+        probe.error = f"ffprobe : {stderr.decode(errors='replace').strip()[:200]}"
+        return
+    data = json.loads(stdout or b"{}")
+    types = {s.get("codec_type") for s in data.get("streams", [])}
+    probe.has_video = "video" in types
+    probe.has_audio = "audio" in types
+    try:
+        probe.duration = float(data.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        probe.duration = None
+
+
+async def probe_remote(client: httpx.AsyncClient, url: str) -> RemoteProbe:
+    """HEAD + ffprobe distant ; le résultat valide est mis en cache pour le pipeline."""
+    probe = RemoteProbe(url=url)
+    scheme = urlparse(url).scheme.lower()
+    if scheme not in ALLOWED_SCHEMES:
+        probe.error = f"schéma d'URL non autorisé ({scheme or 'aucun'}), http(s) attendu"
+        return probe
+    try:
+        await _head(client, url, probe)
+    except httpx.HTTPError as exc:
+        probe.error = f"injoignable ({exc.__class__.__name__})"
+    if probe.error:
+        return probe
+    await _ffprobe(probe)
+    if probe.duration:
+        store_json("remote_probes", _remote_key(url), {"duration": probe.duration, "size": probe.size})
+    return probe
+
+
+async def run_preflight(request: AssembleRequest) -> PreflightReport:
+    """Sonde toutes les URLs de la requête en parallèle et vérifie leur cohérence avec le montage."""
+    urls = list(dict.fromkeys(
+        [c.video_url for c in request.clips]
+        + [u for u in (request.voiceover_url, request.music_url) if u]
+    ))
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_PROBES)
+    async with httpx.AsyncClient(timeout=PROBE_TIMEOUT, follow_redirects=True, verify=False) as client:
+        async def bounded(url: str) -> RemoteProbe:
+            async with semaphore:
+                return await probe_remote(client, url)
+
+        probes = {p.url: p for p in await asyncio.gather(*(bounded(u) for u in urls))}
+
+    report = PreflightReport(probes={url: p.duration for url, p in probes.items() if p.duration})
+
+    for clip in sorted(request.clips, key=lambda c: c.index):
+        p = probes[clip.video_url]
+        label = f"Clip {clip.index} ({clip.video_url})"
+        if p.error:
+            report.errors.append(f"{label} : {p.error}")
+        elif not p.has_video:
+            report.errors.append(f"{label} : aucune piste vidéo")
+        elif not p.duration or p.duration <= 0:
+            report.errors.append(f"{label} : durée nulle ou illisible")
+        else:
+            speed = p.duration / clip.duree_secondes
+            if speed > SPEED_WARNING_FACTOR or speed < 1 / SPEED_WARNING_FACTOR:
+                report.warnings.append(
+                    f"{label} : {p.duration:.1f}s ramenés à {clip.duree_secondes:.1f}s (vitesse x{speed:.2f})"
+                )
+
+    for url, label in ((request.voiceover_url, "Voix off"), (request.music_url, "Musique")):
+        if not url:
+            continue
+        p = probes[url]
+        if p.error:
+            report.errors.append(f"{label} ({url}) : {p.error}")
+        elif not p.has_audio:
+            report.errors.append(f"{label} ({url}) : aucune piste audio")
+
+    vo = probes.get(request.voiceover_url) if request.voiceover_url else None
+    if vo and vo.duration:
+        timeline = sum(c.duree_secondes for c in request.clips)
+        for i, seg in enumerate(request.voiceover_segments or []):
+            if seg.in_seconds >= seg.out_seconds:
+                report.errors.append(f"Segment {i + 1} : in_seconds doit être inférieur à out_seconds")
+            elif seg.out_seconds > vo.duration + SEGMENT_TOLERANCE_SECONDS:
+                report.errors.append(
+                    f"Segment {i + 1} : out_seconds={seg.out_seconds}s au-delà de la voix off ({vo.duration:.2f}s)"
+                )
+            if seg.start_seconds >= timeline:
+                report.warnings.append(
+                    f"Segment {i + 1} : démarre à {seg.start_seconds}s, après la fin de la vidéo ({timeline:.1f}s)"
+                )
+
+    logger.info(f"Preflight {request.hotel_id}: {len(urls)} URLs, "
+                f"{len(report.errors)} errors, {len(report.warnings)} warnings")
+    return report
@@ -0,0 +1,104 @@
+"""Poster, vignettes et planche de sprites produits dans le passage final.
+
+Les images sont des sorties supplémentaires du même graphe de filtres que la
+vidéo finale : une branche du split est filtrée par select (numéros de frame
+calculés ici), puis mise à l'échelle et assemblée en planche par tile. L'index
+WebVTT est écrit en Python à partir du même plan.
+"""
+
+import math
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.schemas.assemble import PreviewConfig, VideoConfig
+
+POSTER_NAME = "poster.jpg"
+THUMB_PATTERN = "thumb_%03d.jpg"
+SPRITE_NAME = "sprite.jpg"
+VTT_NAME = "thumbnails.vtt"
+
+
+@dataclass(frozen=True)
+class PreviewPlan:
+    poster_frame: int
+    frames: list[int]
+    total_duration: float
+    thumb_width: int
+    thumb_height: int
+    columns: int
+    rows: int
+
+
+def plan_previews(config: PreviewConfig, total_duration: float, vc: VideoConfig) -> PreviewPlan:
+    """Calcule les frames à extraire : vignettes au centre de N intervalles égaux."""
+    last_frame = max(0, math.floor(total_duration * vc.fps) - 1)
+    count = config.thumbnails
+    frames = sorted({
+        min(last_frame, round((i + 0.5) * total_duration / count * vc.fps)) for i in range(count)
+    })
+    poster_seconds = config.poster_seconds if config.poster_seconds is not None else min(1.0, total_duration / 2)
+    thumb_height = max(2, round(config.thumbnail_width * vc.height / vc.width / 2) * 2)
+    columns = min(config.sprite_columns, len(frames))
+    return PreviewPlan(
+        poster_frame=min(last_frame, round(poster_seconds * vc.fps)),
+        frames=frames,
+        total_duration=total_duration,
+        thumb_width=config.thumbnail_width,
+        thumb_height=thumb_height,
+        columns=columns,
+        rows=math.ceil(len(frames) / columns),
+    )
+
+
+def preview_graph(plan: PreviewPlan, input_label: str, out_dir: Path) -> tuple[list[str], list[str]]:
+    """Retourne (chaînes filter_complex, options de sortie) pour une branche vidéo décodée."""
+    select = "+".join(f"eq(n,{n})" for n in plan.frames)
+    chains = [
+        f"{input_label}split=2[pv_poster_in][pv_thumbs_in]",
+        f"[pv_poster_in]select='eq(n,{plan.poster_frame})'[pv_poster]",
+        f"[pv_thumbs_in]select='{select}',scale={plan.thumb_width}:{plan.thumb_height},"
+        f"setsar=1,split=2[pv_thumbs][pv_sprite_in]",
+        f"[pv_sprite_in]tile={plan.columns}x{plan.rows}[pv_sprite]",
+    ]
+    outputs = [
+        "-map", "[pv_poster]", "-frames:v", "1", "-q:v", "2", str(out_dir / POSTER_NAME),
+        "-map", "[pv_thumbs]", "-fps_mode", "vfr", "-q:v", "4", str(out_dir / THUMB_PATTERN),
+        "-map", "[pv_sprite]", "-frames:v", "1", "-q:v", "4", str(out_dir / SPRITE_NAME),
+    ]
+    return chains, outputs
+
+
+def _timestamp(seconds: float) -> str:
+    ms = round(seconds * 1000)
+    hours, ms = divmod(ms, 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    secs, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{ms:03d}"
+
+
+def write_vtt(plan: PreviewPlan, dest: Path, sprite_url: str = SPRITE_NAME) -> Path:
+    """Index WebVTT : chaque intervalle pointe vers sa vignette dans la planche (#xywh)."""
+    count = len(plan.frames)
+    step = plan.total_duration / count
+    lines = ["WEBVTT", ""]
+    for i in range(count):
+        x = (i % plan.columns) * plan.thumb_width
+        y = (i // plan.columns) * plan.thumb_height
+        end = plan.total_duration if i == count - 1 else (i + 1) * step
+        lines += [
+            f"{_timestamp(i * step)} --> {_timestamp(end)}",
+            f"{sprite_url}#xywh={x},{y},{plan.thumb_width},{plan.thumb_height}",
+            "",
+        ]
+    dest.write_text("\n".join(lines))
+    return dest
+
+
+def collect_previews(out_dir: Path) -> dict[str, Path | list[Path]]:
+    """Fichiers produits, dans l'ordre attendu par le résultat du job."""
+    return {
+        "poster": out_dir / POSTER_NAME,
+        "thumbnails": sorted(out_dir.glob("thumb_*.jpg")),
+        "sprite": out_dir / SPRITE_NAME,
+        "vtt": out_dir / VTT_NAME,
+    }
@@ -0,0 +1,77 @@
+"""Rendu incrémental : comparaison d'un montage avec le rendu précédent du même hôtel.
+
+La réutilisation effective passe par le cache média (clips normalisés et
+piste audio adressés par contenu) ; ce module garde le manifeste du dernier
+rendu par hotel_id pour expliquer ce qui change et mesurer le travail évité.
+"""
+
+from dataclasses import dataclass, field
+
+from app.services.cache import cache_key, load_json, store_json
+
+
+@dataclass
+class RenderManifest:
+    clip_keys: list[str]
+    clip_seconds: list[float]
+    audio_signature: str | None  # clé de la piste audio (audio_cache_key)
+    total_duration: float
+
+
+@dataclass
+class RenderDiff:
+    previous: RenderManifest | None
+    unchanged_clips: list[int] = field(default_factory=list)
+    changed_clips: list[int] = field(default_factory=list)
+    removed_clips: int = 0
+
+    def describe(self) -> str:
+        if self.previous is None:
+            return "Aucun rendu précédent pour cet hôtel : rendu complet"
+        total = len(self.unchanged_clips) + len(self.changed_clips)
+        parts = [f"{len(self.unchanged_clips)}/{total} clips inchangés"]
+        if self.changed_clips:
+            parts.append("à refaire : " + ", ".join(str(i + 1) for i in self.changed_clips))
+        if self.removed_clips:
+            parts.append(f"{self.removed_clips} clip(s) retiré(s)")
+        return "Diff avec le rendu précédent : " + ", ".join(parts)
+
+
+def _manifest_key(hotel_id: str, quality: str) -> str:
+    return cache_key("render", hotel_id, quality)
+
+
+def load_previous(hotel_id: str, quality: str) -> RenderManifest | None:
+    data = load_json("renders", _manifest_key(hotel_id, quality))
+    return RenderManifest(**data) if data else None
+
+
+def store_manifest(hotel_id: str, quality: str, manifest: RenderManifest) -> None:
+    store_json("renders", _manifest_key(hotel_id, quality), manifest.__dict__)
+
+
+def diff_clips(previous: RenderManifest | None, clip_keys: list[str]) -> RenderDiff:
+    """Classe chaque clip du nouveau montage (par clé de normalisation) en inchangé / à refaire."""
+    diff = RenderDiff(previous=previous)
+    if previous is None:
+        diff.changed_clips = list(range(len(clip_keys)))
+        return diff
+    known = set(previous.clip_keys)
+    for i, key in enumerate(clip_keys):
+        (diff.unchanged_clips if key in known else diff.changed_clips).append(i)
+    diff.removed_clips = len(known - set(clip_keys))
+    return diff
+
+
+def reuse_summary(clip_hits: list[bool], clip_seconds: list[float], audio_hit: bool | None) -> dict:
+    """Travail effectivement réutilisé (hits du cache) pendant le rendu."""
+    reused_seconds = sum(s for s, hit in zip(clip_seconds, clip_hits) if hit)
+    total_seconds = sum(clip_seconds)
+    return {
+        "clips_reused": sum(clip_hits),
+        "clips_total": len(clip_hits),
+        "video_seconds_reused": round(reused_seconds, 2),
+        "video_seconds_total": round(total_seconds, 2),
+        "video_reuse_ratio": round(reused_seconds / total_seconds, 3) if total_seconds else 0.0,
+        "audio_reused": audio_hit,
+    }
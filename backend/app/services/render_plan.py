@@ -0,0 +1,318 @@
+"""Compilation d'un AssembleRequest en plan de rendu explicite (DAG) et exécuteur parallèle.
+
+Le plan liste les nœuds download / probe / transcode / concat / mix / mux /
+encode avec leurs dépendances, leur clé de cache (quand elle est calculable
+sans rien télécharger) et un coût CPU estimé. Il sert à la fois d'estimation
+(POST /assemble/plan, sans rien exécuter) et de graphe d'exécution : chaque
+nœud démarre dès que ses dépendances sont terminées.
+
+Les coûts sont des ordres de grandeur (secondes CPU d'un cœur) tirés des
+débits x264 par preset ; un nœud dont la sortie est déjà en cache coûte 0.
+"""
+
+import asyncio
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable
+
+from app.schemas.assemble import AssembleRequest, AudioConfig, Clip, VideoConfig
+from app.services.cache import cache_key, cache_path, load_json
+from app.services.chunked import use_chunked
+from app.services.preflight import remote_duration
+from app.services.streaming import pipe_concat
+
+# Débit x264 (mégapixels encodés par seconde CPU) par preset
+X264_MPIXELS_PER_CPU_SECOND = {
+    "ultrafast": 60.0,
+    "superfast": 40.0,
+    "veryfast": 28.0,
+    "faster": 18.0,
+    "fast": 13.0,
+    "medium": 9.0,
+    "slow": 5.0,
+    "slower": 2.5,
+    "veryslow": 1.2,
+}
+DECODE_MPIXELS_PER_CPU_SECOND = 200.0
+# Audio : décodage PCM + enveloppe NumPy, par seconde de timeline
+AUDIO_CPU_PER_SECOND = 0.02
+# Hypothèse de résolution source quand le clip n'a jamais été sondé
+DEFAULT_SOURCE_PIXELS = 1920 * 1080
+
+
+def normalized_clip_key(digest: str, clip: Clip, vc: VideoConfig, gop: list[str], ac: AudioConfig) -> str:
+    """Clé de cache du clip normalisé (vitesse + résolution + audio réencodé)."""
+    return cache_key(
+        "normalized", digest, clip.duree_secondes, vc.model_dump(), gop,
+        ac.output_codec, ac.output_bitrate, ac.resample_rate,
+    )
+
+
+def acceptable_clip_keys(digest: str, clip: Clip, vc: VideoConfig, gop: list[str], ac: AudioConfig) -> list[str]:
+    """Clés de clips normalisés réutilisables : preset de vc, puis chaque preset plus lent.
+
+    Le preset peut être accéléré selon la charge (politique d'encodage) : un
+    clip déjà encodé à un preset au moins aussi lent (qualité au moins égale)
+    convient, et la charge du moment ne fragmente pas le cache.
+    """
+    presets = list(X264_MPIXELS_PER_CPU_SECOND)
+    slower = presets[presets.index(vc.preset):] if vc.preset in presets else [vc.preset]
+    return [normalized_clip_key(digest, clip, vc.model_copy(update={"preset": p}), gop, ac) for p in slower]
+
+
+def audio_cache_key(
+    vo_digest: str | None,
+    music_digest: str | None,
+    request: AssembleRequest,
+    total_duration: float,
+) -> str:
+    """Clé de cache de la piste audio mixée."""
+    return cache_key(
+        "audio", vo_digest, music_digest,
+        [seg.model_dump() for seg in request.voiceover_segments or []],
+        round(total_duration, 2), request.audio_config.model_dump(),
+    )
+
+
+def timeline_seconds(request: AssembleRequest) -> float:
+    """Durée de la timeline : somme des durées cibles des clips.
+
+    C'est la durée de référence de l'audio (longueur du mixage, clé de cache),
+    connue avant tout téléchargement : le plan et l'exécution calculent donc
+    la même clé, et le mixage n'attend pas la vidéo concaténée.
+    """
+    return sum(c.duree_secondes for c in request.clips)
+
+
+def download_node_id(url: str) -> str:
+    """Id du nœud download d'une URL (un seul nœud par URL distincte)."""
+    return f"download:{cache_key('download', url)[:12]}"
+
+
+def encode_cpu_seconds(width: int, height: int, fps: int, seconds: float, preset: str) -> float:
+    """Secondes CPU estimées pour encoder seconds de vidéo en x264."""
+    rate = X264_MPIXELS_PER_CPU_SECOND.get(preset, X264_MPIXELS_PER_CPU_SECOND["medium"])
+    return width * height * fps * seconds / (rate * 1e6)
+
+
+def decode_cpu_seconds(pixels: int, fps: int, seconds: float) -> float:
+    return pixels * fps * seconds / (DECODE_MPIXELS_PER_CPU_SECOND * 1e6)
+
+
+@dataclass
+class PlanNode:
+    id: str
+    kind: str
+    deps: list[str] = field(default_factory=list)
+    cache_key: str | None = None
+    cached: bool = False
+    cpu_seconds: float = 0.0
+    detail: dict = field(default_factory=dict)
+
+
+@dataclass
+class RenderPlan:
+    nodes: dict[str, PlanNode]
+    total_duration: float
+
+    def total_cpu_seconds(self) -> float:
+        return sum(n.cpu_seconds for n in self.nodes.values())
+
+    def critical_path_seconds(self) -> float:
+        """Plus long chemin (en secondes CPU) à travers le DAG."""
+        longest: dict[str, float] = {}
+        for node in self.topological():
+            longest[node.id] = node.cpu_seconds + max((longest[d] for d in node.deps), default=0.0)
+        return max(longest.values(), default=0.0)
+
+    def estimated_wall_seconds(self, cpus: int | None = None) -> float:
+        """Borne basse du temps mur : chemin critique ou CPU total réparti sur les cœurs."""
+        cpus = cpus or os.cpu_count() or 1
+        return max(self.critical_path_seconds(), self.total_cpu_seconds() / cpus)
+
+    def topological(self) -> list[PlanNode]:
+        order: list[PlanNode] = []
+        seen: set[str] = set()
+
+        def visit(node_id: str) -> None:
+            if node_id in seen:
+                return
+            seen.add(node_id)
+            for dep in self.nodes[node_id].deps:
+                visit(dep)
+            order.append(self.nodes[node_id])
+
+        for node_id in self.nodes:
+            visit(node_id)
+        return order
+
+    def subgraph(self, kinds: set[str]) -> "RenderPlan":
+        """Sous-plan restreint à certains types de nœuds (dépendances externes ignorées)."""
+        nodes = {
+            n.id: PlanNode(**{**asdict(n), "deps": [d for d in n.deps if self.nodes[d].kind in kinds]})
+            for n in self.nodes.values() if n.kind in kinds
+        }
+        return RenderPlan(nodes=nodes, total_duration=self.total_duration)
+
+    def to_dict(self) -> dict:
+        nodes = [asdict(n) for n in self.topological()]
+        for node in nodes:
+            node["cpu_seconds"] = round(node["cpu_seconds"], 2)
+        return {
+            "nodes": nodes,
+            "total_duration": round(self.total_duration, 2),
+            "total_cpu_seconds": round(self.total_cpu_seconds(), 2),
+            "critical_path_seconds": round(self.critical_path_seconds(), 2),
+            "estimated_wall_seconds": round(self.estimated_wall_seconds(), 2),
+            "cached_nodes": sum(1 for n in self.nodes.values() if n.cached),
+        }
+
+
+def _known_digest(url: str) -> str | None:
+    meta = load_json("downloads", cache_key("download", url))
+    return meta["digest"] if meta else None
+
+
+def compile_plan(
+    request: AssembleRequest,
+    vc: VideoConfig | None = None,
+    probes: dict[str, float] | None = None,
+) -> RenderPlan:
+    """Construit le DAG de rendu sans rien télécharger ni exécuter.
+
+    vc remplace request.video_config (proxies du mode draft). Les durées
+    source viennent de probes (url → secondes), sinon du cache de probes
+    quand le fichier a déjà été téléchargé ou sondé au pré-vol, sinon de la
+    durée cible.
+    """
+    vc = vc or request.video_config
+    ac = request.audio_config
+    probes = probes or {}
+    clips = sorted(request.clips, key=lambda c: c.index)
+    gop = ["-g", str(vc.fps * request.hls.segment_seconds)] if request.hls else []
+    total = timeline_seconds(request)
+    nodes: dict[str, PlanNode] = {}
+
+    def download(url: str) -> tuple[str, str | None]:
+        # Un nœud par URL distincte : un asset partagé n'est téléchargé qu'une fois
+        node_id = download_node_id(url)
+        digest = _known_digest(url)
+        nodes.setdefault(node_id, PlanNode(
+            id=node_id, kind="download", cache_key=digest, cached=digest is not None, detail={"url": url},
+        ))
+        return node_id, digest
+
+    transcodes = []
+    for i, clip in enumerate(clips):
+        dl, digest = download(clip.video_url)
+        probe = load_json("probes", digest) if digest else None
+        source_seconds = (probes.get(clip.video_url) or (probe or {}).get("duration")
+                          or remote_duration(clip.video_url))
+
+        probe_id = f"probe:{i}"
+        nodes[probe_id] = PlanNode(
+            id=probe_id, kind="probe", deps=[dl], cache_key=digest,
+            cached=source_seconds is not None,
+            detail={"clip": i, "url": clip.video_url, "source_seconds": source_seconds},
+        )
+
+        key = None
+        cached = False
+        if digest:
+            candidates = acceptable_clip_keys(digest, clip, vc, gop, ac)
+            key = next((k for k in candidates if cache_path("clips", k, ".mp4").exists()), candidates[0])
+            cached = cache_path("clips", key, ".mp4").exists()
+        cost = 0.0 if cached else (
+            decode_cpu_seconds(DEFAULT_SOURCE_PIXELS, vc.fps, source_seconds or clip.duree_secondes)
+            + encode_cpu_seconds(vc.width, vc.height, vc.fps, clip.duree_secondes, vc.preset)
+        )
+        node_id = f"transcode:{i}"
+        nodes[node_id] = PlanNode(
+            id=node_id, kind="transcode", deps=[dl, probe_id], cache_key=key, cached=cached,
+            cpu_seconds=cost,
+            detail={"clip": i, "url": clip.video_url, "target_seconds": clip.duree_secondes},
+        )
+        transcodes.append(node_id)
+
+    nodes["concat"] = PlanNode(
+        id="concat", kind="concat", deps=transcodes, cpu_seconds=0.01 * total,
+        detail={"clips": len(clips), "pipe": pipe_concat(request, total)},
+    )
+
+    mux_deps = ["concat"]
+    if request.voiceover_url or request.music_url:
+        # Le mixage ne dépend que des sources audio : il tourne pendant la normalisation des clips
+        audio_deps = []
+        vo_digest = music_digest = None
+        if request.voiceover_url:
+            dl, vo_digest = download(request.voiceover_url)
+            audio_deps.append(dl)
+        if request.music_url:
+            dl, music_digest = download(request.music_url)
+            audio_deps.append(dl)
+        known = (not request.voiceover_url or vo_digest) and (not request.music_url or music_digest)
+        key = audio_cache_key(vo_digest, music_digest, request, total) if known else None
+        cached = bool(key) and cache_path("audio", key, ".wav").exists()
+        nodes["mix"] = PlanNode(
+            id="mix", kind="mix", deps=audio_deps, cache_key=key, cached=cached,
+            cpu_seconds=0.0 if cached else AUDIO_CPU_PER_SECOND * total,
+            detail={"segments": len(request.voiceover_segments or [])},
+        )
+        mux_deps.append("mix")
+
+    mux_cost = 0.01 * total
+    if request.previews:
+        mux_cost += decode_cpu_seconds(vc.width * vc.height, vc.fps, total)
+    nodes["mux"] = PlanNode(
+        id="mux", kind="mux", deps=list(mux_deps), cpu_seconds=mux_cost,
+        detail={"hls": bool(request.hls), "previews": bool(request.previews)},
+    )
+
+    chunked = use_chunked(total)
+    for r in request.renditions or []:
+        node_id = f"encode:{r.name}"
+        nodes[node_id] = PlanNode(
+            id=node_id, kind="encode", deps=list(mux_deps),
+            cpu_seconds=decode_cpu_seconds(vc.width * vc.height, vc.fps, total)
+            + encode_cpu_seconds(r.width, r.height, vc.fps, total, r.preset or vc.preset),
+            detail={"width": r.width, "height": r.height, "chunked": chunked},
+        )
+
+    return RenderPlan(nodes=nodes, total_duration=total)
+
+
+Handler = Callable[[PlanNode, dict[str, Any]], Awaitable[Any]]
+
+
+async def execute_plan(
+    plan: RenderPlan,
+    handlers: dict[str, Handler],
+    limits: dict[str, int] | None = None,
+) -> dict[str, Any]:
+    """Exécute chaque nœud dès que ses dépendances sont terminées ; retourne id → résultat.
+
+    handlers associe un type de nœud à une coroutine (nœud, résultats des
+    dépendances). limits plafonne le nombre de nœuds d'un même type en vol.
+    Au premier échec, les nœuds encore en cours sont annulés.
+    """
+    semaphores = {kind: asyncio.Semaphore(n) for kind, n in (limits or {}).items()}
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def run(node: PlanNode) -> Any:
+        inputs = {dep: await tasks[dep] for dep in node.deps}
+        semaphore = semaphores.get(node.kind)
+        if semaphore is None:
+            return await handlers[node.kind](node, inputs)
+        async with semaphore:
+            return await handlers[node.kind](node, inputs)
+
+    for node in plan.topological():
+        tasks[node.id] = asyncio.create_task(run(node))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return {node_id: task.result() for node_id, task in tasks.items()}
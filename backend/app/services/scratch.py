@@ -0,0 +1,207 @@
+"""Budget disque des dossiers de travail : estimation par job, admission, tier tmpfs.
+
+Chaque job réserve avant de démarrer une estimation de ce qu'il va écrire
+(dossier de travail + entrées de cache nouvelles). Il n'est admis que si
+l'espace libre, diminué de ce que les jobs déjà admis doivent encore écrire,
+le permet ; sinon il attend son tour (FIFO). Les petits intermédiaires audio
+(PCM, stem, mix) peuvent aller dans un tier RAM (tmpfs) s'il est configuré.
+"""
+
+import asyncio
+import os
+import shutil
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+from app.config import settings
+from app.schemas.assemble import AssembleRequest, VideoConfig
+from app.services.chunked import use_chunked
+from app.services.render_plan import RenderPlan
+from app.services.streaming import pipe_concat
+
+# Bits par pixel d'un encodage x264 à CRF 23 (le débit double tous les 6 points de CRF)
+BITS_PER_PIXEL_CRF23 = 0.08
+SOURCE_CRF = 20
+PREVIEWS_BYTES = 2 * 1024**2
+# Recontrôle de l'espace libre pendant l'attente (il varie hors de nos jobs)
+ADMISSION_POLL_SECONDS = 5.0
+
+
+def video_bytes_per_second(width: int, height: int, fps: int, crf: int) -> float:
+    return width * height * fps * BITS_PER_PIXEL_CRF23 * 2 ** ((23 - crf) / 6) / 8
+
+
+def audio_bitrate_bytes(bitrate: str) -> float:
+    """'192k' → octets par seconde."""
+    value = bitrate.lower()
+    factor = {"k": 1e3, "m": 1e6}.get(value[-1], 1)
+    return float(value.rstrip("km")) * factor / 8
+
+
+@dataclass(frozen=True)
+class ScratchEstimate:
+    work_bytes: int
+    audio_bytes: int
+    cache_bytes: int
+
+    @property
+    def disk_bytes(self) -> int:
+        return self.work_bytes + self.audio_bytes + self.cache_bytes
+
+
+def estimate_scratch(request: AssembleRequest, vc: VideoConfig, plan: RenderPlan) -> ScratchEstimate:
+    """Pic d'écriture estimé du job, à partir du plan de rendu (durées sondées ou cibles)."""
+    total = plan.total_duration
+    ac = request.audio_config
+    video_rate = video_bytes_per_second(vc.width, vc.height, vc.fps, vc.crf)
+    audio_rate = audio_bitrate_bytes(ac.output_bitrate)
+
+    # concat.mp4 (sauf en FIFO) + sortie principale (+ copie HLS)
+    copies = (1 if pipe_concat(request, total) else 2) + (1 if request.hls else 0)
+    work = total * video_rate * copies + total * audio_rate
+    chunked = use_chunked(total)
+    for r in request.renditions or []:
+        rate = video_bytes_per_second(r.width, r.height, vc.fps, r.crf if r.crf is not None else vc.crf)
+        # En mode découpé, les chunks et la rendition recollée coexistent brièvement
+        work += total * (rate * (2 if chunked else 1) + audio_rate)
+    if request.previews:
+        work += PREVIEWS_BYTES
+
+    # PCM float voix + musique, mix 16 bits, stem éventuel
+    audio = 0.0
+    if request.voiceover_url or request.music_url:
+        pcm = total * ac.resample_rate * 2
+        audio = pcm * 4 * 2 + pcm * 2 * (2 if request.voiceover_segments else 1)
+
+    # Entrées de cache nouvelles : sources pas encore téléchargées, clips pas encore normalisés
+    source_rate = video_bytes_per_second(1920, 1080, 30, SOURCE_CRF)
+    cache = 0.0
+    downloads: set[str] = set()
+    for node in plan.nodes.values():
+        if node.kind != "transcode" or node.cached:
+            continue
+        cache += node.detail["target_seconds"] * video_rate
+        download, probe = (plan.nodes[dep] for dep in node.deps)
+        if not download.cached and download.id not in downloads:
+            downloads.add(download.id)
+            cache += (probe.detail["source_seconds"] or node.detail["target_seconds"]) * source_rate
+    return ScratchEstimate(int(work), int(audio), int(cache))
+
+
+def _tree_bytes(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+@dataclass
+class _Reservation:
+    job_id: str
+    estimate: ScratchEstimate
+    dirs: list[Path]
+    fast: bool
+
+
+class ScratchBudget:
+    """Admission des jobs selon l'espace disque (et tmpfs) encore disponible."""
+
+    def __init__(self, base: Path):
+        self.base = base
+        self._reservations: dict[str, _Reservation] = {}
+        self._queue: deque[str] = deque()
+        # Jobs soumis qui n'ont pas encore demandé leur admission (rendus d'un batch en attente)
+        self._expected: set[str] = set()
+        self._changed = asyncio.Condition()
+
+    @staticmethod
+    def _outstanding(reservations: list[_Reservation]) -> int:
+        """Octets que les jobs admis doivent encore écrire (réservé − déjà écrit)."""
+        pending = 0
+        for r in reservations:
+            reserved = r.estimate.work_bytes + r.estimate.cache_bytes
+            if not r.fast:
+                reserved += r.estimate.audio_bytes
+            written = sum(_tree_bytes(d) for d in r.dirs if d.exists())
+            pending += max(0, reserved - written)
+        return pending
+
+    def _fits_blocking(self, estimate: ScratchEstimate, reservations: list[_Reservation]) -> bool:
+        if not reservations:
+            return True  # Seul job : on tente quand même plutôt que de bloquer à vie
+        free = shutil.disk_usage(self.base).free - settings.SCRATCH_MIN_FREE_BYTES
+        if settings.SCRATCH_MAX_BYTES:
+            used = sum(_tree_bytes(d) for r in reservations for d in r.dirs if d.exists())
+            free = min(free, settings.SCRATCH_MAX_BYTES - used)
+        return estimate.disk_bytes <= free - self._outstanding(reservations)
+
+    async def _fits(self, estimate: ScratchEstimate) -> bool:
+        """Le job tient-il à côté des jobs admis ? Parcours disque hors de la boucle d'événements."""
+        return await asyncio.to_thread(self._fits_blocking, estimate, list(self._reservations.values()))
+
+    def _fast_available(self, audio_bytes: int) -> bool:
+        if not settings.SCRATCH_TMPFS_DIR or not audio_bytes:
+            return False
+        reserved = sum(r.estimate.audio_bytes for r in self._reservations.values() if r.fast)
+        return reserved + audio_bytes <= settings.SCRATCH_TMPFS_MAX_BYTES
+
+    async def admissible(self, estimate: ScratchEstimate) -> bool:
+        """Vrai si un job de cette taille serait admis immédiatement."""
+        return not self._queue and await self._fits(estimate)
+
+    async def acquire(self, job_id: str, work_dir: Path, estimate: ScratchEstimate) -> Path:
+        """Attend que le job tienne dans le budget ; retourne le dossier des intermédiaires audio."""
+        async with self._changed:
+            self._expected.discard(job_id)
+            self._queue.append(job_id)
+            try:
+                while self._queue[0] != job_id or not await self._fits(estimate):
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=ADMISSION_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                self._queue.remove(job_id)
+                self._changed.notify_all()
+                raise
+            self._queue.popleft()
+            fast = self._fast_available(estimate.audio_bytes)
+            self._reservations[job_id] = _Reservation(job_id, estimate, [work_dir], fast)
+            self._changed.notify_all()
+
+        audio_dir = Path(settings.SCRATCH_TMPFS_DIR) / job_id if fast else work_dir
+        audio_dir.mkdir(parents=True, exist_ok=True)
+        return audio_dir
+
+    async def release(self, job_id: str) -> None:
+        """Libère la réservation du job (et son dossier tmpfs) et réveille la file d'attente.
+
+        Sans effet sur la réservation d'un job qui n'a pas été admis (il est seulement oublié).
+        """
+        self.forget([job_id])
+        reservation = self._reservations.pop(job_id, None)
+        if reservation and reservation.fast:
+            shutil.rmtree(Path(settings.SCRATCH_TMPFS_DIR) / job_id, ignore_errors=True)
+        async with self._changed:
+            self._changed.notify_all()
+
+    def expect(self, job_ids: Iterable[str]) -> None:
+        """Annonce des jobs soumis qui demanderont leur admission plus tard (comptés dans waiting)."""
+        self._expected.update(job_ids)
+
+    def forget(self, job_ids: Iterable[str]) -> None:
+        """Retire des jobs annoncés qui ne demanderont plus leur admission."""
+        self._expected.difference_update(job_ids)
+
+    def waiting(self) -> int:
+        """Jobs en file d'admission ou annoncés sans l'avoir encore atteinte."""
+        return len(self._queue) + len(self._expected)
+
+    def active(self) -> int:
+        return len(self._reservations)
@@ -0,0 +1,106 @@
+"""Mode streaming : données passées d'une étape à l'autre par pipes plutôt que par fichiers.
+
+Deux raccourcis quand STREAMING_PIPELINE est actif :
+
+- un téléchargement non encore en cache est recopié, au fil du transfert,
+  vers le stdin des FFmpeg qui normalisent ses clips (le fichier reste écrit
+  dans le cache des téléchargements). Ce n'est possible que si le conteneur
+  se lit sans seek (MP4 « faststart », MPEG-TS) et si la durée source est
+  déjà connue (pré-vol) : sinon on repasse par le fichier ;
+- la concaténation n'écrit plus concat.mp4 : elle sort en NUT dans une FIFO
+  lue directement par le passage final. Les renditions découpées ont besoin
+  de seeks dans la vidéo concaténée et gardent le fichier.
+
+Seuls les artefacts mis en cache ou conservés touchent le disque.
+"""
+
+import asyncio
+import os
+import struct
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from app.config import settings
+from app.schemas.assemble import AssembleRequest
+from app.services.chunked import use_chunked
+
+# Octets gardés au plus pour décider si le conteneur se lit en flux
+SNIFF_BYTES = 1024**2
+# Conteneur intermédiaire des FIFO : accepte tous les codecs, timestamps conservés
+PIPE_FORMAT = "nut"
+
+_TS_PACKET = 188
+
+
+def streamable(head: bytes) -> bool | None:
+    """Le conteneur qui commence par head se lit-il sans seek ? None = pas encore assez d'octets.
+
+    MP4/MOV : vrai si la boîte moov précède mdat. MPEG-TS : toujours vrai.
+    """
+    if len(head) > _TS_PACKET and head[0] == 0x47 and head[_TS_PACKET] == 0x47:
+        return True
+    offset = 0
+    while offset + 8 <= len(head):
+        size, kind = struct.unpack(">I4s", head[offset:offset + 8])
+        if not all(32 < c < 127 for c in kind):
+            return False  # Pas une boîte ISO BMFF
+        if kind == b"moov":
+            return True
+        if kind == b"mdat":
+            return False
+        if size == 1:
+            if offset + 16 > len(head):
+                return None
+            size = struct.unpack(">Q", head[offset + 8:offset + 16])[0]
+        if size < 8:
+            return False
+        offset += size
+    return None
+
+
+def pipe_concat(request: AssembleRequest, total_duration: float) -> bool:
+    """La vidéo concaténée passe-t-elle par une FIFO (pas de renditions découpées à alimenter) ?"""
+    chunked = bool(request.renditions) and use_chunked(total_duration)
+    return settings.STREAMING_PIPELINE and not chunked
+
+
+def make_fifo(path: Path) -> Path:
+    path.unlink(missing_ok=True)
+    os.mkfifo(path)
+    return path
+
+
+class StdinFanout:
+    """Recopie les octets d'un téléchargement vers le stdin de process FFmpeg.
+
+    Les premiers octets sont gardés jusqu'à savoir si le conteneur se lit en
+    flux ; start n'est appelé que dans ce cas et retourne les process à
+    alimenter (éventuellement aucun). Un process qui meurt est simplement
+    retiré : son erreur remonte à celui qui l'attend.
+    """
+
+    def __init__(self, start: Callable[[], Awaitable[list[asyncio.subprocess.Process]]]):
+        self._start = start
+        self._head = bytearray()
+        self._procs: list[asyncio.subprocess.Process] | None = None
+
+    async def feed(self, chunk: bytes) -> None:
+        if self._procs is None:
+            self._head += chunk
+            verdict = streamable(bytes(self._head))
+            if verdict is None and len(self._head) < SNIFF_BYTES:
+                return
+            self._procs = await self._start() if verdict else []
+            chunk, self._head = bytes(self._head), bytearray()
+        for proc in list(self._procs):
+            try:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                self._procs.remove(proc)
+
+    async def close(self) -> None:
+        """Fin du téléchargement : ferme les stdin (les process finissent leur encodage)."""
+        for proc in self._procs or []:
+            proc.stdin.close()
+        self._procs = self._procs or []
@@ -8,14 +8,14 @@ from app.config import settings
 logger = logging.getLogger("uvicorn.error")
 
 
-async def upload_to_supabase(file_path: Path, storage_path: str) -> str:
+async def upload_to_supabase(file_path: Path, storage_path: str, content_type: str = "video/mp4") -> str:
     """Upload un fichier vers Supabase Storage et retourne l'URL publique."""
     url = f"{settings.SUPABASE_URL}/storage/v1/object/{settings.SUPABASE_BUCKET}/{storage_path}"
 
     headers = {
         "Authorization": f"Bearer {settings.SUPABASE_SERVICE_KEY}",
         "apikey": settings.SUPABASE_SERVICE_KEY,
-        "Content-Type": "video/mp4",
+        "Content-Type": content_type,
         "x-upsert": "true",
     }
 
@@ -0,0 +1,134 @@
+"""Compilation de la timeline voix off : segments → stem PCM aligné sur la vidéo.
+
+Au lieu d'un graphe FFmpeg avec une branche atrim/adelay par segment et un
+amix à N entrées, les segments sont triés, fusionnés ou coupés puis recopiés
+échantillon par échantillon dans un stem WAV linéaire de la durée de la vidéo.
+Le coût est proportionnel à la durée audio, pas au nombre de segments.
+"""
+
+import wave
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Iterable
+
+from app.schemas.assemble import VoiceoverSegment
+
+# Tolérance (secondes) pour considérer deux segments comme contigus
+_EPSILON = 1e-3
+
+# Taille des blocs copiés (en frames) lors de l'écriture du stem
+_CHUNK_FRAMES = 65536
+
+
+@dataclass(frozen=True)
+class TimelineSpan:
+    """Portion [source_start, source_end[ de la voix off placée à `start` dans la vidéo."""
+
+    source_start: float
+    source_end: float
+    start: float
+
+    @property
+    def duration(self) -> float:
+        return self.source_end - self.source_start
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+
+def compile_timeline(
+    segments: Iterable[VoiceoverSegment],
+    total_duration: float | None = None,
+) -> list[TimelineSpan]:
+    """Trie les segments et produit une liste de spans sans chevauchement.
+
+    - les segments vides (out <= in) ou hors de la vidéo sont ignorés ;
+    - un segment qui déborde de total_duration est raccourci ;
+    - en cas de chevauchement, la fin du segment précédent est coupée pour
+      que le suivant démarre à l'heure (la synchro image prime) ;
+    - deux segments contigus à la fois dans la source et dans la timeline
+      sont fusionnés en un seul span.
+    """
+    spans: list[TimelineSpan] = []
+    for seg in sorted(segments, key=lambda s: (s.start_seconds, s.in_seconds)):
+        span = TimelineSpan(seg.in_seconds, seg.out_seconds, seg.start_seconds)
+        if span.duration <= 0:
+            continue
+        if total_duration is not None:
+            if span.start >= total_duration:
+                continue
+            if span.end > total_duration:
+                span = replace(span, source_end=span.source_start + total_duration - span.start)
+
+        if spans and span.start < spans[-1].end:
+            prev = spans.pop()
+            kept = span.start - prev.start
+            if kept > _EPSILON:
+                spans.append(replace(prev, source_end=prev.source_start + kept))
+
+        if (
+            spans
+            and abs(span.start - spans[-1].end) < _EPSILON
+            and abs(span.source_start - spans[-1].source_end) < _EPSILON
+        ):
+            spans[-1] = replace(spans[-1], source_end=span.source_end)
+            continue
+
+        spans.append(span)
+    return spans
+
+
+def render_stem(
+    pcm_path: Path,
+    spans: list[TimelineSpan],
+    dest: Path,
+    total_duration: float,
+    sample_rate: int,
+    channels: int = 2,
+) -> Path:
+    """Écrit un stem WAV 16 bits de total_duration à partir d'un PCM s16le brut.
+
+    Les silences entre spans sont écrits en zéros et chaque span est recopié
+    par seek/read dans le PCM source : mémoire bornée à un bloc, précision à
+    l'échantillon près.
+    """
+    frame_size = 2 * channels
+    total_frames = round(total_duration * sample_rate)
+    source_frames = pcm_path.stat().st_size // frame_size
+    silence = bytes(_CHUNK_FRAMES * frame_size)
+
+    def write_silence(out: wave.Wave_write, frames: int) -> None:
+        while frames > 0:
+            n = min(frames, _CHUNK_FRAMES)
+            out.writeframesraw(silence[:n * frame_size])
+            frames -= n
+
+    cursor = 0
+    with open(pcm_path, "rb") as src, wave.open(str(dest), "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+
+        for span in spans:
+            start_frame = max(cursor, round(span.start * sample_rate))
+            if start_frame >= total_frames:
+                break
+            write_silence(out, start_frame - cursor)
+            cursor = start_frame
+
+            first = round(span.source_start * sample_rate)
+            last = min(round(span.source_end * sample_rate), source_frames)
+            remaining = min(last - first, total_frames - cursor)
+            src.seek(first * frame_size)
+            while remaining > 0:
+                data = src.read(min(remaining, _CHUNK_FRAMES) * frame_size)
+                if not data:
+                    break
+                out.writeframesraw(data)
+                n = len(data) // frame_size
+                remaining -= n
+                cursor += n
+
+        write_silence(out, total_frames - cursor)
+    return dest
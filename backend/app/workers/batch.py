@@ -0,0 +1,134 @@
+"""Pipeline batch : assets partagés préparés une fois, rendus ordonnancés ensemble, un seul webhook."""
+
+import asyncio
+import logging
+import math
+from contextlib import ExitStack
+
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import async_session
+from app.models.batch import Batch
+from app.schemas.assemble import AssembleRequest
+from app.services.assembler import resolve_quality
+from app.services.media_cache import pin_downloads, prune_cache
+from app.services.render_plan import compile_plan
+from app.workers.pipeline import notify_webhook, run_assembly, scratch_budget
+
+logger = logging.getLogger("uvicorn.error")
+
+# Nombre d'événements de progression envoyés au webhook sur la durée du batch
+PROGRESS_EVENTS = 10
+
+
+async def _update_batch(batch_id: str, **fields) -> None:
+    async with async_session() as db:
+        result = await db.execute(select(Batch).where(Batch.id == batch_id))
+        batch = result.scalar_one_or_none()
+        if batch:
+            for name, value in fields.items():
+                setattr(batch, name, value)
+            await db.commit()
+
+
+def _asset_urls(requests: list[AssembleRequest]) -> list[str]:
+    """URLs distinctes de tous les clips, voix off et musiques du batch (ordre conservé)."""
+    urls: dict[str, None] = {}
+    for request in requests:
+        for clip in request.clips:
+            urls[clip.video_url] = None
+        for url in (request.voiceover_url, request.music_url):
+            if url:
+                urls[url] = None
+    return list(urls)
+
+
+def _estimated_cpu(request: AssembleRequest) -> float:
+    request, vc = resolve_quality(request)
+    return compile_plan(request, vc).total_cpu_seconds()
+
+
+async def run_batch(
+    batch_id: str,
+    jobs: list[tuple[str, AssembleRequest]],
+    max_concurrent: int | None,
+    webhook_url: str | None,
+    submitted_at: float | None = None,
+) -> None:
+    """Exécute tous les montages d'un batch dans une BackgroundTask.
+
+    Chaque rendu télécharge ses propres assets, après son admission disque, et
+    démarre dès qu'ils arrivent. Un asset partagé n'est téléchargé qu'une fois
+    et les clips normalisés communs (intro, outro...) ne sont encodés qu'une
+    fois : le premier rendu qui en a besoin les produit, les autres les
+    reprennent du cache média (un verrou par clé évite tout double travail).
+    Les assets d'un job restent épinglés contre la purge du cache tant que ce
+    job n'est pas terminé : un asset partagé reste donc disponible pour les
+    jobs suivants, et le reste du cache est purgé comme pour un job isolé.
+    Les rendus les plus coûteux partent en premier pour ne pas laisser un long
+    montage seul en fin de batch. Seul le webhook du batch est notifié (pas
+    ceux des jobs).
+    """
+    total = len(jobs)
+    requests = [request for _, request in jobs]
+    urls = _asset_urls(requests)
+    refs = sum(len(r.clips) + bool(r.voiceover_url) + bool(r.music_url) for r in requests)
+    logger.info(f"Batch {batch_id}: {total} jobs, {len(urls)} distinct assets for {refs} references")
+
+    order = sorted(jobs, key=lambda job: _estimated_cpu(job[1]), reverse=True)
+    # Les rendus bloqués par max_concurrent comptent dans la charge vue par la politique d'encodage
+    scratch_budget.expect(job_id for job_id, _ in jobs)
+    semaphore = asyncio.Semaphore(max_concurrent or settings.BATCH_MAX_CONCURRENT)
+    progress_step = max(1, math.ceil(total / PROGRESS_EVENTS))
+    results: dict[str, dict] = {}
+    counts = {"completed": 0, "failed": 0}
+
+    # job_id → épinglage de ses assets, levé dès que le job est terminé
+    pins: dict[str, ExitStack] = {}
+
+    async def render(job_id: str, request: AssembleRequest) -> None:
+        async with semaphore:
+            try:
+                result = await run_assembly(job_id, request, submitted_at=submitted_at, notify=False)
+            finally:
+                pins[job_id].close()
+        results[job_id] = result
+        counts["completed" if result["status"] == "completed" else "failed"] += 1
+        await _update_batch(batch_id, **counts)
+        done = len(results)
+        if webhook_url and done < total and done % progress_step == 0:
+            await notify_webhook(webhook_url, {
+                "batch_id": batch_id, "event": "progress", "total": total, **counts,
+            })
+
+    try:
+        with ExitStack() as stack:
+            for job_id, request in jobs:
+                pins[job_id] = stack.enter_context(ExitStack())
+                pins[job_id].enter_context(pin_downloads(_asset_urls([request])))
+            await asyncio.gather(*(render(job_id, request) for job_id, request in order))
+    finally:
+        scratch_budget.forget(job_id for job_id, _ in jobs)
+        if counts["failed"] == 0 and len(results) == total:
+            status = "completed"
+        elif counts["completed"] == 0:
+            status = "failed"
+        else:
+            status = "partial"
+        await _update_batch(batch_id, status=status, **counts)
+        await asyncio.to_thread(prune_cache, settings.CACHE_MAX_BYTES)
+        logger.info(f"Batch {batch_id} {status}: {counts['completed']}/{total} completed")
+
+        if webhook_url:
+            await notify_webhook(webhook_url, {
+                "batch_id": batch_id,
+                "event": "completed",
+                "status": status,
+                "total": total,
+                **counts,
+                "jobs": [
+                    {k: v for k, v in results[job_id].items() if k != "stages"}
+                    for job_id, _ in jobs if job_id in results
+                ],
+            })
@@ -1,26 +1,41 @@
 """Pipeline d'assemblage : download → FFmpeg → upload Supabase → update DB → webhook."""
 
+import asyncio
 import logging
 import shutil
+import time
 from pathlib import Path
 
 import httpx
-from sqlalchemy import select
 
-from app.database import async_session
-from app.models.job import Job
+from app.config import settings
 from app.schemas.assemble import AssembleRequest
-from app.services.assembler import assemble_video
+from app.services.assembler import assemble_video, resolve_quality
+from app.services.encoder_policy import choose_policy
+from app.services.hls import HlsPublisher
 from app.services.job_logger import emit
+from app.services.job_state import job_states
+from app.services.media_cache import prune_cache
+from app.services.metrics import pop_stages, stage
+from app.services.render_plan import compile_plan
+from app.services.scratch import ScratchBudget, estimate_scratch
 from app.services.supabase import upload_to_supabase
 
 logger = logging.getLogger("uvicorn.error")
 
 WORK_BASE = Path("tmp")
+scratch_budget = ScratchBudget(WORK_BASE)
 
 
-async def _notify_webhook(webhook_url: str, payload: dict) -> None:
-    """POST le résultat du job vers le webhook n8n."""
+async def notify_webhook(webhook_url: str, payload: dict) -> None:
+    """POST le résultat du job vers le webhook n8n.
+
+    Payload d'un job : job_id, status ("completed" | "failed"), output_url,
+    renditions (nom → URL), previews, playlist_url, error_message,
+    encoder_policy, et stages : liste des étapes mesurées du pipeline, chacune
+    {stage, wall_s, cpu_s, lifetime_peak_rss_mb: {self, children}} (le pic RSS
+    est celui du process depuis son démarrage, pas celui de l'étape).
+    """
     try:
         async with httpx.AsyncClient(timeout=30) as client:
             resp = await client.post(webhook_url, json=payload)
@@ -30,33 +45,103 @@ async def _notify_webhook(webhook_url: str, payload: dict) -> None:
         logger.warning(f"Webhook notification failed: {exc}")
 
 
-async def run_assembly(job_id: str, request: AssembleRequest) -> None:
-    """Exécute le pipeline complet d'assemblage dans une BackgroundTask."""
+async def _upload_previews(previews: dict, storage_dir: str) -> dict:
+    """Upload poster, vignettes, planche et index WebVTT ; retourne les URLs publiques."""
+    async def upload(path: Path) -> str:
+        content_type = "text/vtt" if path.suffix == ".vtt" else "image/jpeg"
+        return await upload_to_supabase(path, f"{storage_dir}/{path.name}", content_type)
+
+    return {
+        name: [await upload(p) for p in value] if isinstance(value, list) else await upload(value)
+        for name, value in previews.items()
+    }
+
+
+async def run_assembly(
+    job_id: str,
+    request: AssembleRequest,
+    submitted_at: float | None = None,
+    notify: bool = True,
+) -> dict:
+    """Exécute le pipeline complet d'assemblage dans une BackgroundTask ; retourne le résultat du job.
+
+    notify=False n'envoie pas le webhook du job (un batch envoie le sien).
+    submitted_at (time.monotonic() à la soumission) sert d'origine à
+    deadline_seconds ; à défaut, le démarrage du pipeline.
+    """
     work_dir = WORK_BASE / job_id
     work_dir.mkdir(parents=True, exist_ok=True)
 
     status = "failed"
     public_url = None
+    rendition_urls: dict[str, str] = {}
+    preview_urls: dict = {}
     error_message = None
+    hls_publisher = None
+    policy = None
+    submitted_at = submitted_at or time.monotonic()
 
     try:
         emit(job_id, "pipeline", "info", "Démarrage du pipeline d'assemblage")
 
-        # 1. Assembler la vidéo
-        output_path = await assemble_video(job_id, request, work_dir)
+        # 0. Admission : le job attend tant que son besoin disque estimé ne tient pas
+        render_request, vc = resolve_quality(request)
+        plan = compile_plan(render_request, vc)
+        estimate = estimate_scratch(render_request, vc, plan)
+        emit(job_id, "pipeline", "info",
+             f"Espace disque estimé : {estimate.disk_bytes / 1e6:.0f} Mo "
+             f"(travail {estimate.work_bytes / 1e6:.0f}, audio {estimate.audio_bytes / 1e6:.0f}, "
+             f"cache {estimate.cache_bytes / 1e6:.0f})")
+        queued = not await scratch_budget.admissible(estimate)
+        if queued:
+            emit(job_id, "pipeline", "warning", "Espace disque insuffisant, job en file d'attente")
+            job_states.update(job_id, status="queued")
+        audio_dir = await scratch_budget.acquire(job_id, work_dir, estimate)
+        if queued:
+            job_states.update(job_id, status="processing")
+
+        # Politique d'encodage : preset et threads selon la charge et l'échéance restante
+        if request.quality != "draft":
+            remaining = (request.deadline_seconds - (time.monotonic() - submitted_at)
+                         if request.deadline_seconds else None)
+            policy = choose_policy(render_request, vc, plan,
+                                   scratch_budget.active() + scratch_budget.waiting(), remaining)
+            job_states.update(job_id, encoder_policy=policy.to_dict())
+
+        # 1. Assembler la vidéo (segments HLS publiés pendant l'encodage final)
+        if request.hls:
+            async def _expose_playlist(url: str) -> None:
+                job_states.update(job_id, playlist_url=url)
+
+            hls_publisher = HlsPublisher(
+                job_id, work_dir / "hls", f"montages/{request.hotel_id}/{job_id}/hls",
+                on_playlist=_expose_playlist,
+            )
+        result = await assemble_video(job_id, request, work_dir, hls_publisher=hls_publisher,
+                                      audio_dir=audio_dir, policy=policy)
 
         # 2. Upload vers Supabase
         emit(job_id, "pipeline", "info", "Upload vers Supabase Storage...")
-        storage_path = f"montages/{request.hotel_id}/{output_path.name}"
-        public_url = await upload_to_supabase(output_path, storage_path)
-
-        # 3. Mettre à jour le job en DB
-        async with async_session() as db:
-            result = await db.execute(select(Job).where(Job.id == job_id))
-            job = result.scalar_one()
-            job.status = "completed"
-            job.output_url = public_url
-            await db.commit()
+        storage_dir = f"montages/{request.hotel_id}"
+        # Chaque fichier est supprimé dès son upload terminé
+        with stage(job_id, "upload"):
+            public_url = await upload_to_supabase(result.output_path, f"{storage_dir}/{result.output_path.name}")
+            result.output_path.unlink(missing_ok=True)
+            for name, path in result.renditions.items():
+                rendition_urls[name] = await upload_to_supabase(path, f"{storage_dir}/{path.name}")
+                path.unlink(missing_ok=True)
+            if result.previews:
+                preview_urls = await _upload_previews(result.previews, f"{storage_dir}/{job_id}/previews")
+
+        # 3. Mettre à jour le job (mémoire tout de suite, DB avec la prochaine écriture groupée)
+        job_states.update(
+            job_id,
+            status="completed",
+            output_url=public_url,
+            renditions=rendition_urls or None,
+            previews=preview_urls or None,
+            render_plan=result.render_plan,
+        )
 
         status = "completed"
         emit(job_id, "pipeline", "success", f"Terminé — {public_url}")
@@ -67,23 +152,34 @@ async def run_assembly(job_id: str, request: AssembleRequest) -> None:
         error_message = str(exc)[:1000]
         emit(job_id, "pipeline", "error", f"Erreur : {exc}")
 
-        async with async_session() as db:
-            result = await db.execute(select(Job).where(Job.id == job_id))
-            job = result.scalar_one_or_none()
-            if job:
-                job.status = "failed"
-                job.error_message = error_message
-                await db.commit()
+        job_states.update(job_id, status="failed", error_message=error_message)
 
     finally:
-        if work_dir.exists():
-            shutil.rmtree(work_dir, ignore_errors=True)
-
+        job_states.set_stage(job_id, None)
+        # État final en DB avant le webhook : le destinataire peut relire le job (finalize)
+        await job_states.flush()
+        # Suppression du dossier de travail et parcours du cache : hors de la boucle d'événements
+        await asyncio.to_thread(shutil.rmtree, work_dir, ignore_errors=True)
+        await scratch_budget.release(job_id)
+        await asyncio.to_thread(prune_cache, settings.CACHE_MAX_BYTES)
+
+        stages = pop_stages(job_id)
+        if stages:
+            logger.info(f"Job {job_id} stages: " + ", ".join(f"{s['stage']}={s['wall_s']}s" for s in stages))
+
+        payload = {
+            "job_id": job_id,
+            "status": status,
+            "output_url": public_url,
+            "renditions": rendition_urls or None,
+            "previews": preview_urls or None,
+            "playlist_url": hls_publisher.playlist_url if hls_publisher else None,
+            "error_message": error_message,
+            "encoder_policy": policy.to_dict() if policy else None,
+            "stages": stages,
+        }
         # 4. Webhook callback vers n8n
-        if request.webhook_url:
-            await _notify_webhook(request.webhook_url, {
-                "job_id": job_id,
-                "status": status,
-                "output_url": public_url,
-                "error_message": error_message,
-            })
+        if notify and request.webhook_url:
+            await notify_webhook(request.webhook_url, payload)
+
+    return payload
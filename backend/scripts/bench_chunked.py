@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Benchmark de l'encodage découpé : un seul x264 vs chunks parallèles recollés en stream copy.
+
+Génère une source synthétique 1080p30 (lavfi testsrc2 + bruit, pour que x264
+travaille vraiment) de chaque durée, puis l'encode en rendition 1280x720 :
+une fois en un seul process, puis par chunks avec chaque nombre de workers.
+Vérifie que la sortie découpée a le même nombre de frames que la sortie de
+référence. À lancer sur une machine 16+ cœurs pour des chiffres significatifs.
+
+Usage : python scripts/bench_chunked.py [--durations 120 180 300] [--workers 2 4 8] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import settings  # noqa: E402
+from app.services.chunked import encode_chunked  # noqa: E402
+from app.services.ffmpeg import run_ffmpeg, run_ffmpeg_async  # noqa: E402
+
+FPS = 30
+GOP = FPS * 2
+VIDEO_FILTER = "scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2"
+CODEC_ARGS = ["-c:v", "libx264", "-preset", "medium", "-crf", "23"]
+
+
+def count_frames(path: Path) -> int:
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+         "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", str(path)],
+        capture_output=True, text=True, timeout=300,
+    )
+    return int(result.stdout.strip())
+
+
+async def measure(coro) -> dict:
+    """Temps mur et CPU des processus enfants pendant coro."""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    t0 = time.perf_counter()
+    await coro
+    wall = time.perf_counter() - t0
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return {"wall_s": round(wall, 2), "cpu_s": round(cpu, 2)}
+
+
+async def bench_duration(duration: int, workers: list[int], work: Path) -> dict:
+    source = work / f"source_{duration}.mp4"
+    run_ffmpeg(
+        ["-f", "lavfi", "-i", f"testsrc2=size=1920x1080:rate={FPS}:duration={duration}",
+         "-vf", "noise=alls=12:allf=t", "-c:v", "libx264", "-preset", "ultrafast", "-crf", "18",
+         "-pix_fmt", "yuv420p", str(source)],
+        desc=f"synthetic source {duration}s",
+    )
+    expected = count_frames(source)
+
+    single_out = work / f"single_{duration}.mp4"
+    single = await measure(run_ffmpeg_async(
+        ["-i", str(source), "-vf", VIDEO_FILTER, "-r", str(FPS), *CODEC_ARGS,
+         "-g", str(GOP), "-an", str(single_out)],
+        desc=f"single {duration}s",
+    ))
+    single["frames"] = count_frames(single_out)
+    single["size_mb"] = round(single_out.stat().st_size / 1e6, 1)
+
+    runs = []
+    for n in workers:
+        settings.ENCODE_WORKERS = n
+        out = work / f"chunked_{duration}_{n}.mp4"
+        stats = await measure(encode_chunked(
+            source, out, work, VIDEO_FILTER, CODEC_ARGS, FPS, GOP, duration, desc=f"bench {n} workers",
+        ))
+        stats.update({
+            "workers": n,
+            "frames": count_frames(out),
+            "size_mb": round(out.stat().st_size / 1e6, 1),
+            "speedup": round(single["wall_s"] / stats["wall_s"], 2),
+        })
+        runs.append(stats)
+        out.unlink()
+
+    source.unlink()
+    single_out.unlink()
+    return {"duration_s": duration, "source_frames": expected, "single": single, "chunked": runs}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", type=int, nargs="+", default=[120, 180, 300])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--chunk-seconds", type=float, default=settings.CHUNK_SECONDS)
+    parser.add_argument("--json", type=Path, default=None)
+    args = parser.parse_args()
+    settings.CHUNK_SECONDS = args.chunk_seconds
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration in args.durations:
+            results.append(await bench_duration(duration, args.workers, Path(tmp)))
+
+    print(f"{os.cpu_count()} cœurs, chunks de {args.chunk_seconds:g}s")
+    print(f"{'durée':>6} | {'mode':>10} {'wall':>8} {'cpu':>8} {'speedup':>8} {'frames':>7} {'Mo':>6}")
+    for r in results:
+        s = r["single"]
+        print(f"{r['duration_s']:>6} | {'single':>10} {s['wall_s']:>8} {s['cpu_s']:>8} {'1.0':>8} "
+              f"{s['frames']:>7} {s['size_mb']:>6}")
+        for c in r["chunked"]:
+            flag = "" if c["frames"] == s["frames"] else "  ≠ frames"
+            print(f"{'':>6} | {str(c['workers']) + ' workers':>10} {c['wall_s']:>8} {c['cpu_s']:>8} "
+                  f"{c['speedup']:>8} {c['frames']:>7} {c['size_mb']:>6}{flag}")
+    if args.json:
+        args.json.write_text(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
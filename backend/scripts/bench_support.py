@@ -0,0 +1,213 @@
+"""Outils partagés des benchmarks : médias synthétiques (lavfi) et stand-ins HTTP locaux.
+
+Le stand-in sert les médias générés (GET/HEAD avec Range), accepte les
+uploads Supabase Storage (POST /storage/v1/object/...) et collecte les
+webhooks (POST /webhook) : aucun service externe n'est nécessaire.
+"""
+
+import json
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+# Profils de taille : nombre de clips, résolution source, durées
+PROFILES: dict[str, dict] = {
+    "small": {"clips": 3, "width": 1280, "height": 720, "clip_seconds": 4, "segments": 0},
+    "medium": {"clips": 8, "width": 1920, "height": 1080, "clip_seconds": 6, "segments": 6},
+    "large": {"clips": 20, "width": 1920, "height": 1080, "clip_seconds": 8, "segments": 40},
+}
+
+
+def _lavfi(args: list[str], dest: Path) -> None:
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + args + [str(dest)]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg error (synthetic {dest.name}): {result.stderr.strip()}")
+
+
+def generate_media(profile: str, media_dir: Path) -> dict:
+    """Génère (si absents) les clips, la voix off et la musique du profil."""
+    p = PROFILES[profile]
+    folder = media_dir / profile
+    folder.mkdir(parents=True, exist_ok=True)
+
+    clips = []
+    for i in range(p["clips"]):
+        dest = folder / f"clip_{i:03d}.mp4"
+        if not dest.exists():
+            _lavfi(
+                ["-f", "lavfi", "-i", f"testsrc2=size={p['width']}x{p['height']}:rate=30:duration={p['clip_seconds']}",
+                 "-f", "lavfi", "-i", f"sine=frequency={300 + 20 * i}:duration={p['clip_seconds']}",
+                 "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+                 "-c:a", "aac", "-shortest", "-movflags", "+faststart"],
+                dest,
+            )
+        clips.append(dest.relative_to(media_dir).as_posix())
+
+    total = p["clips"] * p["clip_seconds"]
+    voiceover = folder / "voiceover.mp3"
+    if not voiceover.exists():
+        # Voix synthétique : porteuse modulée en tout-ou-rien pour déclencher le ducking
+        _lavfi(["-f", "lavfi", "-i", f"sine=frequency=220:duration={total}",
+                "-af", "volume='if(lt(mod(t,4),2),0.6,0)':eval=frame"], voiceover)
+    music = folder / "music.mp3"
+    if not music.exists():
+        _lavfi(["-f", "lavfi", "-i", f"sine=frequency=440:duration={total / 2}",
+                "-af", "volume=0.5"], music)
+
+    return {
+        "clips": clips,
+        "voiceover": voiceover.relative_to(media_dir).as_posix(),
+        "music": music.relative_to(media_dir).as_posix(),
+    }
+
+
+def build_request(profile: str, media: dict, base_url: str, webhook: bool = True) -> dict:
+    """Payload AssembleRequest pour le profil (durées cibles ≠ durées source)."""
+    p = PROFILES[profile]
+    target = p["clip_seconds"] * 0.9
+    payload = {
+        "hotel_id": f"bench-{profile}",
+        "voiceover_url": f"{base_url}/media/{media['voiceover']}",
+        "music_url": f"{base_url}/media/{media['music']}",
+        "clips": [
+            {"index": i, "video_url": f"{base_url}/media/{path}", "duree_secondes": target}
+            for i, path in enumerate(media["clips"])
+        ],
+    }
+    if p["segments"]:
+        slot = p["clips"] * target / p["segments"]
+        payload["voiceover_segments"] = [
+            {"in_seconds": round(i * slot, 3), "out_seconds": round(i * slot + slot * 0.8, 3),
+             "start_seconds": round(i * slot, 3)}
+            for i in range(p["segments"])
+        ]
+    if webhook:
+        payload["webhook_url"] = f"{base_url}/webhook"
+    return payload
+
+
+class StandInServer:
+    """Serveur HTTP local : médias, stockage Supabase et webhooks."""
+
+    def __init__(self, media_dir: Path, storage_dir: Path):
+        self.media_dir = media_dir
+        self.storage_dir = storage_dir
+        self.webhooks: list[dict] = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def webhook_for(self, job_id: str) -> dict | None:
+        with self._lock:
+            return next((w for w in self.webhooks if w.get("job_id") == job_id), None)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def _media_path(self) -> Path | None:
+                # La query string (jeton d'unicité du test de charge) ne change pas le fichier servi
+                url_path = urlsplit(self.path).path
+                if not url_path.startswith("/media/"):
+                    return None
+                path = (server.media_dir / url_path[len("/media/"):]).resolve()
+                if server.media_dir.resolve() not in path.parents or not path.is_file():
+                    return None
+                return path
+
+            def _serve(self, body: bool) -> None:
+                path = self._media_path()
+                if path is None:
+                    self.send_error(404)
+                    return
+                size = path.stat().st_size
+                start, end = 0, size - 1
+                range_header = self.headers.get("Range")
+                if range_header and range_header.startswith("bytes="):
+                    first, _, last = range_header[6:].partition("-")
+                    start = int(first) if first else max(0, size - int(last))
+                    end = min(int(last), size - 1) if first and last else end
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("Content-Type", "application/octet-stream")
+                self.end_headers()
+                if body:
+                    with open(path, "rb") as f:
+                        f.seek(start)
+                        remaining = end - start + 1
+                        while remaining > 0:
+                            chunk = f.read(min(remaining, 1 << 20))
+                            if not chunk:
+                                break
+                            self.wfile.write(chunk)
+                            remaining -= len(chunk)
+
+            def do_HEAD(self) -> None:
+                self._serve(body=False)
+
+            def do_GET(self) -> None:
+                self._serve(body=True)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                data = self.rfile.read(length)
+                if self.path.startswith("/storage/v1/object/"):
+                    # /storage/v1/object/<bucket>/<path>
+                    relative = self.path[len("/storage/v1/object/"):].split("/", 1)[-1]
+                    dest = server.storage_dir / relative
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    dest.write_bytes(data)
+                    reply = {"Key": relative}
+                elif self.path == "/webhook":
+                    with server._lock:
+                        server.webhooks.append(json.loads(data or b"{}"))
+                    reply = {"ok": True}
+                else:
+                    self.send_error(404)
+                    return
+                payload = json.dumps(reply).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+def probe_output(path: Path) -> dict:
+    """Durée et débit (kb/s) d'un fichier produit."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-show_entries", "format=duration,bit_rate",
+         "-of", "json", str(path)],
+        capture_output=True, text=True, timeout=30,
+    )
+    fmt = json.loads(result.stdout or "{}").get("format", {})
+    return {
+        "duration_s": round(float(fmt.get("duration", 0)), 3),
+        "bitrate_kbps": round(int(fmt.get("bit_rate", 0)) / 1000, 1),
+    }
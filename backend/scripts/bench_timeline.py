@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Benchmark de la compilation des segments voix off : graphe amix à N entrées vs stem linéaire.
+
+Génère une voix off synthétique (lavfi sine) puis, pour 5, 50 et 200 segments,
+mesure le temps mur, le CPU des processus FFmpeg et le pic RSS des deux approches.
+
+Usage : python scripts/bench_timeline.py [--duration 180] [--counts 5 50 200] [--json out.json]
+"""
+
+import argparse
+import json
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.schemas.assemble import VoiceoverSegment  # noqa: E402
+from app.services.ffmpeg import decode_pcm, run_ffmpeg  # noqa: E402
+from app.services.timeline import compile_timeline, render_stem  # noqa: E402
+
+SAMPLE_RATE = 44100
+
+
+def legacy_filter(segments: list[VoiceoverSegment], vo_input_idx: int = 0) -> str:
+    """Ancien graphe : une branche atrim/adelay par segment + amix à N entrées."""
+    parts = []
+    labels = []
+    for i, seg in enumerate(segments):
+        delay_ms = int(seg.start_seconds * 1000)
+        delay_part = f",adelay={delay_ms}|{delay_ms}" if delay_ms > 0 else ""
+        parts.append(
+            f"[{vo_input_idx}:a]atrim=start={seg.in_seconds}:end={seg.out_seconds},"
+            f"asetpts=PTS-STARTPTS{delay_part}[vo{i}]"
+        )
+        labels.append(f"[vo{i}]")
+    if len(segments) == 1:
+        return parts[0].replace("[vo0]", "[voice]")
+    parts.append(f"{''.join(labels)}amix=inputs={len(segments)}:duration=longest:dropout_transition=0[voice]")
+    return ";".join(parts)
+
+
+def make_segments(count: int, duration: float, seed: int = 42) -> list[VoiceoverSegment]:
+    """Segments aléatoires répartis sur la timeline, avec quelques chevauchements."""
+    rng = random.Random(seed)
+    slot = duration / count
+    segments = []
+    for i in range(count):
+        length = rng.uniform(0.4, 1.3) * slot
+        src = rng.uniform(0, max(0.0, duration - length))
+        segments.append(VoiceoverSegment(
+            in_seconds=round(src, 3),
+            out_seconds=round(src + length, 3),
+            start_seconds=round(i * slot, 3),
+        ))
+    return segments
+
+
+def measure(fn) -> dict:
+    """Exécute fn et retourne temps mur, CPU (self + enfants) et pic RSS enfants."""
+    before_self = resource.getrusage(resource.RUSAGE_SELF)
+    before_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    t0 = time.perf_counter()
+    fn()
+    wall = time.perf_counter() - t0
+    after_self = resource.getrusage(resource.RUSAGE_SELF)
+    after_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = sum(
+        (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        for before, after in ((before_self, after_self), (before_children, after_children))
+    )
+    return {
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu, 3),
+        "children_max_rss_mb": round(after_children.ru_maxrss / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=180.0)
+    parser.add_argument("--counts", type=int, nargs="+", default=[5, 50, 200])
+    parser.add_argument("--json", type=Path, default=None)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        voiceover = work / "voiceover.wav"
+        run_ffmpeg(
+            ["-f", "lavfi", "-i", f"sine=frequency=220:sample_rate={SAMPLE_RATE}:duration={args.duration}",
+             "-ac", "2", str(voiceover)],
+            desc="synthetic voiceover",
+        )
+
+        for count in args.counts:
+            segments = make_segments(count, args.duration)
+
+            script = work / f"legacy_{count}.txt"
+            script.write_text(legacy_filter(segments))
+            legacy_out = work / f"legacy_{count}.wav"
+            legacy = measure(lambda: run_ffmpeg(
+                ["-i", str(voiceover), "-filter_complex_script", str(script),
+                 "-map", "[voice]", "-ar", str(SAMPLE_RATE), str(legacy_out)],
+                desc=f"legacy amix {count}",
+            ))
+
+            def stem() -> None:
+                pcm = decode_pcm(voiceover, work / f"vo_{count}.pcm", SAMPLE_RATE)
+                spans = compile_timeline(segments, args.duration)
+                render_stem(pcm, spans, work / f"stem_{count}.wav", args.duration, SAMPLE_RATE)
+                pcm.unlink()
+
+            results.append({"segments": count, "legacy_amix": legacy, "stem": measure(stem)})
+
+    print(f"{'segments':>8} | {'amix wall':>9} {'amix cpu':>9} | {'stem wall':>9} {'stem cpu':>9}")
+    for r in results:
+        print(f"{r['segments']:>8} | {r['legacy_amix']['wall_s']:>9} {r['legacy_amix']['cpu_s']:>9} | "
+              f"{r['stem']['wall_s']:>9} {r['stem']['cpu_s']:>9}")
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
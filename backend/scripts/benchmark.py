@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Benchmark bout en bout reproductible du pipeline d'assemblage.
+
+Génère des médias synthétiques (lavfi testsrc2/sine), les sert depuis un
+stand-in HTTP local (médias + Supabase Storage + webhook), puis exécute
+chaque profil :
+  - direct : appel de assemble_video() ;
+  - api    : POST /api/v1/assemble → BackgroundTask → upload → webhook.
+
+Chaque exécution enregistre temps mur, CPU (process + FFmpeg), pic RSS,
+débit de sortie et le détail par étape, dans un JSON comparable à une
+référence (--baseline) pour détecter les régressions de débit.
+
+Usage :
+  python scripts/benchmark.py --profiles small medium --out bench.json
+  python scripts/benchmark.py --out new.json --baseline bench.json --tolerance 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_support import PROFILES, StandInServer, build_request, generate_media, probe_output  # noqa: E402
+
+# En dessous de ce delta (s), un écart n'est pas considéré comme une régression
+NOISE_FLOOR_S = 0.05
+
+
+async def run_direct(profile: str, payload: dict) -> dict:
+    from app.schemas.assemble import AssembleRequest
+    from app.services.assembler import assemble_video
+    from app.services.metrics import _cpu_seconds, lifetime_peak_rss_mb, pop_stages
+
+    job_id = f"bench-direct-{profile}"
+    work_dir = Path("tmp") / job_id
+    work_dir.mkdir(parents=True, exist_ok=True)
+    request = AssembleRequest.model_validate(payload)
+
+    cpu_before = _cpu_seconds()
+    t0 = time.perf_counter()
+    try:
+        output = (await assemble_video(job_id, request, work_dir)).output_path
+        wall = time.perf_counter() - t0
+        result = {
+            "wall_s": round(wall, 3),
+            "cpu_s": round(_cpu_seconds() - cpu_before, 3),
+            "lifetime_peak_rss_mb": lifetime_peak_rss_mb(),
+            "output": probe_output(output),
+            "stages": pop_stages(job_id),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+async def run_api(profile: str, payload: dict, server: StandInServer) -> dict:
+    import httpx
+
+    from app.main import app
+    from app.services.metrics import _cpu_seconds, lifetime_peak_rss_mb
+
+    cpu_before = _cpu_seconds()
+    t0 = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # ASGITransport attend la fin des BackgroundTasks avant de rendre la réponse
+            resp = await client.post("/api/v1/assemble", json=payload)
+            resp.raise_for_status()
+            job_id = resp.json()["job_id"]
+            status = (await client.get(f"/api/v1/jobs/{job_id}/status")).json()
+    wall = time.perf_counter() - t0
+
+    if status["status"] != "completed":
+        raise RuntimeError(f"Job {job_id} {status['status']}: {status.get('error_message')}")
+
+    webhook = server.webhook_for(job_id) or {}
+    output = server.storage_dir / "montages" / payload["hotel_id"] / f"hotel_{payload['hotel_id']}.mp4"
+    return {
+        "wall_s": round(wall, 3),
+        "cpu_s": round(_cpu_seconds() - cpu_before, 3),
+        "lifetime_peak_rss_mb": lifetime_peak_rss_mb(),
+        "output": probe_output(output),
+        "stages": webhook.get("stages", []),
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Liste des régressions (temps mur total ou par étape) par rapport à la référence."""
+    regressions = []
+    base_index = {(r["profile"], r["mode"]): r for r in baseline}
+    for run in results:
+        base = base_index.get((run["profile"], run["mode"]))
+        if not base:
+            continue
+        pairs = [("total", run["wall_s"], base["wall_s"])]
+        base_stages = {s["stage"]: s["wall_s"] for s in base.get("stages", [])}
+        pairs += [(s["stage"], s["wall_s"], base_stages[s["stage"]])
+                  for s in run.get("stages", []) if s["stage"] in base_stages]
+        for name, new, old in pairs:
+            if new > old * (1 + tolerance) and new - old > NOISE_FLOOR_S:
+                regressions.append(
+                    f"{run['profile']}/{run['mode']} {name}: {old:.2f}s → {new:.2f}s "
+                    f"(+{(new / old - 1) * 100 if old else float('inf'):.0f}%)"
+                )
+    return regressions
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark bout en bout du pipeline d'assemblage")
+    parser.add_argument("--profiles", nargs="+", default=["small", "medium"], choices=sorted(PROFILES))
+    parser.add_argument("--modes", nargs="+", default=["direct", "api"], choices=["direct", "api"])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--media-dir", type=Path, default=None,
+                        help="Dossier des médias synthétiques (réutilisés entre exécutions)")
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="Conserver le cache disque (enveloppes, loudness) entre exécutions")
+    parser.add_argument("--out", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    # Chemins résolus avant le chdir dans le dossier de travail temporaire
+    out = args.out.resolve() if args.out else None
+    baseline_path = args.baseline.resolve() if args.baseline else None
+    root = Path(tempfile.mkdtemp(prefix="bench_"))
+    media_dir = (args.media_dir or root / "media").resolve()
+    storage_dir = root / "storage"
+    cache_dir = root / "cache"
+
+    server = StandInServer(media_dir, storage_dir).start()
+    # La config est lue à l'import de app.* : l'environnement doit être prêt avant
+    os.environ.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{root / 'bench.db'}",
+        "CACHE_DIR": str(cache_dir),
+        "SUPABASE_URL": server.base_url,
+        "SUPABASE_SERVICE_KEY": "bench",
+        "API_KEY": "",
+    })
+    os.chdir(root)
+
+    results = []
+    try:
+        for profile in args.profiles:
+            media = generate_media(profile, media_dir)
+            payload = build_request(profile, media, server.base_url)
+            for mode in args.modes:
+                for run in range(args.repeat):
+                    if not args.warm_cache:
+                        shutil.rmtree(cache_dir, ignore_errors=True)
+                    print(f"→ {profile}/{mode} #{run + 1}...", flush=True)
+                    if mode == "direct":
+                        measured = await run_direct(profile, payload)
+                    else:
+                        measured = await run_api(profile, payload, server)
+                    results.append({"profile": profile, "mode": mode, "run": run + 1, **measured})
+    finally:
+        server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"\n{'profil':<8} {'mode':<7} {'mur (s)':>8} {'cpu (s)':>8} {'kb/s':>8}  étapes")
+    for r in results:
+        stages = " ".join(f"{s['stage']}={s['wall_s']:.2f}" for s in r["stages"])
+        print(f"{r['profile']:<8} {r['mode']:<7} {r['wall_s']:>8.2f} {r['cpu_s']:>8.2f} "
+              f"{r['output']['bitrate_kbps']:>8.0f}  {stages}")
+
+    report = {
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "cpus": os.cpu_count()},
+        "runs": results,
+    }
+    if out:
+        out.write_text(json.dumps(report, indent=2))
+
+    if baseline_path:
+        baseline = json.loads(baseline_path.read_text())["runs"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} régression(s) (> {args.tolerance:.0%}) :")
+            for line in regressions:
+                print(f"  ✗ {line}")
+            return 1
+        print(f"\nAucune régression par rapport à {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
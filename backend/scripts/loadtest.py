@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""Test de charge et d'endurance de l'API et du pipeline.
+
+Lance une instance locale (uvicorn dans un sous-process, base et cache
+temporaires) branchée sur le stand-in HTTP de bench_support (médias
+synthétiques, Supabase Storage, webhooks), puis rejoue un mélange de trafic :
+  - soumissions POST /assemble (profils tirés selon --mix, arrivées de Poisson
+    à --rate par seconde, ou toutes d'un coup avec --rate 0). Chaque soumission
+    est rendue à froid (voir cold_payload), sauf avec --warm qui rejoue le même
+    payload et mesure le chemin tout-en-cache ;
+  - suivi de chaque job par GET /status toutes les --poll-interval secondes,
+    abandonné après --job-timeout secondes (compté en échec) ;
+  - --sse abonnés GET /logs qui se réabonnent à un autre job toutes les
+    --sse-hold secondes (churn des abonnements, fuites de _subscribers).
+
+Rapporte les latences p50/p95/p99 par endpoint, le débit de jobs, l'attente
+en file (temps du job hors étapes mesurées : admission disque, dispatch) et
+le RSS du serveur au fil du temps. Chaque --threshold (ex. status.p99_ms<=200,
+jobs.throughput_per_min>=2, rss.growth_mb_per_hour<=50) fait échouer le run
+(code 1) s'il n'est pas tenu.
+
+Usage :
+  python scripts/loadtest.py --jobs 50 --rate 0 --sse 500
+  python scripts/loadtest.py --duration 7200 --rate 0.05 --sse 50 --out soak.json \\
+      --threshold rss.growth_mb_per_hour<=20 --threshold status.p99_ms<=250
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_support import PROFILES, StandInServer, build_request, generate_media  # noqa: E402
+
+TERMINAL = {"completed", "failed"}
+# Décalage par soumission des paramètres entrant dans les clés de cache (invisible au rendu)
+COLD_EPSILON = 1e-6
+THRESHOLD = re.compile(r"^([\w.]+)\s*(<=|>=)\s*([-\d.]+)$")
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Percentile par rang le plus proche (None si aucune mesure)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(values: list[float], unit: str, scale: float = 1.0) -> dict:
+    return {
+        "count": len(values),
+        **{f"p{q}_{unit}": round(v * scale, 1) if (v := percentile(values, q)) is not None else None
+           for q in (50, 95, 99)},
+        f"max_{unit}": round(max(values) * scale, 1) if values else None,
+    }
+
+
+def rss_mb(pid: int) -> float | None:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        return None
+    return None
+
+
+def growth_per_hour(samples: list[tuple[float, float]]) -> float | None:
+    """Pente (Mo/heure) de la régression linéaire du RSS sur le temps."""
+    if len(samples) < 2:
+        return None
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_r = sum(r for _, r in samples) / n
+    var = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not var:
+        return None
+    slope = sum((t - mean_t) * (r - mean_r) for t, r in samples) / var
+    return slope * 3600
+
+
+def cold_payload(payload: dict, n: int) -> dict:
+    """Variante de payload qu'aucun cache du serveur ne connaît encore (n = numéro de soumission).
+
+    Un jeton dans les URLs évite le cache des téléchargements ; les caches
+    suivants sont adressés par contenu, d'où un décalage infime de la durée
+    cible des clips (clips normalisés) et du release du ducking (piste audio).
+    """
+    token = f"load={n}"
+    payload = json.loads(json.dumps(payload))
+    for clip in payload["clips"]:
+        clip["video_url"] += f"?{token}"
+        clip["duree_secondes"] += n * COLD_EPSILON
+    for name in ("voiceover_url", "music_url"):
+        if payload.get(name):
+            payload[name] += f"?{token}"
+    audio = payload.setdefault("audio_config", {})
+    audio["sidechain_release"] = audio.get("sidechain_release", 1000) + n * COLD_EPSILON
+    return payload
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, payloads: dict[str, dict], mix: dict[str, float], args):
+        self.client = client
+        self.payloads = payloads
+        self.mix = mix
+        self.args = args
+        self.latencies: dict[str, list[float]] = {"submit": [], "status": [], "logs": []}
+        self.errors: dict[str, int] = {"submit": 0, "status": 0, "logs": 0}
+        self.jobs: dict[str, dict] = {}
+        self.sse_events = 0
+        self.submissions = 0
+        self.stopping = asyncio.Event()
+
+    async def timed(self, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+        t0 = time.perf_counter()
+        try:
+            resp = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[endpoint] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - t0)
+        if resp.status_code >= 400:
+            self.errors[endpoint] += 1
+            return None
+        return resp
+
+    async def job(self) -> None:
+        """Soumet un job puis le suit par /status jusqu'à son état final (ou --job-timeout)."""
+        profile = random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        self.submissions += 1
+        payload = self.payloads[profile]
+        if not self.args.warm:
+            payload = cold_payload(payload, self.submissions)
+        submitted = time.monotonic()
+        resp = await self.timed("submit", "POST", "/api/v1/assemble", json=payload)
+        if resp is None:
+            return
+        job_id = resp.json()["job_id"]
+        job = self.jobs[job_id] = {"profile": profile, "submitted": submitted, "status": "processing",
+                                   "queued_seen": False}
+        while job["status"] not in TERMINAL:
+            if time.monotonic() - submitted > self.args.job_timeout:
+                job["status"] = "timeout"
+                break
+            await asyncio.sleep(self.args.poll_interval)
+            resp = await self.timed("status", "GET", f"/api/v1/jobs/{job_id}/status")
+            if resp is not None:
+                job["status"] = resp.json()["status"]
+                job["queued_seen"] |= job["status"] == "queued"
+        job["finished"] = time.monotonic()
+
+    async def subscriber(self) -> None:
+        """Abonné SSE : reste --sse-hold secondes sur un job puis passe à un autre."""
+        while not self.stopping.is_set():
+            if not self.jobs:
+                await asyncio.sleep(0.2)
+                continue
+            job_id = random.choice(list(self.jobs))
+            t0 = time.perf_counter()
+            try:
+                async with self.client.stream("GET", f"/api/v1/jobs/{job_id}/logs") as resp:
+                    self.latencies["logs"].append(time.perf_counter() - t0)
+                    if resp.status_code >= 400:
+                        self.errors["logs"] += 1
+                        continue
+                    deadline = time.monotonic() + self.args.sse_hold * random.uniform(0.5, 1.5)
+                    lines = resp.aiter_lines()
+                    while time.monotonic() < deadline and not self.stopping.is_set():
+                        try:
+                            line = await asyncio.wait_for(lines.__anext__(), deadline - time.monotonic())
+                        except (asyncio.TimeoutError, StopAsyncIteration):
+                            break
+                        self.sse_events += line.startswith("data:")
+            except httpx.HTTPError:
+                self.errors["logs"] += 1
+
+    async def arrivals(self) -> None:
+        """Soumissions : toutes d'un coup (rate 0) ou arrivées de Poisson jusqu'à --jobs / --duration."""
+        tasks = []
+        end = time.monotonic() + self.args.duration if self.args.duration else None
+        submitted = 0
+        while (self.args.jobs is None or submitted < self.args.jobs) and (end is None or time.monotonic() < end):
+            tasks.append(asyncio.create_task(self.job()))
+            submitted += 1
+            if self.args.rate > 0:
+                await asyncio.sleep(random.expovariate(self.args.rate))
+        await asyncio.gather(*tasks)
+
+    def report(self, wall: float, rss: list[tuple[float, float]], stages: dict[str, float]) -> dict:
+        done = [j for j in self.jobs.values() if j["status"] in TERMINAL | {"timeout"}]
+        completed = [j for j in done if j["status"] == "completed"]
+        timed_out = sum(1 for j in done if j["status"] == "timeout")
+        e2e = [j["finished"] - j["submitted"] for j in done if j["status"] in TERMINAL]
+        waits = [max(0.0, j["finished"] - j["submitted"] - stages[job_id])
+                 for job_id, j in self.jobs.items() if job_id in stages and "finished" in j]
+        requests = sum(len(v) for v in self.latencies.values()) + sum(self.errors.values())
+        return {
+            "wall_s": round(wall, 1),
+            **{endpoint: {**summarize(values, "ms", 1000), "errors": self.errors[endpoint]}
+               for endpoint, values in self.latencies.items()},
+            "jobs": {
+                "submitted": len(self.jobs),
+                "completed": len(completed),
+                "failed": len(done) - len(completed),
+                "timed_out": timed_out,
+                "queued_seen": sum(1 for j in self.jobs.values() if j["queued_seen"]),
+                "throughput_per_min": round(len(completed) / wall * 60, 2) if wall else 0.0,
+                "error_rate": round((len(done) - len(completed)) / len(done), 3) if done else 0.0,
+            },
+            "e2e": summarize(e2e, "s"),
+            "queue_wait": summarize(waits, "s"),
+            "http": {"requests": requests, "errors": sum(self.errors.values())},
+            "sse": {"events": self.sse_events},
+            "rss": {
+                "start_mb": round(rss[0][1], 1) if rss else None,
+                "peak_mb": round(max(r for _, r in rss), 1) if rss else None,
+                "end_mb": round(rss[-1][1], 1) if rss else None,
+                "growth_mb_per_hour": round(g, 1) if (g := growth_per_hour(rss)) is not None else None,
+                "samples": [[round(t, 1), round(r, 1)] for t, r in rss],
+            },
+        }
+
+
+def check_thresholds(report: dict, thresholds: list[str]) -> list[str]:
+    """Seuils non tenus ; un seuil sur une métrique absente compte comme non tenu."""
+    failures = []
+    for spec in thresholds:
+        match = THRESHOLD.match(spec.replace(" ", ""))
+        if not match:
+            failures.append(f"{spec}: seuil illisible (attendu métrique<=valeur ou métrique>=valeur)")
+            continue
+        name, op, limit = match.group(1), match.group(2), float(match.group(3))
+        value = report
+        for part in name.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        if not isinstance(value, (int, float)):
+            failures.append(f"{name}: métrique absente")
+        elif (op == "<=" and value > limit) or (op == ">=" and value < limit):
+            failures.append(f"{name} = {value} (attendu {op} {limit:g})")
+    return failures
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in PROFILES:
+            raise SystemExit(f"Profil inconnu dans --mix : {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run(args, root: Path, server: StandInServer) -> tuple[dict, int]:
+    mix = parse_mix(args.mix)
+    media_dir = server.media_dir
+    payloads = {}
+    for profile in mix:
+        payload = build_request(profile, generate_media(profile, media_dir), server.base_url)
+        payload["hotel_id"] = f"load-{profile}"
+        payloads[profile] = payload
+
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(BACKEND_DIR),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{root / 'load.db'}",
+        "CACHE_DIR": str(root / "cache"),
+        "SUPABASE_URL": server.base_url,
+        "SUPABASE_SERVICE_KEY": "load",
+        "API_KEY": "",
+    }
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    limits = httpx.Limits(max_connections=args.sse + args.max_connections, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout,
+                                     limits=limits) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+            else:
+                raise RuntimeError("Le serveur n'a pas démarré")
+
+            test = LoadTest(client, payloads, mix, args)
+            rss: list[tuple[float, float]] = []
+            t0 = time.monotonic()
+
+            async def sample() -> None:
+                while not test.stopping.is_set():
+                    value = rss_mb(proc.pid)
+                    if value is not None:
+                        rss.append((time.monotonic() - t0, value))
+                    try:
+                        await asyncio.wait_for(test.stopping.wait(), args.sample_interval)
+                    except asyncio.TimeoutError:
+                        pass
+
+            sampler = asyncio.create_task(sample())
+            subscribers = [asyncio.create_task(test.subscriber()) for _ in range(args.sse)]
+            await test.arrivals()
+            wall = time.monotonic() - t0
+            test.stopping.set()
+            await asyncio.gather(sampler, *subscribers)
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        if args.server_log:
+            log.close()
+
+    # Temps passé dans les étapes mesurées, remonté par les webhooks
+    stages = {w["job_id"]: sum(s["wall_s"] for s in w.get("stages") or []) for w in server.webhooks}
+    report = test.report(wall, rss, stages)
+    failures = check_thresholds(report, args.threshold)
+    report["thresholds"] = {"checked": args.threshold, "failures": failures}
+    return report, 1 if failures else 0
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{'endpoint':<8} {'n':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'erreurs':>8}")
+    for endpoint in ("submit", "status", "logs"):
+        r = report[endpoint]
+        print(f"{endpoint:<8} {r['count']:>7} {r['p50_ms'] or '-':>8} {r['p95_ms'] or '-':>8} "
+              f"{r['p99_ms'] or '-':>8} {r['max_ms'] or '-':>8} {r['errors']:>8}")
+    jobs, e2e, wait, rss = report["jobs"], report["e2e"], report["queue_wait"], report["rss"]
+    print(f"\nJobs : {jobs['completed']}/{jobs['submitted']} réussis, {jobs['failed']} échecs "
+          f"(dont {jobs['timed_out']} hors délai), "
+          f"{jobs['throughput_per_min']} jobs/min, {jobs['queued_seen']} vus en file")
+    print(f"Bout en bout : p50 {e2e['p50_s']}s, p95 {e2e['p95_s']}s — "
+          f"attente hors étapes : p50 {wait['p50_s']}s, p95 {wait['p95_s']}s")
+    print(f"RSS serveur : {rss['start_mb']} → {rss['end_mb']} Mo (pic {rss['peak_mb']}), "
+          f"pente {rss['growth_mb_per_hour']} Mo/h — {report['sse']['events']} événements SSE reçus")
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=None, help="Nombre de soumissions (défaut : 20 sans --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="Durée du test en secondes (soak)")
+    parser.add_argument("--rate", type=float, default=0.5, help="Soumissions par seconde (0 = toutes d'un coup)")
+    parser.add_argument("--mix", default="small=4,medium=1", help="Profils et poids, ex. small=4,medium=1")
+    parser.add_argument("--sse", type=int, default=20, help="Abonnés SSE simultanés")
+    parser.add_argument("--sse-hold", type=float, default=30, help="Durée moyenne d'un abonnement (s)")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--job-timeout", type=float, default=1800,
+                        help="Délai max d'un job avant abandon, compté en échec (s)")
+    parser.add_argument("--warm", action="store_true",
+                        help="Rejouer le même payload par profil (caches chauds) au lieu de soumissions à froid")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="Période d'échantillonnage RSS (s)")
+    parser.add_argument("--max-connections", type=int, default=200, help="Connexions hors SSE")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--media-dir", type=Path, default=None,
+                        help="Dossier des médias synthétiques (réutilisés entre exécutions)")
+    parser.add_argument("--threshold", action="append", default=[], metavar="MÉTRIQUE<=VALEUR")
+    parser.add_argument("--server-log", type=Path, default=None, help="Sortie du serveur testé (défaut : ignorée)")
+    parser.add_argument("--out", type=Path, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.jobs is None and args.duration is None:
+        args.jobs = 20
+    if args.rate <= 0 and args.jobs is None:
+        parser.error("--rate 0 nécessite --jobs")
+    random.seed(args.seed)
+
+    out = args.out.resolve() if args.out else None
+    args.server_log = args.server_log.resolve() if args.server_log else None
+    root = Path(tempfile.mkdtemp(prefix="load_"))
+    media_dir = (args.media_dir or root / "media").resolve()
+    server = StandInServer(media_dir, root / "storage").start()
+    try:
+        report, code = await run(args, root, server)
+    finally:
+        server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+    print_report(report)
+    if out:
+        out.write_text(json.dumps(report, indent=2))
+    failures = report["thresholds"]["failures"]
+    if failures:
+        print(f"\n{len(failures)} seuil(s) non tenu(s) :")
+        for line in failures:
+            print(f"  ✗ {line}")
+    elif args.threshold:
+        print(f"\n{len(args.threshold)} seuil(s) tenu(s)")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,46 @@
+"""Environnement isolé des tests : base SQLite et cache dans un dossier temporaire.
+
+Les variables sont posées avant tout import de app (settings est lu à l'import).
+"""
+
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_ROOT = Path(tempfile.mkdtemp(prefix="tests_"))
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_ROOT / 'test.db'}"
+os.environ["CACHE_DIR"] = str(_ROOT / "cache")
+os.environ["API_KEY"] = ""
+
+
+@pytest.fixture
+def run():
+    """Exécute une coroutine dans une boucle neuve, puis libère les connexions de cette boucle."""
+    from app.database import engine
+
+    def runner(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+
+    return runner
+
+
+@pytest.fixture
+def db(run):
+    """Base vide pour chaque test."""
+    from app.database import engine
+    from app.models.base import Base
+
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    run(reset())
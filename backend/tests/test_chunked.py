@@ -0,0 +1,44 @@
+import pytest
+
+from app.services.chunked import Chunk, plan_chunks
+
+
+@pytest.mark.parametrize(
+    "total, fps, gop, seconds",
+    [(60, 30, 60, 10), (61.7, 25, 50, 8), (125, 30, 48, 30), (3, 24, 48, 60)],
+)
+def test_chunks_cover_every_frame_on_gop_boundaries(total, fps, gop, seconds):
+    chunks = plan_chunks(total, fps, gop, seconds)
+    assert [c.index for c in chunks] == list(range(len(chunks)))
+    assert sum(c.frames for c in chunks) == round(total * fps)
+    position = 0
+    for chunk in chunks:
+        assert chunk.start_frame == position
+        assert chunk.start_frame % gop == 0
+        position += chunk.frames
+
+
+def test_chunk_length_is_rounded_to_whole_gops():
+    # 10 s à 30 fps = 300 frames, arrondi à 4 GOP de 72 frames = 288
+    chunks = plan_chunks(60, 30, 72, 10)
+    assert chunks[0] == Chunk(0, 0, 288)
+
+
+def test_short_tail_is_merged_into_previous_chunk():
+    # 610 frames : 2 chunks de 300 + 10 frames (< 1 GOP) rattachées au second
+    chunks = plan_chunks(610 / 30, 30, 60, 10)
+    assert chunks == [Chunk(0, 0, 300), Chunk(1, 300, 310)]
+
+
+def test_tail_of_a_full_gop_stays_separate():
+    chunks = plan_chunks(660 / 30, 30, 60, 10)
+    assert chunks[-1] == Chunk(2, 600, 60)
+
+
+def test_short_input_is_a_single_chunk():
+    assert plan_chunks(0.5, 30, 60, 10) == [Chunk(0, 0, 15)]
+
+
+def test_chunk_is_never_shorter_than_one_gop():
+    chunks = plan_chunks(10, 30, 60, 0.1)
+    assert chunks[0].frames == 60
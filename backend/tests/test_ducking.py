@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from app.schemas.assemble import AudioConfig
+from app.services.ducking import HOP_MS, SLEW_DB, compute_envelope
+
+AC = AudioConfig(sidechain_threshold=0.01, sidechain_ratio=4, sidechain_attack=50, sidechain_release=200)
+ATTACK_STEP = SLEW_DB * HOP_MS / AC.sidechain_attack
+RELEASE_STEP = SLEW_DB * HOP_MS / AC.sidechain_release
+# Voix à +40 dB au-dessus du seuil : réduction cible 40 * (1 - 1/4) = 30 dB
+LOUD = 1.0
+TARGET_DB = 40.0 * (1 - 1 / AC.sidechain_ratio)
+
+
+def reduction_db(envelope: np.ndarray) -> np.ndarray:
+    return -20.0 * np.log10(envelope.astype(np.float64))
+
+
+def test_silence_below_threshold_keeps_full_gain():
+    envelope = compute_envelope(np.full(100, 0.005), AC)
+    assert envelope.dtype == np.float32
+    np.testing.assert_allclose(envelope, 1.0)
+
+
+def test_attack_limits_how_fast_the_reduction_rises():
+    reduction = reduction_db(compute_envelope(np.full(100, LOUD), AC))
+    # Première trame déjà limitée (état initial sans réduction)
+    assert reduction[0] == pytest.approx(ATTACK_STEP, rel=1e-4)
+    assert np.all(np.diff(reduction) <= ATTACK_STEP + 1e-4)
+
+
+def test_reduction_settles_on_the_compressor_curve():
+    reduction = reduction_db(compute_envelope(np.full(100, LOUD), AC))
+    assert reduction[-1] == pytest.approx(TARGET_DB, rel=1e-4)
+
+
+def test_release_limits_how_fast_the_reduction_falls():
+    levels = np.concatenate([np.full(50, LOUD), np.zeros(200)])
+    reduction = reduction_db(compute_envelope(levels, AC))
+    assert np.all(-np.diff(reduction) <= RELEASE_STEP + 1e-4)
+    # Juste après la voix, la musique n'est remontée que d'un pas de release
+    assert reduction[50] == pytest.approx(TARGET_DB - RELEASE_STEP, rel=1e-4)
+    np.testing.assert_allclose(reduction[-1], 0.0, atol=1e-4)
+
+
+def test_short_burst_is_not_fully_ducked():
+    levels = np.zeros(50)
+    levels[10] = LOUD
+    reduction = reduction_db(compute_envelope(levels, AC))
+    assert reduction.max() == pytest.approx(ATTACK_STEP, rel=1e-4)
+
+
+def test_attack_and_release_are_floored_at_one_hop():
+    ac = AC.model_copy(update={"sidechain_attack": 0, "sidechain_release": 0})
+    levels = np.concatenate([np.full(5, LOUD), np.zeros(5)])
+    reduction = reduction_db(compute_envelope(levels, ac))
+    assert np.all(np.abs(np.diff(reduction)) <= SLEW_DB + 1e-4)
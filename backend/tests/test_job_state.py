@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.database import async_session
+from app.models.job import Job
+from app.services import job_state
+from app.services.job_state import JobState, JobStateCache, job_states
+
+
+class FakeSession:
+    """Session minimale : compte les écritures, commit lent ou en échec à la demande."""
+
+    def __init__(self, log: list, commit_delay: float = 0, fail: bool = False):
+        self.log = log
+        self.commit_delay = commit_delay
+        self.fail = fail
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.log.append("execute")
+
+    async def commit(self):
+        self.log.append("commit started")
+        await asyncio.sleep(self.commit_delay)
+        if self.fail:
+            raise RuntimeError("database is locked")
+        self.log.append("commit")
+
+
+async def insert_job(job_id: str, **fields) -> None:
+    async with async_session() as db:
+        db.add(Job(id=job_id, **fields))
+        await db.commit()
+
+
+async def load_job(job_id: str) -> Job:
+    async with async_session() as db:
+        return (await db.execute(select(Job).where(Job.id == job_id))).scalar_one()
+
+
+def test_reload_from_db_sees_pending_changes(db, run):
+    async def scenario():
+        await insert_job("a", status="processing")
+        cache = JobStateCache(max_entries=10, flush_seconds=60)
+        cache.update("a", status="completed", output_url="https://cdn/a.mp4")
+        state = await cache.get("a")
+        assert (state.status, state.output_url) == ("completed", "https://cdn/a.mp4")
+        assert (await load_job("a")).status == "processing"
+        await cache.close()
+        return await load_job("a")
+
+    job = run(scenario())
+    assert (job.status, job.output_url) == ("completed", "https://cdn/a.mp4")
+
+
+def test_unknown_job_is_none(db, run):
+    assert run(JobStateCache(10, 60).get("missing")) is None
+
+
+def test_eviction_skips_jobs_with_pending_writes(monkeypatch, run):
+    log = []
+    monkeypatch.setattr(job_state, "async_session", lambda: FakeSession(log))
+
+    async def scenario():
+        cache = JobStateCache(max_entries=2, flush_seconds=60)
+        cache.put(JobState("a"))
+        cache.update("a", status="completed")
+        cache.put(JobState("b"))
+        cache.put(JobState("c"))
+        # a est le plus ancien mais pas encore écrit : b part à sa place
+        assert [cache.peek(j) is not None for j in "abc"] == [True, False, True]
+
+        await cache.flush()
+        cache.put(JobState("d"))
+        assert [cache.peek(j) is not None for j in "acd"] == [False, True, True]
+        await cache.close()
+
+    run(scenario())
+
+
+def test_get_refreshes_lru_order(run):
+    async def scenario():
+        cache = JobStateCache(max_entries=2, flush_seconds=60)
+        cache.put(JobState("a"))
+        cache.put(JobState("b"))
+        await cache.get("a")
+        cache.put(JobState("c"))
+        return [cache.peek(j) is not None for j in "abc"]
+
+    assert run(scenario()) == [True, False, True]
+
+
+def test_close_waits_for_a_commit_in_progress(monkeypatch, run):
+    log = []
+    monkeypatch.setattr(job_state, "async_session", lambda: FakeSession(log, commit_delay=0.05))
+
+    async def scenario():
+        cache = JobStateCache(max_entries=10, flush_seconds=0)
+        cache.update("a", status="completed")
+        while "commit started" not in log:
+            await asyncio.sleep(0)
+        await cache.close()
+        return cache
+
+    cache = run(scenario())
+    assert log == ["execute", "commit started", "commit"]
+    assert cache._pending == {}
+
+
+def test_failed_flush_keeps_changes_pending(monkeypatch, run):
+    log = []
+    session = FakeSession(log, fail=True)
+    monkeypatch.setattr(job_state, "async_session", lambda: session)
+
+    async def scenario():
+        cache = JobStateCache(max_entries=10, flush_seconds=60)
+        cache.update("a", status="processing")
+        await cache.flush()
+        cache.update("a", output_url="https://cdn/a.mp4")
+        assert cache._pending["a"]["status"] == "processing"
+        assert cache._pending["a"]["output_url"] == "https://cdn/a.mp4"
+
+        session.fail = False
+        await cache.close()
+        return cache
+
+    cache = run(scenario())
+    assert log[-1] == "commit"
+    assert cache._pending == {}
+
+
+@pytest.fixture
+def client():
+    from app.main import app
+
+    state = job_states.put(JobState("etag-job", status="processing"))
+    # Sans « with » : pas de lifespan, le statut est servi depuis la mémoire
+    yield TestClient(app), state
+    job_states._states.pop("etag-job", None)
+
+
+def test_status_returns_304_until_the_job_changes(client):
+    http, state = client
+    url = "/api/v1/jobs/etag-job/status"
+
+    first = http.get(url)
+    assert first.status_code == 200
+    assert first.json()["status"] == "processing"
+    etag = first.headers["etag"]
+
+    cached = http.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert cached.content == b""
+
+    state.apply({"stage": "render"})
+    changed = http.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["stage"] == "render"
+    assert changed.headers["etag"] != etag
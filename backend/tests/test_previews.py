@@ -0,0 +1,47 @@
+from app.schemas.assemble import PreviewConfig, VideoConfig
+from app.services.previews import plan_previews
+
+VC = VideoConfig(width=1920, height=1080, fps=30)
+
+
+def test_thumbnails_sit_at_the_centre_of_equal_intervals():
+    plan = plan_previews(PreviewConfig(thumbnails=4), 8.0, VC)
+    # Intervalles de 2 s, centres à 1, 3, 5, 7 s
+    assert plan.frames == [30, 90, 150, 210]
+
+
+def test_frames_are_clamped_to_the_last_frame():
+    plan = plan_previews(PreviewConfig(thumbnails=1, poster_seconds=60), 2.0, VC)
+    assert plan.poster_frame == 59
+    assert max(plan.frames) <= 59
+
+
+def test_duplicate_frames_are_dropped_for_very_short_videos():
+    plan = plan_previews(PreviewConfig(thumbnails=10), 0.1, VC)
+    assert plan.frames == sorted(set(plan.frames))
+    assert len(plan.frames) == 3
+
+
+def test_default_poster_is_one_second_or_mid_video():
+    assert plan_previews(PreviewConfig(), 10.0, VC).poster_frame == 30
+    assert plan_previews(PreviewConfig(), 1.0, VC).poster_frame == 15
+
+
+def test_explicit_poster_time_is_used():
+    plan = plan_previews(PreviewConfig(poster_seconds=4.5), 10.0, VC)
+    assert plan.poster_frame == 135
+
+
+def test_thumbnail_height_keeps_ratio_and_is_even():
+    plan = plan_previews(PreviewConfig(thumbnail_width=100), 10.0, VC)
+    assert plan.thumb_width == 100
+    assert plan.thumb_height == 56
+    vertical = plan_previews(PreviewConfig(thumbnail_width=16), 10.0, VideoConfig(width=1080, height=1920))
+    assert vertical.thumb_height % 2 == 0
+
+
+def test_sprite_grid_fits_every_thumbnail():
+    plan = plan_previews(PreviewConfig(thumbnails=12, sprite_columns=5), 60.0, VC)
+    assert (plan.columns, plan.rows) == (5, 3)
+    few = plan_previews(PreviewConfig(thumbnails=3, sprite_columns=5), 60.0, VC)
+    assert (few.columns, few.rows) == (3, 1)
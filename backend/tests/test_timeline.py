@@ -0,0 +1,70 @@
+import wave
+
+import pytest
+
+from app.schemas.assemble import VoiceoverSegment
+from app.services.timeline import TimelineSpan, compile_timeline, render_stem
+
+
+def seg(in_s: float, out_s: float, start: float) -> VoiceoverSegment:
+    return VoiceoverSegment(in_seconds=in_s, out_seconds=out_s, start_seconds=start)
+
+
+def test_segments_are_sorted_by_timeline_position():
+    spans = compile_timeline([seg(10, 12, 5), seg(0, 2, 0)])
+    assert spans == [TimelineSpan(0, 2, 0), TimelineSpan(10, 12, 5)]
+
+
+def test_empty_segments_are_dropped():
+    assert compile_timeline([seg(3, 3, 0), seg(4, 2, 1)]) == []
+
+
+def test_segments_past_the_video_are_dropped_and_overflow_is_trimmed():
+    spans = compile_timeline([seg(0, 4, 8), seg(0, 2, 12)], total_duration=10)
+    assert spans == [TimelineSpan(0, 2, 8)]
+
+
+def test_overlap_cuts_the_previous_segment():
+    spans = compile_timeline([seg(0, 5, 0), seg(20, 22, 3)])
+    assert spans == [TimelineSpan(0, 3, 0), TimelineSpan(20, 22, 3)]
+
+
+def test_fully_covered_segment_is_replaced():
+    spans = compile_timeline([seg(0, 5, 2), seg(20, 22, 2)])
+    assert spans == [TimelineSpan(20, 22, 2)]
+
+
+def test_contiguous_segments_are_merged():
+    spans = compile_timeline([seg(0, 2, 1), seg(2, 5, 3)])
+    assert spans == [TimelineSpan(0, 5, 1)]
+
+
+def test_segments_contiguous_in_timeline_only_stay_separate():
+    spans = compile_timeline([seg(0, 2, 1), seg(7, 9, 3)])
+    assert len(spans) == 2
+
+
+def test_render_stem_places_spans_with_silence(tmp_path):
+    rate, channels = 100, 1
+    # Source : échantillon i = i + 1 (jamais nul, pour distinguer du silence)
+    pcm = tmp_path / "vo.pcm"
+    pcm.write_bytes(b"".join((i + 1).to_bytes(2, "little", signed=True) for i in range(300)))
+
+    dest = render_stem(pcm, [TimelineSpan(1.0, 1.5, 0.5)], tmp_path / "stem.wav", 2.0, rate, channels)
+
+    with wave.open(str(dest)) as w:
+        assert w.getnframes() == 200
+        data = w.readframes(200)
+    samples = [int.from_bytes(data[i:i + 2], "little", signed=True) for i in range(0, len(data), 2)]
+    assert samples[:50] == [0] * 50
+    assert samples[50:100] == list(range(101, 151))
+    assert samples[100:] == [0] * 100
+
+
+@pytest.mark.parametrize("total", [0.3, 0.55])
+def test_render_stem_never_exceeds_total_duration(tmp_path, total):
+    pcm = tmp_path / "vo.pcm"
+    pcm.write_bytes(bytes(2 * 1000))
+    dest = render_stem(pcm, [TimelineSpan(0, 5, 0)], tmp_path / "stem.wav", total, 100, 1)
+    with wave.open(str(dest)) as w:
+        assert w.getnframes() == round(total * 100)